@@ -26,7 +26,7 @@ export async function processSessionJob(job: Job<SessionProcessingJob>) {
       .where(eq(collectionSessions.id, sessionId));
     
     // Call ML service (Modal.com)
-    const mlResult = await callMLService(sessionId, dataUrl);
+    const mlResult = await callMLService(job, sessionId, dataUrl);
     
     log.info({ mlResult }, 'ML processing complete');
     
@@ -77,10 +77,42 @@ export async function processSessionJob(job: Job<SessionProcessingJob>) {
   }
 }
 
+const ML_BASE_URL = 'https://citypulse-ml';
+const ML_POLL_INITIAL_MS = 5_000;
+const ML_POLL_MAX_MS = 30_000;
+const ML_JOB_TIMEOUT_MS = 40 * 60 * 1000;
+
+interface MLJob {
+  jobId: string;
+  sessionId: string;
+  status: 'queued' | 'running' | 'completed' | 'failed' | 'cancelled' | 'expired';
+  error?: string;
+  progress?: { done: number; total: number; progress: number };
+  results?: any;
+}
+
+async function mlRequest(endpoint: string, init?: RequestInit, query = ''): Promise<MLJob> {
+  const response = await fetch(`${ML_BASE_URL}--${endpoint}.modal.run${query}`, {
+    ...init,
+    headers: {
+      'Content-Type': 'application/json',
+      'Authorization': `Bearer ${env.MODAL_TOKEN}`,
+    },
+  });
+  
+  if (!response.ok) {
+    throw new Error(`ML service error: ${response.statusText}`);
+  }
+  
+  return response.json() as Promise<MLJob>;
+}
+
 /**
- * Call Modal.com ML service
+ * Call Modal.com ML service: submit the session as a job, then poll it.
+ * Submissions are deduplicated by session ID, so a retried BullMQ job
+ * picks up the job already running instead of processing the session twice.
  */
-async function callMLService(sessionId: string, dataUrl: string) {
+async function callMLService(job: Job<SessionProcessingJob>, sessionId: string, dataUrl: string) {
   if (!env.MODAL_TOKEN) {
     // Development fallback - simulate ML results
     logger.warn('ML service not configured, using mock results');
@@ -91,21 +123,37 @@ async function callMLService(sessionId: string, dataUrl: string) {
     };
   }
   
-  const response = await fetch('https://citypulse-ml--process-session.modal.run', {
+  const submitted = await mlRequest('submit-session-job', {
     method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      'Authorization': `Bearer ${env.MODAL_TOKEN}`,
-    },
-    body: JSON.stringify({
-      sessionId,
-      dataUrl,
-    }),
+    body: JSON.stringify({ sessionId, dataUrl }),
   });
   
-  if (!response.ok) {
-    throw new Error(`ML service error: ${response.statusText}`);
+  const deadline = Date.now() + ML_JOB_TIMEOUT_MS;
+  let delay = ML_POLL_INITIAL_MS;
+  let mlJob = submitted;
+  
+  while (mlJob.status === 'queued' || mlJob.status === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error(`ML job ${submitted.jobId} timed out`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    delay = Math.min(delay * 2, ML_POLL_MAX_MS);
+    
+    mlJob = await mlRequest('session-job-status', undefined, `?job_id=${encodeURIComponent(submitted.jobId)}`);
+    if (mlJob.progress) {
+      await job.updateProgress(Math.round(mlJob.progress.progress * 100));
+    }
+  }
+  
+  // A submission deduplicated onto an already completed job (e.g. a retry
+  // after the DB update failed) comes back without results; fetch them
+  if (mlJob.status === 'completed' && !mlJob.results) {
+    mlJob = await mlRequest('session-job-status', undefined, `?job_id=${encodeURIComponent(submitted.jobId)}`);
+  }
+  
+  if (mlJob.status !== 'completed' || !mlJob.results) {
+    throw new Error(`ML job ${submitted.jobId} ${mlJob.status}: ${mlJob.error ?? 'no results'}`);
   }
   
-  return response.json();
+  return mlJob.results;
 }
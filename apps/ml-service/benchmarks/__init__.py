@@ -0,0 +1 @@
+# apps/ml-service/benchmarks/__init__.py
@@ -0,0 +1,148 @@
+# apps/ml-service/benchmarks/fixtures.py
+"""
+Benchmark Fixtures
+Deterministic synthetic images, videos and GPS tracks, plus optional on-disk fixtures.
+"""
+
+import math
+import os
+from pathlib import Path
+from typing import Any
+
+# Resolutions exercised by default: VGA, 1080p dashcam, 12 MP phone photo
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "1080p": (1920, 1080),
+    "12mp": (4000, 3000),
+}
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+
+def synthetic_image(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """
+    JPEG of a street-like scene: sky gradient, road, building blocks and
+    sign-like text, with sensor noise so JPEG sizes are realistic.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+
+    # Sky gradient (blue-ish, low saturation) over the top third
+    horizon = height // 3
+    ramp = np.linspace(230, 170, horizon, dtype=np.float32)[:, None]
+    img[:horizon, :, 0] = ramp.astype(np.uint8)
+    img[:horizon, :, 1] = (ramp * 0.85).astype(np.uint8)
+    img[:horizon, :, 2] = (ramp * 0.7).astype(np.uint8)
+
+    # Buildings
+    x = 0
+    while x < width:
+        w = int(rng.integers(width // 12, width // 5))
+        top = int(rng.integers(horizon // 2, horizon + height // 6))
+        color = tuple(int(c) for c in rng.integers(60, 200, 3))
+        cv2.rectangle(img, (x, top), (x + w, height * 2 // 3), color, -1)
+        x += w
+
+    # Road
+    img[height * 2 // 3:] = (70, 70, 70)
+    cv2.line(img, (width // 2, height * 2 // 3), (width // 2, height), (230, 230, 230), max(2, width // 200))
+
+    # Signs with text
+    scale = max(0.5, width / 1280)
+    for i in range(3):
+        sx = int(rng.integers(0, max(1, width - width // 4)))
+        sy = int(rng.integers(horizon, height // 2))
+        cv2.rectangle(img, (sx, sy), (sx + width // 5, sy + height // 18), (255, 255, 255), -1)
+        cv2.putText(img, f"SHOP {seed}{i}", (sx + 5, sy + height // 24), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 2)
+
+    noise = rng.normal(0, 6, img.shape).astype(np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def image_set(resolution: str, count: int) -> list[bytes]:
+    """`count` distinct synthetic JPEGs at a named resolution."""
+    width, height = RESOLUTIONS[resolution]
+    return [synthetic_image(width, height, seed=i) for i in range(count)]
+
+
+def fixture_images(limit: int | None = None) -> list[bytes]:
+    """Real JPEG/PNG fixtures from benchmarks/fixtures/images, if any are present."""
+    image_dir = FIXTURE_DIR / "images"
+    if not image_dir.is_dir():
+        return []
+    paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+    return [p.read_bytes() for p in paths[:limit]]
+
+
+def synthetic_video(path: str, width: int = 1280, height: int = 720, seconds: int = 10, fps: int = 30) -> str:
+    """
+    Write a synthetic dashcam-style MP4: the scene scrolls sideways to mimic
+    forward motion, with a stationary stretch in the middle (stuck in traffic).
+    """
+    import cv2
+    import numpy as np
+
+    base = cv2.imdecode(
+        np.frombuffer(synthetic_image(width * 2, height, seed=7), np.uint8),
+        cv2.IMREAD_COLOR,
+    )
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    total = seconds * fps
+    offset = 0
+    for frame_number in range(total):
+        stationary = total // 3 <= frame_number < 2 * total // 3
+        if not stationary:
+            offset = (offset + max(1, width // 100)) % width
+        writer.write(np.ascontiguousarray(base[:, offset:offset + width]))
+    writer.release()
+
+    return path
+
+
+def synthetic_track(
+    points: int,
+    start: tuple[float, float] = (14.5995, 120.9842),
+    speed_mps: float = 10.0,
+    interval_s: float = 1.0,
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """
+    GPS fixes for a drive that wanders and includes stops.
+
+    Returns:
+        List of dicts with lat, lon, timestamp_ms
+    """
+    import random
+
+    rng = random.Random(seed)
+    lat, lon = start
+    heading = rng.uniform(0, 360)
+    track = []
+
+    for i in range(points):
+        track.append({"lat": lat, "lon": lon, "timestamp_ms": int(i * interval_s * 1000)})
+
+        # Stop for a while every ~60 fixes
+        moving = (i // 30) % 2 == 0 or rng.random() < 0.1
+        distance = speed_mps * interval_s * (rng.uniform(0.6, 1.4) if moving else 0.0)
+        heading = (heading + rng.gauss(0, 8)) % 360
+
+        dlat = distance * math.cos(math.radians(heading)) / 111000
+        dlon = distance * math.sin(math.radians(heading)) / (111000 * math.cos(math.radians(lat)))
+        lat, lon = lat + dlat, lon + dlon
+
+    return track
+
+
+def temp_dir(name: str) -> str:
+    """Scratch directory under the benchmark output area."""
+    root = Path(os.environ.get("BENCH_TMP", "/tmp/citypulse-bench")) / name
+    root.mkdir(parents=True, exist_ok=True)
+    return str(root)
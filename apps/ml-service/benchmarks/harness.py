@@ -0,0 +1,199 @@
+# apps/ml-service/benchmarks/harness.py
+"""
+Benchmark Harness
+Timing, memory and allocation measurement plus baseline comparison.
+"""
+
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+
+class SkipBenchmark(Exception):
+    """Raised by a case whose optional dependency is unavailable."""
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc; falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Sample RSS in a background thread to find the peak during a run."""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "RssSampler":
+        self.baseline = self.peak = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, _current_rss_bytes())
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+
+
+def measure(
+    name: str,
+    fn: Callable[[], Any],
+    items_per_call: int = 1,
+    repeat: int = 5,
+    warmup: int = 1,
+    params: dict[str, Any] | None = None,
+    stages: Callable[[], dict[str, float]] | None = None,
+) -> dict[str, Any]:
+    """
+    Time `fn` and record memory behaviour.
+
+    Args:
+        name: Benchmark case name
+        fn: Zero-argument callable doing one unit of work
+        items_per_call: Frames/points processed per call, for throughput
+        repeat: Timed calls
+        warmup: Untimed calls first (model load, caches)
+        params: Case parameters recorded with the result
+        stages: Optional callable returning accumulated per-stage ms, reset per case
+
+    Returns:
+        Result dict with latency percentiles, throughput, peak RSS and allocations
+    """
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    latencies_ms = []
+    with RssSampler() as rss:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    # Allocation profile from one extra call; tracemalloc slows execution, so
+    # it is kept out of the timed runs
+    tracemalloc.start()
+    fn()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    alloc_blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    latencies_ms.sort()
+    mean_ms = statistics.fmean(latencies_ms)
+    result = {
+        "name": name,
+        "params": params or {},
+        "repeat": repeat,
+        "latencyMs": {
+            "mean": round(mean_ms, 3),
+            "p50": round(_percentile(latencies_ms, 50), 3),
+            "p95": round(_percentile(latencies_ms, 95), 3),
+            "min": round(latencies_ms[0], 3),
+        },
+        "itemsPerSecond": round(items_per_call / (mean_ms / 1000), 2) if mean_ms > 0 else None,
+        "peakRssMb": round(rss.peak / 2**20, 1),
+        "rssGrowthMb": round((rss.peak - rss.baseline) / 2**20, 1),
+        "allocPeakKb": round(alloc_peak / 1024, 1),
+        "allocBlocks": alloc_blocks,
+    }
+    if stages is not None:
+        result["stagesMs"] = {k: round(v / (repeat + warmup + 1), 3) for k, v in stages().items()}
+    return result
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def environment() -> dict[str, Any]:
+    """Machine description stored with every result file."""
+    info = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpuCount": os.cpu_count(),
+        "timestamp": int(time.time()),
+    }
+    for module in ("numpy", "cv2", "torch"):
+        mod = sys.modules.get(module)
+        if mod is not None:
+            info[module] = getattr(mod, "__version__", "unknown")
+    return info
+
+
+def result_key(result: dict[str, Any]) -> str:
+    """Stable identity of a case: name plus sorted params."""
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def compare(
+    results: list[dict[str, Any]],
+    baseline: dict[str, Any],
+    tolerance: float = 0.15,
+) -> list[dict[str, Any]]:
+    """
+    Compare p50 latency and peak RSS growth against a baseline report.
+
+    Returns:
+        One entry per case that exceeds the baseline by more than `tolerance`
+    """
+    baseline_by_key = {result_key(r): r for r in baseline.get("results", []) if "latencyMs" in r}
+    regressions = []
+
+    for result in results:
+        if "latencyMs" not in result:
+            continue
+        previous = baseline_by_key.get(result_key(result))
+        if previous is None:
+            continue
+
+        checks = [
+            ("latencyMs.p50", result["latencyMs"]["p50"], previous["latencyMs"]["p50"]),
+            ("rssGrowthMb", result["rssGrowthMb"], previous["rssGrowthMb"]),
+        ]
+        for metric, current, before in checks:
+            # Ignore noise on tiny values (sub-millisecond, sub-megabyte)
+            if before < 1.0 and current < 1.0:
+                continue
+            if current > before * (1 + tolerance):
+                regressions.append({
+                    "case": result_key(result),
+                    "metric": metric,
+                    "baseline": before,
+                    "current": current,
+                    "change": round(current / before - 1, 3) if before else None,
+                })
+
+    return regressions
+
+
+def write_report(path: str, results: list[dict[str, Any]], regressions: list[dict[str, Any]] | None = None) -> None:
+    report = {"environment": environment(), "results": results}
+    if regressions is not None:
+        report["regressions"] = regressions
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
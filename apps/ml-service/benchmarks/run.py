@@ -0,0 +1,119 @@
+# apps/ml-service/benchmarks/run.py
+"""
+Offline Benchmark Runner
+CPU-only, reproducible benchmarks for the ml-service models and utilities.
+
+Usage (from apps/ml-service):
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --quick --suites blur,geo --baseline benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+
+Model suites that need weights read them from local paths so nothing is
+downloaded: BENCH_YOLO_WEIGHTS, BENCH_RESNET_WEIGHTS, BENCH_OCR_MODELS.
+Suites whose dependencies are missing are recorded as skipped.
+Exits with status 1 when a case regresses past the tolerance.
+"""
+
+import argparse
+import json
+import os
+import sys
+import traceback
+from typing import Any
+
+
+def build_config(args: argparse.Namespace) -> dict[str, Any]:
+    if args.quick:
+        config = {
+            "resolutions": ["vga", "1080p"],
+            "batch_sizes": [1, 4],
+            "track_points": [1000],
+            "session_frames": 4,
+            "video_seconds": 5,
+            "repeat": 3,
+        }
+    else:
+        config = {
+            "resolutions": ["vga", "1080p", "12mp"],
+            "batch_sizes": [1, 4, 16],
+            "track_points": [1000, 10000],
+            "session_frames": 16,
+            "video_seconds": 20,
+            "repeat": 5,
+        }
+
+    if args.resolutions:
+        config["resolutions"] = args.resolutions.split(",")
+    if args.batch_sizes:
+        config["batch_sizes"] = [int(b) for b in args.batch_sizes.split(",")]
+    if args.repeat:
+        config["repeat"] = args.repeat
+    return config
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="CityPulse ML offline benchmarks")
+    parser.add_argument("--suites", help="Comma-separated suites (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Smaller grid for local iteration")
+    parser.add_argument("--resolutions", help="Comma-separated: vga,1080p,12mp,fixtures")
+    parser.add_argument("--batch-sizes", help="Comma-separated batch sizes")
+    parser.add_argument("--repeat", type=int, help="Timed repetitions per case")
+    parser.add_argument("--output", default="bench_results.json", help="Result JSON path")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before failing (0.15 = 15%%)")
+    parser.add_argument("--save-baseline", help="Also write results to this path as the new baseline")
+    args = parser.parse_args(argv)
+
+    # Benchmarks are CPU-only so numbers are comparable across machines and CI
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+    from benchmarks.harness import compare, write_report
+    from benchmarks.suites import SUITES
+
+    selected = args.suites.split(",") if args.suites else list(SUITES)
+    unknown = [s for s in selected if s not in SUITES]
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(unknown)} (available: {', '.join(SUITES)})")
+
+    config = build_config(args)
+    results: list[dict[str, Any]] = []
+
+    for suite in selected:
+        print(f"[bench] {suite}", file=sys.stderr)
+        try:
+            suite_results = SUITES[suite](config)
+        except ImportError as e:
+            suite_results = [{"name": suite, "params": {}, "skipped": f"missing dependency: {e.name}"}]
+        except Exception as e:
+            traceback.print_exc()
+            suite_results = [{"name": suite, "params": {}, "error": str(e)}]
+
+        for result in suite_results:
+            if "latencyMs" in result:
+                print(
+                    f"  {result['name']} {result['params']}: "
+                    f"p50={result['latencyMs']['p50']}ms "
+                    f"rate={result['itemsPerSecond']}/s "
+                    f"rss={result['peakRssMb']}MB",
+                    file=sys.stderr,
+                )
+            else:
+                print(f"  {result['name']}: {result.get('skipped') or result.get('error')}", file=sys.stderr)
+        results.extend(suite_results)
+
+    regressions = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"[regression] {r['case']} {r['metric']}: {r['baseline']} -> {r['current']}", file=sys.stderr)
+
+    write_report(args.output, results, regressions)
+    if args.save_baseline:
+        write_report(args.save_baseline, results)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# apps/ml-service/benchmarks/suites.py
+"""
+Benchmark Suites
+One function per model/utility; each returns a list of measured or skipped cases.
+"""
+
+import os
+import shutil
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+from benchmarks import fixtures
+from benchmarks.harness import SkipBenchmark, measure
+
+
+def _skipped(name: str, reason: str) -> dict[str, Any]:
+    return {"name": name, "params": {}, "skipped": reason}
+
+
+def _images(config: dict[str, Any], resolution: str, count: int) -> list[bytes]:
+    if resolution == "fixtures":
+        images = fixtures.fixture_images(count)
+        if not images:
+            raise SkipBenchmark("no images in benchmarks/fixtures/images")
+        return images
+    return fixtures.image_set(resolution, count)
+
+
+def _image_grid(
+    name: str,
+    config: dict[str, Any],
+    batch_fn: Callable[[list[bytes]], Any],
+) -> list[dict[str, Any]]:
+    """Measure a batch function across every configured resolution and batch size."""
+    results = []
+    for resolution in config["resolutions"]:
+        for batch_size in config["batch_sizes"]:
+            try:
+                images = _images(config, resolution, batch_size)
+            except SkipBenchmark as e:
+                results.append(_skipped(name, str(e)))
+                continue
+            results.append(measure(
+                name,
+                lambda: batch_fn(images),
+                items_per_call=len(images),
+                repeat=config["repeat"],
+                params={"resolution": resolution, "batchSize": batch_size},
+            ))
+    return results
+
+
+def blur_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    from models.blur import PrivacyBlurRuntime
+
+    runtime = PrivacyBlurRuntime()
+    return _image_grid("blur.blur_batch", config, runtime.blur_batch)
+
+
+def quality_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    from models.classifier import SceneClassifierRuntime
+
+    runtime = SceneClassifierRuntime()
+    return _image_grid(
+        "classifier.get_scene_quality",
+        config,
+        lambda images: [runtime.get_scene_quality(img) for img in images],
+    )
+
+
+def cpu_pool_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    """Blur and quality on the CPU worker pool, in both modes."""
+    from models.cpu_pool import CpuWorkerPool
+
+    results = []
+    for mode in ("process", "thread"):
+        pool = CpuWorkerPool(mode=mode)
+        try:
+            for operation in ("blur", "quality"):
+                results.extend(_image_grid(
+                    f"cpu_pool.{operation}[{mode}]",
+                    config,
+                    lambda images, operation=operation: pool.map(operation, images),
+                ))
+        finally:
+            pool.close()
+    return results
+
+
+def detector_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    weights = os.environ.get("BENCH_YOLO_WEIGHTS")
+    if not weights or not os.path.exists(weights):
+        return [_skipped("detector.detect_batch", "set BENCH_YOLO_WEIGHTS to a local yolov8n.pt")]
+    try:
+        import ultralytics  # noqa: F401
+    except ImportError:
+        return [_skipped("detector.detect_batch", "ultralytics not installed")]
+
+    from models.detector import DetectorRuntime
+
+    runtime = DetectorRuntime(weights_path=weights)
+    return _image_grid("detector.detect_batch", config, runtime.detect_batch)
+
+
+def classifier_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    weights = os.environ.get("BENCH_RESNET_WEIGHTS")
+    if not weights or not os.path.exists(weights):
+        return [_skipped("classifier.classify_batch", "set BENCH_RESNET_WEIGHTS to a local ResNet-50 state dict")]
+    try:
+        import torch  # noqa: F401
+        import torchvision  # noqa: F401
+    except ImportError:
+        return [_skipped("classifier.classify_batch", "torch/torchvision not installed")]
+
+    from models.classifier import SceneClassifierRuntime
+
+    runtime = SceneClassifierRuntime(weights_path=weights)
+    return _image_grid("classifier.classify_batch", config, runtime.classify_batch)
+
+
+def ocr_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    model_dir = os.environ.get("BENCH_OCR_MODELS")
+    if not model_dir or not os.path.isdir(model_dir):
+        return [_skipped("ocr.extract_batch", "set BENCH_OCR_MODELS to a local PaddleOCR model dir")]
+    try:
+        import paddleocr  # noqa: F401
+    except ImportError:
+        return [_skipped("ocr.extract_batch", "paddleocr not installed")]
+
+    from models.ocr import TextRecognizerRuntime
+
+    runtime = TextRecognizerRuntime(weights_path=model_dir, use_gpu=False)
+    runtime.WEIGHTS_PATH = model_dir
+    return _image_grid("ocr.extract_batch", config, runtime.extract_batch)
+
+
+def session_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    The process_session per-frame pipeline, run in-process with whichever
+    model runtimes are available, reporting time per stage.
+    """
+    from models.blur import PrivacyBlurRuntime
+    from models.classifier import SceneClassifierRuntime
+    from pipelines.progress import SessionAggregator
+
+    blur = PrivacyBlurRuntime()
+    quality_runtime = SceneClassifierRuntime()
+
+    detector = None
+    if os.environ.get("BENCH_YOLO_WEIGHTS"):
+        from models.detector import DetectorRuntime
+        detector = DetectorRuntime(weights_path=os.environ["BENCH_YOLO_WEIGHTS"])
+
+    classifier = None
+    if os.environ.get("BENCH_RESNET_WEIGHTS"):
+        classifier = SceneClassifierRuntime(weights_path=os.environ["BENCH_RESNET_WEIGHTS"])
+
+    stage_ms: dict[str, float] = defaultdict(float)
+
+    def timed(stage: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        value = fn()
+        stage_ms[stage] += (time.perf_counter() - start) * 1000
+        return value
+
+    def run_session(images: list[bytes]) -> None:
+        aggregator = SessionAggregator("bench", keep_records=False)
+        for i, image_bytes in enumerate(images):
+            blurred, pii = timed("blur", lambda: blur.blur_all_pii(image_bytes))
+            detections = timed("detect", lambda: detector.detect(blurred)) if detector else []
+            scene = timed("classify", lambda: classifier.classify(blurred)) if classifier else {"category": "unknown"}
+            quality = timed("quality", lambda: quality_runtime.get_scene_quality(blurred))
+            timed("aggregate", lambda: aggregator.add_frame(
+                {"index": i}, detections, [], scene, quality, pii,
+            ))
+
+    results = []
+    for resolution in config["resolutions"]:
+        frames = config["session_frames"]
+        try:
+            images = _images(config, resolution, frames)
+        except SkipBenchmark as e:
+            results.append(_skipped("session.frames", str(e)))
+            continue
+        stage_ms.clear()
+        results.append(measure(
+            "session.frames",
+            lambda: run_session(images),
+            items_per_call=len(images),
+            repeat=config["repeat"],
+            params={"resolution": resolution, "frames": frames},
+            stages=lambda: dict(stage_ms),
+        ))
+    return results
+
+
+def geo_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    import numpy as np
+
+    from utils.geo import GeoUtils
+    from utils.geofence import GeofenceIndex
+
+    results = []
+    for points in config["track_points"]:
+        track = fixtures.synthetic_track(points)
+        coords = [(p["lat"], p["lon"]) for p in track]
+
+        def distances() -> float:
+            return sum(
+                GeoUtils.haversine_distance(a[0], a[1], b[0], b[1])
+                for a, b in zip(coords, coords[1:])
+            )
+
+        def bearings() -> list[float]:
+            return [GeoUtils.bearing(a[0], a[1], b[0], b[1]) for a, b in zip(coords, coords[1:])]
+
+        def destinations() -> list[tuple[float, float]]:
+            return [GeoUtils.destination_point(lat, lon, 25.0, 90.0) for lat, lon in coords]
+
+        lats = np.array([c[0] for c in coords])
+        lons = np.array([c[1] for c in coords])
+
+        def destinations_array() -> tuple[Any, Any]:
+            return GeoUtils.destination_point_array(lats, lons, 25.0, 90.0)
+
+        # A zone around every 50th fix, as 32-gons
+        zones = GeofenceIndex()
+        angles = np.linspace(0, 360, 32, endpoint=False)
+        for i, (lat, lon) in enumerate(coords[::50]):
+            ring = GeoUtils.destination_point_array(lat, lon, 150.0, angles)
+            zones.add(f"zone-{i}", list(zip(*ring)))
+        zones.build()
+
+        for name, fn in (
+            ("geo.haversine_distance", distances),
+            ("geo.bearing", bearings),
+            ("geo.destination_point", destinations),
+            ("geo.destination_point_array", destinations_array),
+            ("geo.geofence_lookup", lambda: zones.lookup(lats, lons)),
+            ("geo.simplify_path", lambda: GeoUtils.simplify_path(coords, tolerance=10)),
+        ):
+            results.append(measure(name, fn, items_per_call=points, repeat=config["repeat"], params={"points": points}))
+    return results
+
+
+def video_suite(config: dict[str, Any]) -> list[dict[str, Any]]:
+    from utils.video import AdaptiveSampler, VideoProcessor
+
+    work_dir = fixtures.temp_dir("video")
+    video_path = fixtures.synthetic_video(os.path.join(work_dir, "dashcam.mp4"), seconds=config["video_seconds"])
+    frames_dir = fixtures.temp_dir("video/frames")
+    params = {"seconds": config["video_seconds"], "fps": 1.0}
+
+    results = [
+        measure(
+            "video.stream_frames",
+            lambda: sum(1 for _ in VideoProcessor.stream_frames(video_path, fps=1.0)),
+            items_per_call=config["video_seconds"],
+            repeat=config["repeat"],
+            params=params,
+        ),
+        measure(
+            "video.extract_frames_with_timestamps",
+            lambda: VideoProcessor.extract_frames_with_timestamps(video_path, frames_dir, fps=1.0),
+            items_per_call=config["video_seconds"],
+            repeat=config["repeat"],
+            params=params,
+        ),
+    ]
+
+    track = fixtures.synthetic_track(config["video_seconds"] + 1)
+    results.append(measure(
+        "video.stream_frames_adaptive",
+        lambda: sum(1 for _ in VideoProcessor.stream_frames_adaptive(
+            video_path, AdaptiveSampler(spacing_m=10.0, gps_track=track), candidate_fps=5.0,
+        )),
+        items_per_call=config["video_seconds"],
+        repeat=config["repeat"],
+        params={"seconds": config["video_seconds"], "spacingM": 10.0},
+    ))
+
+    if shutil.which("ffmpeg"):
+        results.append(measure(
+            "video.extract_frames",
+            lambda: VideoProcessor.extract_frames(video_path, frames_dir, fps=1.0),
+            items_per_call=config["video_seconds"],
+            repeat=config["repeat"],
+            params=params,
+        ))
+    else:
+        results.append(_skipped("video.extract_frames", "ffmpeg not on PATH"))
+
+    return results
+
+
+SUITES: dict[str, Callable[[dict[str, Any]], list[dict[str, Any]]]] = {
+    "blur": blur_suite,
+    "quality": quality_suite,
+    "cpu_pool": cpu_pool_suite,
+    "detector": detector_suite,
+    "classifier": classifier_suite,
+    "ocr": ocr_suite,
+    "session": session_suite,
+    "geo": geo_suite,
+    "video": video_suite,
+}
@@ -9,7 +9,7 @@ from typing import Any
 
 # Define the container image with all dependencies
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
-    "torch>=2.0",
+    "torch>=2.1",
     "torchvision",
     "ultralytics",
     "opencv-python-headless",
@@ -28,13 +28,22 @@ app = modal.App("citypulse-ml", image=image)
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
 
 
-# Import model classes
+# Import model classes. These modules only import modal: torch, ultralytics
+# and paddleocr are imported by each runtime the first time a model is used.
 from models.detector import Detector
 from models.blur import PrivacyBlur
 from models.ocr import TextRecognizer
 from models.classifier import SceneClassifier
+from models.cpu_pool import CpuInferenceWorker, CpuWorker
 from pipelines.process_session import process_session, process_session_endpoint
-from pipelines.process_frame import process_frame, process_frame_endpoint
+from pipelines.process_frame import process_frame, process_frame_endpoint, process_frame_batch
+from pipelines.process_video import process_video, process_video_endpoint
+from pipelines.timelapse import build_timelapse, build_timelapse_endpoint
+from pipelines.jobs import submit_session_job, session_job_status, cancel_session_job
+from pipelines.backfill import backfill_sessions
+from pipelines.similarity import find_similar_scenes
+from pipelines.gateway import InferenceGateway
+from pipelines.callbacks import deliver_callback
 
 
 # Re-export for Modal
@@ -42,8 +51,16 @@ app.cls(Detector)
 app.cls(PrivacyBlur)
 app.cls(TextRecognizer)
 app.cls(SceneClassifier)
+app.cls(CpuWorker)
+app.cls(CpuInferenceWorker)
+app.cls(InferenceGateway)
 app.function(process_session)
 app.function(process_frame)
+app.function(process_frame_batch)
+app.function(process_video)
+app.function(build_timelapse)
+app.function(backfill_sessions)
+app.function(deliver_callback)
 
 
 # Health check endpoint
@@ -1,7 +1,26 @@
 # apps/ml-service/models/__init__.py
-from .detector import Detector
-from .blur import PrivacyBlur
-from .ocr import TextRecognizer
-from .classifier import SceneClassifier
+from .detector import Detector, DetectorRuntime
+from .blur import PrivacyBlur, PrivacyBlurRuntime
+from .ocr import TextRecognizer, TextRecognizerRuntime
+from .classifier import SceneClassifier, SceneClassifierRuntime
+from .cpu_pool import CpuInferenceWorker, CpuWorker, CpuWorkerPool
+from .embeddings import EmbeddingStore, IvfPqIndex
+from .records import DetectionTable, FrameTable
 
-__all__ = ["Detector", "PrivacyBlur", "TextRecognizer", "SceneClassifier"]
+__all__ = [
+    "Detector",
+    "PrivacyBlur",
+    "TextRecognizer",
+    "SceneClassifier",
+    "DetectorRuntime",
+    "PrivacyBlurRuntime",
+    "TextRecognizerRuntime",
+    "SceneClassifierRuntime",
+    "CpuWorker",
+    "CpuInferenceWorker",
+    "CpuWorkerPool",
+    "DetectionTable",
+    "FrameTable",
+    "EmbeddingStore",
+    "IvfPqIndex",
+]
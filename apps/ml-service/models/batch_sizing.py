@@ -0,0 +1,232 @@
+# apps/ml-service/models/batch_sizing.py
+"""
+Adaptive Batch Sizing
+Learns the largest batch a model can run per input resolution, splits and
+retries batches that run out of memory, and sizes batches from measured
+memory per item on GPU (torch) or CPU (process RSS against the container
+limit).
+"""
+
+import gc
+import os
+import sys
+import threading
+from typing import Any, Callable, Hashable
+
+_OOM_MESSAGES = ("out of memory", "cublas_status_alloc_failed", "cudnn_status_alloc_failed", "failed to allocate")
+
+
+def is_oom(error: BaseException) -> bool:
+    """True for CUDA/torch out-of-memory errors and Python MemoryError."""
+    if isinstance(error, MemoryError) or type(error).__name__ == "OutOfMemoryError":
+        return True
+    return isinstance(error, RuntimeError) and any(m in str(error).lower() for m in _OOM_MESSAGES)
+
+
+def _torch_cuda() -> Any:
+    """torch, if it is already imported and has a GPU; never imports it."""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch
+    return None
+
+
+class GpuMemory:
+    """Peak CUDA memory per batch and free device memory."""
+
+    def start(self) -> int:
+        torch = _torch_cuda()
+        torch.cuda.reset_peak_memory_stats()
+        return torch.cuda.memory_allocated()
+
+    def peak_since(self, baseline: int) -> int:
+        return _torch_cuda().cuda.max_memory_allocated() - baseline
+
+    def available(self) -> int:
+        free, _ = _torch_cuda().cuda.mem_get_info()
+        return free
+
+    def release(self) -> None:
+        gc.collect()
+        _torch_cuda().cuda.empty_cache()
+
+
+class CpuMemory:
+    """
+    Process RSS growth per batch and memory left under the container limit
+    (cgroup memory.max, else MemAvailable). RSS is sampled after the batch,
+    so it undercounts transient peaks; OOM backoff covers the rest.
+    """
+
+    @staticmethod
+    def _rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _limit_left() -> int | None:
+        for limit_path, usage_path in (
+            ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+            ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+        ):
+            try:
+                with open(limit_path) as f:
+                    limit = f.read().strip()
+                if limit == "max" or int(limit) >= 1 << 60:
+                    continue
+                with open(usage_path) as f:
+                    return int(limit) - int(f.read().strip())
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def start(self) -> int:
+        return self._rss()
+
+    def peak_since(self, baseline: int) -> int:
+        return self._rss() - baseline
+
+    def available(self) -> int:
+        left = self._limit_left()
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        meminfo = int(line.split()[1]) * 1024
+                        return meminfo if left is None else min(left, meminfo)
+        except (OSError, ValueError):
+            pass
+        return left if left is not None else 0
+
+    def release(self) -> None:
+        gc.collect()
+
+
+class AdaptiveBatchSizer:
+    """
+    Runs batch functions in the largest chunks known to fit in memory.
+
+    Limits are learned per bucket (e.g. input resolution). A chunk that
+    raises out-of-memory is split in half and retried, and its size becomes
+    the bucket's ceiling; after `probe_after` clean batches at the limit, the
+    limit grows by half towards the ceiling. When memory per item has been
+    measured, the limit is also capped at what `memory_fraction` of the
+    currently available memory holds.
+
+    Usage:
+        sizer = AdaptiveBatchSizer("detector")
+        results = sizer.run(images, lambda chunk: model(chunk), bucket=640)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 8,
+        max_size: int = 64,
+        memory_fraction: float = 0.8,
+        probe_after: int = 20,
+        memory: GpuMemory | CpuMemory | None = None,
+    ):
+        self.name = name
+        self.initial = initial
+        self.max_size = max_size
+        self.memory_fraction = memory_fraction
+        self.probe_after = probe_after
+        self._memory = memory
+        self._limits: dict[Hashable, int] = {}
+        self._ceilings: dict[Hashable, int] = {}
+        self._per_item: dict[Hashable, float] = {}
+        self._clean: dict[Hashable, int] = {}
+        self.ooms = 0
+        self._lock = threading.Lock()
+
+    @property
+    def memory(self) -> GpuMemory | CpuMemory:
+        # Resolved on first use: torch is only imported once a model has loaded
+        if self._memory is None:
+            self._memory = GpuMemory() if _torch_cuda() is not None else CpuMemory()
+        return self._memory
+
+    def limit(self, bucket: Hashable = None) -> int:
+        """Current batch size for `bucket`."""
+        limit = self._limits.get(bucket, min(self.initial, self.max_size))
+        per_item = self._per_item.get(bucket)
+        if per_item:
+            fits = int(self.memory.available() * self.memory_fraction / per_item)
+            limit = min(limit, max(1, fits))
+        return limit
+
+    def run(
+        self,
+        items: list[Any],
+        fn: Callable[[list[Any]], list[Any]],
+        bucket: Hashable = None,
+    ) -> list[Any]:
+        """`fn` over `items` in memory-safe chunks; one output per item, in order."""
+        results: list[Any] = []
+        start = 0
+        while start < len(items):
+            size = self.limit(bucket)
+            results.extend(self._run_chunk(items[start:start + size], fn, bucket))
+            start += size
+        return results
+
+    def _run_chunk(self, chunk: list[Any], fn: Callable[[list[Any]], list[Any]], bucket: Hashable) -> list[Any]:
+        memory = self.memory
+        try:
+            baseline = memory.start()
+            output = list(fn(chunk))
+            used = memory.peak_since(baseline)
+        except Exception as e:
+            if not is_oom(e):
+                raise
+            memory.release()
+            with self._lock:
+                self.ooms += 1
+                self._ceilings[bucket] = min(self._ceilings.get(bucket, len(chunk)), len(chunk))
+                self._limits[bucket] = max(1, len(chunk) // 2)
+                self._clean[bucket] = 0
+            if len(chunk) == 1:
+                raise
+            print(f"{self.name}: out of memory at batch {len(chunk)} ({bucket}), retrying in halves")
+            half = len(chunk) // 2
+            return self._run_chunk(chunk[:half], fn, bucket) + self._run_chunk(chunk[half:], fn, bucket)
+
+        self._learn(bucket, len(chunk), used)
+        return output
+
+    def _learn(self, bucket: Hashable, size: int, used: int) -> None:
+        with self._lock:
+            if used > 0:
+                per_item = used / size
+                previous = self._per_item.get(bucket)
+                # Keep the larger (safer) estimate, decaying slowly
+                self._per_item[bucket] = per_item if previous is None else max(per_item, 0.9 * previous)
+
+            limit = self._limits.get(bucket, min(self.initial, self.max_size))
+            if size < limit:
+                return
+            self._clean[bucket] = self._clean.get(bucket, 0) + 1
+            if self._clean[bucket] >= self.probe_after:
+                self._clean[bucket] = 0
+                ceiling = min(self._ceilings.get(bucket, self.max_size + 1) - 1, self.max_size)
+                self._limits[bucket] = max(limit, min(ceiling, limit + max(1, limit // 2)))
+            else:
+                self._limits.setdefault(bucket, limit)
+
+    def stats(self) -> dict[str, Any]:
+        """Learned limit, ceiling and memory per item by bucket."""
+        return {
+            "ooms": self.ooms,
+            "buckets": {
+                str(bucket): {
+                    "limit": limit,
+                    "ceiling": self._ceilings.get(bucket),
+                    "bytesPerItem": int(self._per_item[bucket]) if bucket in self._per_item else None,
+                }
+                for bucket, limit in self._limits.items()
+            },
+        }
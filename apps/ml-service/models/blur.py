@@ -5,8 +5,12 @@ Ensures GDPR/privacy compliance by blurring identifiable information.
 """
 
 import modal
+import os
 from typing import Any
 
+from models.instrumentation import get_tracer, span
+from models.startup import LazyModel, lazy_import, warm_pool_size
+
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "torch>=2.0",
     "torchvision",
@@ -19,30 +23,38 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install(
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
 
 
-@modal.cls(gpu="T4", volumes={"/models": volume}, image=image)
-class PrivacyBlur:
-    """Detect and blur faces and license plates for privacy compliance."""
+class PrivacyBlurRuntime(LazyModel):
+    """In-process face/plate detection and blur. Cascades are loaded on first use."""
     
-    @modal.enter()
-    def load_models(self):
-        """Load face and plate detection models."""
-        import cv2
-        import os
-        
-        # OpenCV's Haar Cascade for faces (fast, good enough)
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        
-        # For license plates, use a simple cascade or YOLO
-        # We'll use the Russian plate cascade as a base (works for many formats)
-        plate_cascade_path = cv2.data.haarcascades + 'haarcascade_russian_plate_number.xml'
-        if os.path.exists(plate_cascade_path):
-            self.plate_cascade = cv2.CascadeClassifier(plate_cascade_path)
-        else:
-            self.plate_cascade = None
+    component = "blur"
+    
+    def _load(self) -> Any:
+        cv2 = lazy_import("cv2", self.profiler)
+        
+        with self.profiler.phase("load_cascades"):
+            # OpenCV's Haar Cascade for faces (fast, good enough)
+            face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+            
+            # For license plates, use a simple cascade or YOLO
+            # We'll use the Russian plate cascade as a base (works for many formats)
+            plate_cascade_path = cv2.data.haarcascades + 'haarcascade_russian_plate_number.xml'
+            if os.path.exists(plate_cascade_path):
+                plate_cascade = cv2.CascadeClassifier(plate_cascade_path)
+            else:
+                plate_cascade = None
+        
+        return face_cascade, plate_cascade
+    
+    @property
+    def face_cascade(self) -> Any:
+        return self.model[0]
+    
+    @property
+    def plate_cascade(self) -> Any:
+        return self.model[1]
     
-    @modal.method()
     def detect_faces(self, image_bytes: bytes) -> list[dict[str, Any]]:
         """Detect faces in image."""
         import cv2
@@ -68,7 +80,6 @@ class PrivacyBlur:
             for (x, y, w, h) in faces
         ]
     
-    @modal.method()
     def detect_plates(self, image_bytes: bytes) -> list[dict[str, Any]]:
         """Detect license plates in image."""
         import cv2
@@ -97,7 +108,6 @@ class PrivacyBlur:
             for (x, y, w, h) in plates
         ]
     
-    @modal.method()
     def blur_faces(self, image_bytes: bytes, blur_strength: int = 99) -> bytes:
         """Blur all faces in image."""
         import cv2
@@ -127,44 +137,108 @@ class PrivacyBlur:
         _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
         return buffer.tobytes()
     
-    @modal.method()
     def blur_all_pii(self, image_bytes: bytes, blur_strength: int = 99) -> tuple[bytes, dict[str, int]]:
         """
         Blur all PII (faces and plates) in image.
         
         Returns:
-            Tuple of (blurred_image_bytes, counts_dict)
+            Tuple of (blurred_image_bytes, counts_dict). When nothing was
+            found the input bytes are returned unchanged.
         """
         import cv2
         import numpy as np
         
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with span("blur.decode", bytes_in=len(image_bytes)):
+            nparr = np.frombuffer(image_bytes, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
             return image_bytes, {"faces": 0, "plates": 0}
         
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
-        
-        # Detect plates
-        plates = []
-        if self.plate_cascade is not None:
-            plates = self.plate_cascade.detectMultiScale(gray, 1.1, 3, minSize=(60, 20))
+        face_cascade, plate_cascade = self.model
+        with span("blur.detect"):
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            
+            # Detect faces
+            faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
+            
+            # Detect plates
+            plates = []
+            if plate_cascade is not None:
+                plates = plate_cascade.detectMultiScale(gray, 1.1, 3, minSize=(60, 20))
         
-        # Blur all regions
+        # Nothing to blur: hand back the original bytes (no re-encode)
         all_regions = list(faces) + list(plates)
-        for (x, y, w, h) in all_regions:
-            pad = int(w * 0.1)
-            x1, y1 = max(0, x - pad), max(0, y - pad)
-            x2, y2 = min(img.shape[1], x + w + pad), min(img.shape[0], y + h + pad)
-            
-            roi = img[y1:y2, x1:x2]
-            roi = cv2.GaussianBlur(roi, (blur_strength, blur_strength), 30)
-            img[y1:y2, x1:x2] = roi
+        if not all_regions:
+            return image_bytes, {"faces": 0, "plates": 0}
         
-        _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        # Blur all regions
+        with span("blur.apply", batch_size=len(all_regions)):
+            for (x, y, w, h) in all_regions:
+                pad = int(w * 0.1)
+                x1, y1 = max(0, x - pad), max(0, y - pad)
+                x2, y2 = min(img.shape[1], x + w + pad), min(img.shape[0], y + h + pad)
+                
+                roi = img[y1:y2, x1:x2]
+                roi = cv2.GaussianBlur(roi, (blur_strength, blur_strength), 30)
+                img[y1:y2, x1:x2] = roi
+        
+        with span("blur.encode") as encode_span:
+            _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            encode_span.bytes_out = buffer.nbytes
         
         return buffer.tobytes(), {"faces": len(faces), "plates": len(plates)}
+    
+    def blur_batch(self, images: list[bytes], blur_strength: int = 99) -> list[tuple[bytes, dict[str, int]]]:
+        """Blur all PII in a batch of images."""
+        return [self.blur_all_pii(img, blur_strength) for img in images]
+
+
+@modal.cls(
+    gpu="T4",
+    volumes={"/models": volume},
+    image=image,
+    keep_warm=warm_pool_size("blur"),
+)
+class PrivacyBlur:
+    """Detect and blur faces and license plates for privacy compliance."""
+    
+    @modal.enter()
+    def load_models(self):
+        """Prepare the runtime on container startup; cascades load on first use."""
+        self.runtime = PrivacyBlurRuntime()
+    
+    @modal.method()
+    def detect_faces(self, image_bytes: bytes) -> list[dict[str, Any]]:
+        """Detect faces in image."""
+        return self.runtime.detect_faces(image_bytes)
+    
+    @modal.method()
+    def detect_plates(self, image_bytes: bytes) -> list[dict[str, Any]]:
+        """Detect license plates in image."""
+        return self.runtime.detect_plates(image_bytes)
+    
+    @modal.method()
+    def blur_faces(self, image_bytes: bytes, blur_strength: int = 99) -> bytes:
+        """Blur all faces in image."""
+        return self.runtime.blur_faces(image_bytes, blur_strength)
+    
+    @modal.method()
+    def blur_all_pii(self, image_bytes: bytes, blur_strength: int = 99) -> tuple[bytes, dict[str, int]]:
+        """Blur all PII (faces and plates) in image."""
+        return self.runtime.blur_all_pii(image_bytes, blur_strength)
+    
+    @modal.method()
+    def blur_batch(self, images: list[bytes], blur_strength: int = 99) -> list[tuple[bytes, dict[str, int]]]:
+        """Blur all PII in a batch of images."""
+        return self.runtime.blur_batch(images, blur_strength)
+    
+    @modal.method()
+    def startup_report(self) -> dict[str, Any]:
+        """Per-phase startup timings for this container."""
+        return self.runtime.startup_report()
+    
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "blur", "version": self.runtime.version})
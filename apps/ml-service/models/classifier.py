@@ -5,11 +5,20 @@ Classifies street scenes into categories for mapping purposes.
 """
 
 import modal
+import os
+import tempfile
 from typing import Any
 
+from models.registry import load_state_dict_file
+from models.batch_sizing import AdaptiveBatchSizer
+from models.imaging import open_pil
+from models.instrumentation import get_tracer, span
+from models.startup import LazyModel, lazy_import, warm_pool_size
+
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
-    "torch>=2.0",
+    "torch>=2.1",
     "torchvision",
+    "safetensors",
     "opencv-python-headless",
     "numpy",
     "pillow",
@@ -18,9 +27,13 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install(
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
 
 
-@modal.cls(gpu="T4", volumes={"/models": volume}, image=image)
-class SceneClassifier:
-    """Classify street scenes into mapping-relevant categories."""
+class SceneClassifierRuntime(LazyModel):
+    """In-process ResNet-50 scene classifier. Weights are loaded on first use."""
+    
+    component = "classifier"
+    WEIGHTS_PATH = "/models/resnet50_imagenet1k_v2.pth"
+    # The transform resizes the short side to 256 before cropping
+    INPUT_SHORT_SIDE = 256
     
     # Scene categories relevant for CityPulse
     CATEGORIES = [
@@ -36,22 +49,53 @@ class SceneClassifier:
         "rural",
     ]
     
-    @modal.enter()
-    def load_model(self):
-        """Load pretrained ResNet for scene classification."""
-        import torch
-        import torchvision.models as models
-        import torchvision.transforms as transforms
-        import os
+    # ImageNet class mappings to our categories
+    CATEGORY_MAPPINGS = {
+        "residential": [627, 648, 649, 714, 715],  # homes, townhouse
+        "commercial": [462, 538, 580, 581],  # shop, store
+        "highway": [717, 718, 752],  # road, freeway
+        "park": [975, 976, 977, 978],  # green, nature
+    }
+    
+    def __init__(self, weights_path: str | None = None, **kwargs: Any):
+        super().__init__(weights_path, **kwargs)
+        self.category_mappings = self.CATEGORY_MAPPINGS
+        self._transform: Any = None
+        self._backbone: Any = None
+        self.batch_sizer = AdaptiveBatchSizer(self.component, initial=32)
+    
+    def _load(self) -> Any:
+        torch = lazy_import("torch", self.profiler)
+        models = lazy_import("torchvision.models", self.profiler)
+        transforms = lazy_import("torchvision.transforms", self.profiler)
         
-        # Use pretrained ResNet as feature extractor
-        self.model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V2)
-        self.model.eval()
+        weights_path = self._registered_weights()
+        if weights_path is None:
+            # Fresh volume: fetch from the torchvision hub once and register as safetensors
+            from safetensors.torch import save_file
+            
+            with self.profiler.phase("download_weights"):
+                state_dict = models.ResNet50_Weights.IMAGENET1K_V2.get_state_dict(progress=False)
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    tmp_path = os.path.join(tmp_dir, "resnet50_imagenet1k_v2.safetensors")
+                    save_file(state_dict, tmp_path)
+                    self.registry.register(self.component, tmp_path)
+            weights_path = self.registry.resolve(self.component)
+        
+        with self.profiler.phase("load_weights"):
+            # Built on the meta device so no parameters are allocated;
+            # assign=True adopts the loaded tensors instead of copying them
+            with torch.device("meta"):
+                model = models.resnet50(weights=None)
+            model.load_state_dict(load_state_dict_file(weights_path), assign=True)
+            self.weights_path = weights_path
+            model.eval()
         
         if torch.cuda.is_available():
-            self.model = self.model.cuda()
+            with self.profiler.phase("to_device"):
+                model = model.cuda()
         
-        self.transform = transforms.Compose([
+        self._transform = transforms.Compose([
             transforms.Resize(256),
             transforms.CenterCrop(224),
             transforms.ToTensor(),
@@ -61,15 +105,22 @@ class SceneClassifier:
             ),
         ])
         
-        # ImageNet class mappings to our categories
-        self.category_mappings = {
-            "residential": [627, 648, 649, 714, 715],  # homes, townhouse
-            "commercial": [462, 538, 580, 581],  # shop, store
-            "highway": [717, 718, 752],  # road, freeway
-            "park": [975, 976, 977, 978],  # green, nature
-        }
+        return model
+    
+    @property
+    def backbone(self) -> Any:
+        """The model up to the pooled penultimate layer (shares its modules)."""
+        if self._backbone is None:
+            import torch
+            self._backbone = torch.nn.Sequential(*list(self.model.children())[:-1])
+        return self._backbone
+    
+    @property
+    def transform(self) -> Any:
+        if self._transform is None:
+            _ = self.model  # loading the model builds the transform
+        return self._transform
     
-    @modal.method()
     def classify(self, image_bytes: bytes) -> dict[str, Any]:
         """
         Classify scene type.
@@ -77,22 +128,56 @@ class SceneClassifier:
         Returns:
             Dict with predicted category and confidence scores
         """
+        return self.classify_batch([image_bytes])[0]
+    
+    def classify_batch(self, images: list[bytes]) -> list[dict[str, Any]]:
+        """
+        Classify batch of images, one forward pass per chunk that fits in
+        memory. Inputs are all cropped to 224x224, so one limit is learned.
+        """
+        if not images:
+            return []
+        return self.batch_sizer.run(images, self._classify_chunk)
+    
+    def classify_embed_batch(self, images: list[bytes]) -> list[tuple[dict[str, Any], Any]]:
+        """
+        Classify a batch and keep each image's penultimate-layer embedding
+        (the 2048-d pooled features fed to the final layer) from the same
+        forward pass, as unit-length float16 (see models/embeddings.py).
+        """
+        if not images:
+            return []
+        return self.batch_sizer.run(images, lambda chunk: self._classify_chunk(chunk, embed=True))
+    
+    def _classify_chunk(self, images: list[bytes], embed: bool = False) -> list[Any]:
         import torch
-        from PIL import Image
-        import io
         
-        # Load and transform image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        input_tensor = self.transform(image).unsqueeze(0)
+        # Load and transform images
+        transform = self.transform
+        with span("classifier.preprocess", batch_size=len(images), bytes_in=sum(len(b) for b in images)):
+            input_tensor = torch.stack([
+                transform(open_pil(image_bytes, min_short_side=self.INPUT_SHORT_SIDE))
+                for image_bytes in images
+            ])
         
         if torch.cuda.is_available():
             input_tensor = input_tensor.cuda()
         
-        with torch.no_grad():
-            output = self.model(input_tensor)
-            probabilities = torch.nn.functional.softmax(output[0], dim=0)
+        model = self.model
+        with span("classifier.infer", batch_size=len(images)), torch.no_grad():
+            # Same forward pass as model(input), split before the last layer
+            features = self.backbone(input_tensor).flatten(1)
+            output = model.fc(features)
+            probabilities = torch.nn.functional.softmax(output, dim=1).cpu()
         
-        # Map ImageNet predictions to our categories
+        results = [self._scores_to_result(p) for p in probabilities]
+        if not embed:
+            return results
+        embeddings = torch.nn.functional.normalize(features, dim=1).half().cpu().numpy()
+        return list(zip(results, embeddings))
+    
+    def _scores_to_result(self, probabilities: Any) -> dict[str, Any]:
+        """Map ImageNet probabilities for one image to our categories."""
         category_scores = {}
         for category, class_ids in self.category_mappings.items():
             score = sum(float(probabilities[cid]) for cid in class_ids if cid < len(probabilities))
@@ -113,12 +198,6 @@ class SceneClassifier:
             "all_scores": category_scores,
         }
     
-    @modal.method()
-    def classify_batch(self, images: list[bytes]) -> list[dict[str, Any]]:
-        """Classify batch of images."""
-        return [self.classify(img) for img in images]
-    
-    @modal.method()
     def get_scene_quality(self, image_bytes: bytes) -> dict[str, float]:
         """
         Analyze image quality for mapping purposes.
@@ -129,34 +208,94 @@ class SceneClassifier:
         import cv2
         import numpy as np
         
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with span("quality.decode", bytes_in=len(image_bytes)):
+            nparr = np.frombuffer(image_bytes, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
             return {"quality": 0, "blur": 0, "brightness": 0}
         
-        # Blur detection (Laplacian variance)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-        
-        # Normalize blur score (higher is sharper)
-        blur_normalized = min(1.0, blur_score / 500)
-        
-        # Brightness
-        brightness = np.mean(gray) / 255
-        
-        # Coverage (non-sky pixels)
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        # Sky is typically high brightness, low saturation, blue hue
-        sky_mask = (hsv[:,:,0] > 90) & (hsv[:,:,0] < 130) & (hsv[:,:,1] < 100)
-        coverage = 1 - (np.sum(sky_mask) / sky_mask.size)
-        
-        # Overall quality
-        quality = (blur_normalized * 0.5 + brightness * 0.2 + coverage * 0.3)
-        
-        return {
-            "quality": round(quality, 3),
-            "sharpness": round(blur_normalized, 3),
-            "brightness": round(brightness, 3),
-            "coverage": round(coverage, 3),
-        }
+        with span("quality.analyze"):
+            # Blur detection (Laplacian variance)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
+            
+            # Normalize blur score (higher is sharper)
+            blur_normalized = min(1.0, blur_score / 500)
+            
+            # Brightness
+            brightness = np.mean(gray) / 255
+            
+            # Coverage (non-sky pixels)
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            # Sky is typically high brightness, low saturation, blue hue
+            sky_mask = (hsv[:,:,0] > 90) & (hsv[:,:,0] < 130) & (hsv[:,:,1] < 100)
+            coverage = 1 - (np.sum(sky_mask) / sky_mask.size)
+            
+            # Overall quality
+            quality = (blur_normalized * 0.5 + brightness * 0.2 + coverage * 0.3)
+            
+            return {
+                "quality": round(quality, 3),
+                "sharpness": round(blur_normalized, 3),
+                "brightness": round(brightness, 3),
+                "coverage": round(coverage, 3),
+            }
+
+
+@modal.cls(
+    gpu="T4",
+    volumes={"/models": volume},
+    image=image,
+    keep_warm=warm_pool_size("classifier"),
+)
+class SceneClassifier:
+    """Classify street scenes into mapping-relevant categories."""
+    
+    CATEGORIES = SceneClassifierRuntime.CATEGORIES
+    
+    @modal.enter()
+    def load_model(self):
+        """Start prefetching ResNet weights on container startup; the model loads on first use."""
+        self.runtime = SceneClassifierRuntime()
+        self.runtime.prefetch()
+    
+    @modal.method()
+    def classify(self, image_bytes: bytes) -> dict[str, Any]:
+        """Classify scene type."""
+        return self.runtime.classify(image_bytes)
+    
+    @modal.method()
+    def classify_batch(self, images: list[bytes]) -> list[dict[str, Any]]:
+        """Classify batch of images."""
+        return self.runtime.classify_batch(images)
+    
+    @modal.method()
+    def classify_embed_batch(self, images: list[bytes]) -> list[tuple[dict[str, Any], Any]]:
+        """Classify a batch of images, with each image's float16 scene embedding."""
+        return self.runtime.classify_embed_batch(images)
+    
+    @modal.method()
+    def get_scene_quality(self, image_bytes: bytes) -> dict[str, float]:
+        """Analyze image quality for mapping purposes."""
+        return self.runtime.get_scene_quality(image_bytes)
+    
+    @modal.method()
+    def get_scene_quality_batch(self, images: list[bytes]) -> list[dict[str, float]]:
+        """Analyze image quality for a batch of images."""
+        return [self.runtime.get_scene_quality(img) for img in images]
+    
+    @modal.method()
+    def batch_stats(self) -> dict[str, Any]:
+        """Learned batch size limits and out-of-memory retries for this container."""
+        return self.runtime.batch_sizer.stats()
+    
+    @modal.method()
+    def startup_report(self) -> dict[str, Any]:
+        """Per-phase startup timings for this container."""
+        return self.runtime.startup_report()
+    
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "classifier", "version": self.runtime.version})
@@ -0,0 +1,538 @@
+# apps/ml-service/models/cpu_pool.py
+"""
+CPU Worker Pool
+Runs the OpenCV-only stages (privacy blur, quality analysis) across all
+cores of a CPU container instead of one image at a time on a GPU container,
+and, in fork mode, the model stages on workers that share one copy of the
+weights.
+"""
+
+import modal
+import os
+import sys
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from models.instrumentation import get_tracer, span
+from models.records import DetectionTable
+from models.startup import warm_pool_size
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "opencv-python-headless",
+    "numpy",
+    "pillow",
+)
+
+# CPU builds of the model frameworks, for fork-mode inference workers
+inference_image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "torch>=2.1",
+    "torchvision",
+    "ultralytics",
+    "paddleocr",
+    "paddlepaddle",
+    "safetensors",
+    "opencv-python-headless",
+    "numpy",
+    "pillow",
+    index_url="https://download.pytorch.org/whl/cpu",
+    extra_index_url="https://pypi.org/simple",
+)
+
+volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
+
+# Stages every pool mode can run
+OPERATIONS = ("blur", "quality")
+
+# Stages that need model weights; only fork mode runs them, so the weights
+# are loaded once per host instead of once per worker
+MODEL_OPERATIONS = ("detect", "classify", "embed", "ocr", "signs")
+
+# Operation -> runtime it uses
+_RUNTIME_KEYS = {
+    "blur": "blur",
+    "quality": "classifier",
+    "detect": "detector",
+    "classify": "classifier",
+    "embed": "classifier",
+    "ocr": "ocr",
+    "signs": "ocr",
+}
+
+# Runtimes of this worker process (process mode) or thread (thread mode)
+_local = threading.local()
+
+# Runtimes loaded by a fork-mode parent; forked workers inherit them
+_shared_runtimes: dict[str, Any] = {}
+
+
+def _create_runtime(key: str) -> Any:
+    if key == "blur":
+        from models.blur import PrivacyBlurRuntime
+        return PrivacyBlurRuntime()
+    if key == "classifier":
+        from models.classifier import SceneClassifierRuntime
+        return SceneClassifierRuntime()
+    if key == "detector":
+        from models.detector import DetectorRuntime
+        return DetectorRuntime()
+    from models.ocr import TextRecognizerRuntime
+    return TextRecognizerRuntime(use_gpu=False)
+
+
+def _runtime(operation: str) -> Any:
+    """This worker's runtime for an operation, created on first use."""
+    key = _RUNTIME_KEYS[operation]
+    if key in _shared_runtimes:
+        return _shared_runtimes[key]
+    runtimes = getattr(_local, "runtimes", None)
+    if runtimes is None:
+        runtimes = _local.runtimes = {}
+    if key not in runtimes:
+        runtimes[key] = _create_runtime(key)
+    return runtimes[key]
+
+
+def _apply(operation: str, images: list[bytes | memoryview], kwargs: dict[str, Any]) -> Any:
+    """An operation over a chunk of images: one result per image, or one table for detect."""
+    if operation == "blur":
+        runtime = _runtime("blur")
+        results = []
+        for image in images:
+            blurred, counts = runtime.blur_all_pii(image, kwargs.get("blur_strength", 99))
+            # Unchanged frames come back as None, so the input is not sent back
+            results.append(((None if blurred is image else blurred), counts))
+        return results
+    if operation == "quality":
+        runtime = _runtime("quality")
+        return [runtime.get_scene_quality(image) for image in images]
+
+    # The model runtimes decode from bytes
+    images = [bytes(image) for image in images]
+    if operation == "detect":
+        return _runtime("detect").detect_columnar(images, kwargs.get("confidence_threshold", 0.5))
+    if operation == "classify":
+        return _runtime("classify").classify_batch(images)
+    if operation == "embed":
+        return _runtime("embed").classify_embed_batch(images)
+    if operation == "ocr":
+        return _runtime("ocr").extract_batch(images)
+    return _runtime("signs").extract_signs_batch(images)
+
+
+def _init_worker() -> None:
+    import cv2
+
+    # One OpenCV thread per worker process: the pool provides the parallelism
+    cv2.setNumThreads(1)
+    for operation in OPERATIONS:
+        _runtime(operation)
+
+
+def _init_forked(threads: int) -> None:
+    import cv2
+
+    cv2.setNumThreads(1)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _load_shared(operations: tuple[str, ...], share_tensors: bool) -> int:
+    """
+    Load the runtimes for `operations` into this (parent) process.
+
+    Returns:
+        Bytes of torch tensors moved to shared memory
+    """
+    if {"detect", "classify", "embed"} & set(operations):
+        import torch
+
+        # Inference threads are started in the workers, after the fork
+        torch.set_num_threads(1)
+
+    for operation in operations:
+        key = _RUNTIME_KEYS[operation]
+        if key not in _shared_runtimes:
+            _shared_runtimes[key] = _create_runtime(key)
+
+    shared_bytes = 0
+    # Quality analysis is OpenCV only and needs no classifier weights
+    for key in sorted({_RUNTIME_KEYS[op] for op in operations if op != "quality"}):
+        runtime = _shared_runtimes[key]
+        if runtime.loaded:
+            continue
+        model = runtime.model
+        if share_tensors:
+            shared_bytes += _share_tensors(model)
+    return shared_bytes
+
+
+def _share_tensors(model: Any) -> int:
+    """
+    Move a torch model's parameters and buffers into shared memory. Workers
+    then map the same pages, which stay shared however the workers touch
+    the Python objects around them. Models of other frameworks (PaddleOCR)
+    are shared copy-on-write only.
+    """
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return 0
+    # ultralytics.YOLO wraps the nn.Module
+    module = model if isinstance(model, torch.nn.Module) else getattr(model, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    module.share_memory()
+    return sum(t.numel() * t.element_size() for t in (*module.parameters(), *module.buffers()))
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def _memory(pid: int) -> dict[str, int] | None:
+    """RSS, PSS and shared/private bytes of a process, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        "pid": pid,
+        "rssBytes": fields.get("Rss", 0),
+        "pssBytes": fields.get("Pss", 0),
+        "sharedBytes": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "privateBytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def _run_shared(
+    shm_name: str,
+    spans: list[tuple[int, int]],
+    operation: str,
+    kwargs: dict[str, Any],
+) -> Any:
+    """Process worker: run an operation over images read in place from a shared memory block."""
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    views = [shm.buf[offset:offset + length] for offset, length in spans]
+    try:
+        return _apply(operation, views, kwargs)
+    finally:
+        for view in views:
+            view.release()
+        shm.close()
+
+
+def _run_local(images: list[bytes], operation: str, kwargs: dict[str, Any]) -> Any:
+    """Thread worker: OpenCV releases the GIL while decoding, detecting and encoding."""
+    return _apply(operation, images, kwargs)
+
+
+class CpuWorkerPool:
+    """
+    Pool of CPU workers for the blur and quality stages, and in fork mode
+    for the model stages too.
+
+    In "process" mode a batch is copied once into a shared memory block and
+    workers decode their slice of it in place, so image bytes are never
+    pickled; only results travel back, and frames the blur left unchanged
+    return nothing but their counts. "thread" mode runs the same work on
+    threads of this process, which scales as far as OpenCV releases the GIL
+    and avoids the copy altogether.
+
+    "fork" mode loads the models once in this process, moves torch weights
+    into shared memory and then forks the workers, which share the weights
+    (copy-on-write for PaddleOCR) instead of loading a copy each. Objects
+    loaded before the fork are frozen out of garbage collection so the
+    collector does not dirty their pages in every worker. Use it on CPU-only
+    hosts: CUDA does not survive a fork.
+
+    Usage:
+        pool = CpuWorkerPool()
+        results = pool.map("blur", images)
+
+        pool = CpuWorkerPool(mode="fork", operations=("detect", "classify"))
+        table = pool.map("detect", images)
+        pool.memory_report()
+    """
+
+    def __init__(
+        self,
+        mode: str | None = None,
+        workers: int | None = None,
+        operations: tuple[str, ...] | None = None,
+        share_tensors: bool = True,
+    ):
+        """
+        Args:
+            mode: "process", "thread" or "fork"; defaults to CPU_POOL_MODE, else "process"
+            workers: Worker count; defaults to CPU_POOL_WORKERS, else one per core
+            operations: Stages fork mode loads before forking (default: all)
+            share_tensors: In fork mode, move torch weights to shared memory
+        """
+        self.mode = mode or os.environ.get("CPU_POOL_MODE", "process")
+        if self.mode not in ("process", "thread", "fork"):
+            raise ValueError(f"Unknown CPU pool mode: {self.mode}")
+        self.workers = workers or int(os.environ.get("CPU_POOL_WORKERS", 0)) or os.cpu_count() or 1
+        available = OPERATIONS + MODEL_OPERATIONS if self.mode == "fork" else OPERATIONS
+        self.operations = tuple(operations or available)
+        unavailable = [op for op in self.operations if op not in available]
+        if unavailable:
+            raise ValueError(f"Operations not available in {self.mode} mode: {unavailable}")
+        self.share_tensors = share_tensors
+        self.shared_bytes = 0
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == "fork":
+                        self._executor = self._fork_workers()
+                    elif self.mode == "process":
+                        import multiprocessing
+
+                        # forkserver: workers are not forked from a process with running threads
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("forkserver"),
+                            initializer=_init_worker,
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu-pool")
+        return self._executor
+
+    def _fork_workers(self) -> Executor:
+        import gc
+        import multiprocessing
+        from multiprocessing import resource_tracker
+
+        self.shared_bytes = _load_shared(self.operations, self.share_tensors)
+        gc.collect()
+        gc.freeze()
+        # Workers inherit this tracker; one of their own would unlink the
+        # batch blocks they attach to when they exit
+        resource_tracker.ensure_running()
+
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_forked,
+            initargs=(threads,),
+        )
+        # A fork context starts every worker on the first submit: fork them
+        # now, while the loaded models are all that is in memory
+        list(executor.map(_worker_pid, range(self.workers)))
+        return executor
+
+    def start(self) -> None:
+        """Load and fork now instead of on the first batch."""
+        self.executor
+
+    def _chunks(self, n: int) -> list[tuple[int, int]]:
+        """Contiguous (start, end) slices of n items, two per worker to even out slow frames."""
+        count = min(2 * self.workers, n)
+        bounds = [round(i * n / count) for i in range(count + 1)]
+        return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i] < bounds[i + 1]]
+
+    def map(self, operation: str, images: list[bytes], **kwargs: Any) -> Any:
+        """
+        Run an operation over images: one result per image, in order, or
+        for "detect" one DetectionTable with a frame per image (as
+        Detector.detect_columnar).
+        """
+        if operation not in self.operations:
+            raise ValueError(f"Operation not available in {self.mode} mode: {operation}")
+        if not images:
+            return DetectionTable() if operation == "detect" else []
+
+        chunks = self._chunks(len(images))
+        with span(f"cpu.{operation}", batch_size=len(images), bytes_in=sum(map(len, images))):
+            if self.mode == "thread":
+                futures = [
+                    self.executor.submit(_run_local, images[start:end], operation, kwargs)
+                    for start, end in chunks
+                ]
+                outputs = [future.result() for future in futures]
+            else:
+                outputs = self._map_shared(operation, images, chunks, kwargs)
+
+        if operation == "detect":
+            # Each chunk numbers its frames from 0
+            tables = []
+            for (start, _), table in zip(chunks, outputs):
+                table.data["frame"] += start
+                tables.append(table)
+            return DetectionTable.concat(tables)
+
+        results = [result for output in outputs for result in output]
+        if operation == "blur":
+            # Put the original bytes back for frames the workers did not change
+            results = [
+                (image if blurred is None else blurred, counts)
+                for image, (blurred, counts) in zip(images, results)
+            ]
+        return results
+
+    def _map_shared(
+        self,
+        operation: str,
+        images: list[bytes],
+        chunks: list[tuple[int, int]],
+        kwargs: dict[str, Any],
+    ) -> list[Any]:
+        from multiprocessing import shared_memory
+
+        offsets = []
+        total = 0
+        for image in images:
+            offsets.append((total, len(image)))
+            total += len(image)
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+        try:
+            for (offset, length), image in zip(offsets, images):
+                shm.buf[offset:offset + length] = image
+            futures = [
+                self.executor.submit(_run_shared, shm.name, offsets[start:end], operation, kwargs)
+                for start, end in chunks
+            ]
+            return [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def memory_report(self) -> dict[str, Any]:
+        """
+        Memory of this process and each worker process. PSS splits shared
+        pages between the processes mapping them, so the PSS total is the
+        pool's real footprint; RSS counts shared weights once per worker.
+        """
+        processes = getattr(self._executor, "_processes", None) or {}
+        workers = [m for m in (_memory(pid) for pid in sorted(processes)) if m is not None]
+        parent = _memory(os.getpid())
+        everything = workers + ([parent] if parent is not None else [])
+        return {
+            "mode": self.mode,
+            "parent": parent,
+            "workers": workers,
+            "sharedTensorBytes": self.shared_bytes,
+            "totalRssBytes": sum(m["rssBytes"] for m in everything),
+            "totalPssBytes": sum(m["pssBytes"] for m in everything),
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+@modal.cls(
+    cpu=float(os.environ.get("CPU_WORKER_CORES", 8)),
+    memory=4096,
+    image=image,
+    keep_warm=warm_pool_size("cpu"),
+    allow_concurrent_inputs=4,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+class CpuWorker:
+    """Blur and quality analysis on CPU-only containers (no GPU billed)."""
+
+    @modal.enter()
+    def start(self):
+        self.pool = CpuWorkerPool()
+
+    @modal.exit()
+    def stop(self):
+        self.pool.close()
+
+    @modal.method()
+    def blur_batch(self, images: list[bytes], blur_strength: int = 99) -> list[tuple[bytes, dict[str, int]]]:
+        """Blur all PII in a batch of images (same results as PrivacyBlur.blur_batch)."""
+        return self.pool.map("blur", images, blur_strength=blur_strength)
+
+    @modal.method()
+    def get_scene_quality_batch(self, images: list[bytes]) -> list[dict[str, float]]:
+        """Quality metrics for a batch of images (same results as SceneClassifier.get_scene_quality_batch)."""
+        return self.pool.map("quality", images)
+
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "cpu", "mode": self.pool.mode})
+
+
+@modal.cls(
+    cpu=float(os.environ.get("CPU_WORKER_CORES", 8)),
+    memory=int(os.environ.get("CPU_INFERENCE_MEMORY_MB", 16384)),
+    volumes={"/models": volume},
+    image=inference_image,
+    keep_warm=warm_pool_size("cpu_inference"),
+    allow_concurrent_inputs=4,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+class CpuInferenceWorker:
+    """All model stages on CPU-only containers, with forked workers sharing one copy of the weights."""
+
+    @modal.enter()
+    def start(self):
+        self.pool = CpuWorkerPool(mode="fork")
+        self.pool.start()
+
+    @modal.exit()
+    def stop(self):
+        self.pool.close()
+
+    @modal.method()
+    def blur_batch(self, images: list[bytes], blur_strength: int = 99) -> list[tuple[bytes, dict[str, int]]]:
+        """Blur all PII in a batch of images."""
+        return self.pool.map("blur", images, blur_strength=blur_strength)
+
+    @modal.method()
+    def get_scene_quality_batch(self, images: list[bytes]) -> list[dict[str, float]]:
+        """Quality metrics for a batch of images."""
+        return self.pool.map("quality", images)
+
+    @modal.method()
+    def detect_columnar(self, images: list[bytes], confidence_threshold: float = 0.5) -> DetectionTable:
+        """Detect objects in a batch of images as one table (same results as Detector.detect_columnar)."""
+        return self.pool.map("detect", images, confidence_threshold=confidence_threshold)
+
+    @modal.method()
+    def classify_batch(self, images: list[bytes]) -> list[dict[str, Any]]:
+        """Classify a batch of images."""
+        return self.pool.map("classify", images)
+
+    @modal.method()
+    def classify_embed_batch(self, images: list[bytes]) -> list[tuple[dict[str, Any], Any]]:
+        """Classify a batch of images, with each image's float16 scene embedding."""
+        return self.pool.map("embed", images)
+
+    @modal.method()
+    def extract_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
+        """Extract text from a batch of images."""
+        return self.pool.map("ocr", images)
+
+    @modal.method()
+    def extract_signs_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
+        """Extract sign text with regions from a batch of images."""
+        return self.pool.map("signs", images)
+
+    @modal.method()
+    def memory_report(self) -> dict[str, Any]:
+        """RSS and PSS of the parent and each worker process."""
+        return self.pool.memory_report()
+
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "cpu_inference", "mode": self.pool.mode})
@@ -7,9 +7,15 @@ Detects vehicles, pedestrians, traffic signs, buildings, etc.
 import modal
 from typing import Any
 
+from models.batch_sizing import AdaptiveBatchSizer
+from models.imaging import decode, resolution_bucket
+from models.instrumentation import get_tracer, span
+from models.records import CLASS_IDS, CLASS_NAMES, DetectionTable
+from models.startup import LazyModel, lazy_import, warm_pool_size
+
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "torch>=2.0",
-    "torchvision", 
+    "torchvision",
     "ultralytics",
     "opencv-python-headless",
     "numpy",
@@ -18,38 +24,47 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install(
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
 
 
-@modal.cls(gpu="T4", volumes={"/models": volume}, image=image)
-class Detector:
-    """YOLOv8-based object detector for street scene analysis."""
+class DetectorRuntime(LazyModel):
+    """In-process YOLOv8 runtime. Weights are loaded on first use."""
+    
+    component = "detector"
+    WEIGHTS_PATH = "/models/yolov8n.pt"
+    # YOLO letterboxes to 640 on the long side; larger decodes are wasted
+    INPUT_LONG_SIDE = 640
     
     # Classes we care about for CityPulse
-    RELEVANT_CLASSES = {
-        "car", "motorcycle", "bus", "truck", "bicycle",
-        "person", "traffic light", "stop sign",
-        "fire hydrant", "parking meter", "bench",
-    }
+    RELEVANT_CLASSES = set(CLASS_NAMES)
     
-    @modal.enter()
-    def load_model(self):
-        """Load model on container startup."""
-        from ultralytics import YOLO
-        import os
+    def __init__(self, weights_path: str | None = None, warmup: bool = True, **kwargs: Any):
+        super().__init__(weights_path, **kwargs)
+        self.warmup = warmup
+        self._class_lookup: Any = None
+        self.batch_sizer = AdaptiveBatchSizer(self.component, initial=16)
+    
+    def _load(self) -> Any:
+        ultralytics = lazy_import("ultralytics", self.profiler)
         
-        model_path = "/models/yolov8n.pt"
+        weights_path = self._registered_weights()
         
-        # Download if not exists
-        if not os.path.exists(model_path):
-            self.model = YOLO("yolov8n.pt")
-            self.model.save(model_path)
-        else:
-            self.model = YOLO(model_path)
+        with self.profiler.phase("load_weights"):
+            if weights_path is not None:
+                model = ultralytics.YOLO(weights_path)
+            else:
+                # Fresh volume: download once and register for later containers
+                model = ultralytics.YOLO("yolov8n.pt")
+                model.save(self.WEIGHTS_PATH)
+                self.registry.register(self.component, self.WEIGHTS_PATH)
+                weights_path = self.registry.resolve(self.component)
+            self.weights_path = weights_path
         
-        # Warm up
-        import numpy as np
-        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-        self.model(dummy, verbose=False)
+        if self.warmup:
+            import numpy as np
+            with self.profiler.phase("warmup"):
+                dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+                model(dummy, verbose=False)
+        
+        return model
     
-    @modal.method()
     def detect(self, image_bytes: bytes, confidence_threshold: float = 0.5) -> list[dict[str, Any]]:
         """
         Detect objects in image.
@@ -57,61 +72,144 @@ class Detector:
         Args:
             image_bytes: Raw image bytes (JPEG/PNG)
             confidence_threshold: Minimum confidence score
-            
+        
         Returns:
             List of detections with class, confidence, bbox
         """
-        import cv2
-        import numpy as np
-        
-        # Decode image
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        return self.detect_batch([image_bytes], confidence_threshold)[0]
+    
+    def detect_batch(self, images: list[bytes], confidence_threshold: float = 0.5) -> list[list[dict[str, Any]]]:
+        """
+        Detect objects in batch of images with a single forward pass.
         
-        if img is None:
-            return []
+        Images that fail to decode get an empty detection list.
+        """
+        return self.detect_columnar(images, confidence_threshold).frame_dicts(len(images))
+    
+    def detect_columnar(self, images: list[bytes], confidence_threshold: float = 0.5) -> DetectionTable:
+        """
+        Detect objects in batch of images, returning one DetectionTable
+        whose `frame` column is the position in `images`.
+        """
+        # Decode images at reduced scale; boxes are scaled back by `factors`
+        decoded = []
+        factors = []
+        with span("detector.decode", batch_size=len(images), bytes_in=sum(len(b) for b in images)):
+            for image_bytes in images:
+                img, factor = decode(image_bytes, min_long_side=self.INPUT_LONG_SIDE)
+                decoded.append(img)
+                factors.append(factor)
         
-        # Run detection
-        results = self.model(img, verbose=False)
+        valid = [i for i, img in enumerate(decoded) if img is not None]
+        if not valid:
+            return DetectionTable()
         
-        # Extract detections
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                class_name = self.model.names[int(box.cls)]
-                confidence = float(box.conf)
-                
-                # Filter by confidence and relevance
-                if confidence >= confidence_threshold and class_name in self.RELEVANT_CLASSES:
-                    bbox = box.xyxy[0].tolist()
-                    detections.append({
-                        "class": class_name,
-                        "confidence": round(confidence, 3),
-                        "bbox": {
-                            "x1": int(bbox[0]),
-                            "y1": int(bbox[1]),
-                            "x2": int(bbox[2]),
-                            "y2": int(bbox[3]),
-                        },
-                        "center": {
-                            "x": int((bbox[0] + bbox[2]) / 2),
-                            "y": int((bbox[1] + bbox[3]) / 2),
-                        }
-                    })
+        # Run detection in chunks that fit in memory at this resolution
+        model = self.model
+        bucket = resolution_bucket(max(max(decoded[i].shape[:2]) for i in valid))
+        with span("detector.infer", batch_size=len(valid)):
+            results = self.batch_sizer.run(
+                [decoded[i] for i in valid],
+                lambda chunk: model(chunk, verbose=False),
+                bucket,
+            )
         
-        return detections
+        with span("detector.postprocess", batch_size=len(valid)):
+            return DetectionTable.concat([
+                self._extract_table(r, frame, confidence_threshold, factors[frame])
+                for frame, r in zip(valid, results)
+            ])
     
-    @modal.method()
-    def detect_batch(self, images: list[bytes], confidence_threshold: float = 0.5) -> list[list[dict[str, Any]]]:
-        """Detect objects in batch of images."""
-        return [self.detect(img, confidence_threshold) for img in images]
+    def _extract_table(
+        self,
+        result: Any,
+        frame: int,
+        confidence_threshold: float,
+        scale: float = 1,
+    ) -> DetectionTable:
+        """Filter one YOLO result by confidence and relevance, vectorized; boxes are multiplied by `scale`."""
+        import numpy as np
+        
+        if self._class_lookup is None:
+            # YOLO class index -> our class id (-1 for classes we ignore)
+            names = self.model.names
+            self._class_lookup = np.array(
+                [CLASS_IDS.get(names[i], -1) for i in range(len(names))], dtype=np.int16,
+            )
+        
+        boxes = result.boxes
+        class_ids = self._class_lookup[boxes.cls.cpu().numpy().astype(np.int64)]
+        confidences = boxes.conf.cpu().numpy()
+        keep = (confidences >= confidence_threshold) & (class_ids >= 0)
+        return DetectionTable.from_arrays(
+            frame,
+            class_ids[keep],
+            confidences[keep],
+            boxes.xyxy.cpu().numpy()[keep] * scale,
+        )
     
-    @modal.method()
     def count_entities(self, image_bytes: bytes) -> dict[str, int]:
         """Count entities by class in image."""
-        detections = self.detect(image_bytes)
+        return self.detect_columnar([image_bytes]).class_counts()
+    
+    @staticmethod
+    def count_detections(detections: list[dict[str, Any]]) -> dict[str, int]:
+        """Count already-computed detections by class."""
         counts: dict[str, int] = {}
         for d in detections:
             class_name = d["class"]
             counts[class_name] = counts.get(class_name, 0) + 1
         return counts
+
+
+@modal.cls(
+    gpu="T4",
+    volumes={"/models": volume},
+    image=image,
+    keep_warm=warm_pool_size("detector"),
+)
+class Detector:
+    """YOLOv8-based object detector for street scene analysis."""
+    
+    RELEVANT_CLASSES = DetectorRuntime.RELEVANT_CLASSES
+    
+    @modal.enter()
+    def load_model(self):
+        """Start prefetching weights on container startup; the model loads on first use."""
+        self.runtime = DetectorRuntime()
+        self.runtime.prefetch()
+    
+    @modal.method()
+    def detect(self, image_bytes: bytes, confidence_threshold: float = 0.5) -> list[dict[str, Any]]:
+        """Detect objects in image."""
+        return self.runtime.detect(image_bytes, confidence_threshold)
+    
+    @modal.method()
+    def detect_batch(self, images: list[bytes], confidence_threshold: float = 0.5) -> list[list[dict[str, Any]]]:
+        """Detect objects in batch of images."""
+        return self.runtime.detect_batch(images, confidence_threshold)
+    
+    @modal.method()
+    def detect_columnar(self, images: list[bytes], confidence_threshold: float = 0.5) -> DetectionTable:
+        """Detect objects in batch of images as one compact DetectionTable."""
+        return self.runtime.detect_columnar(images, confidence_threshold)
+    
+    @modal.method()
+    def count_entities(self, image_bytes: bytes) -> dict[str, int]:
+        """Count entities by class in image."""
+        return self.runtime.count_entities(image_bytes)
+    
+    @modal.method()
+    def batch_stats(self) -> dict[str, Any]:
+        """Learned batch size limits and out-of-memory retries for this container."""
+        return self.runtime.batch_sizer.stats()
+    
+    @modal.method()
+    def startup_report(self) -> dict[str, Any]:
+        """Per-phase startup timings for this container."""
+        return self.runtime.startup_report()
+    
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "detector", "version": self.runtime.version})
@@ -0,0 +1,414 @@
+# apps/ml-service/models/embeddings.py
+"""
+Scene Embedding Store
+Compact float16 storage for the classifier's penultimate-layer embeddings,
+with an IVF-PQ approximate nearest-neighbour index in NumPy, for
+near-duplicate suppression and "find similar street scenes" by image or
+by location without re-running the backbone.
+"""
+
+import io
+from typing import Any
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (float32), so inner product is cosine similarity."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return (
+        np.einsum("ij,ij->i", x, x)[:, None]
+        - 2 * x @ centroids.T
+        + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+    )
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Nearest centroid per row, in chunks to bound the distance matrix."""
+    return np.concatenate([
+        _squared_distances(x[i:i + chunk], centroids).argmin(axis=1)
+        for i in range(0, len(x), chunk)
+    ]) if len(x) else np.empty(0, dtype=np.int64)
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IvfPqIndex:
+    """
+    Inverted-file index with product-quantized residuals.
+
+    Vectors are assigned to the nearest of `nlist` coarse centroids; the
+    residual to that centroid is split into `m` subvectors, each stored as
+    one byte (the nearest of 256 sub-centroids). A search visits the
+    `nprobe` closest lists and scores their codes with per-query lookup
+    tables, so 2048 float16 dimensions (4 KB) are searched as 16 bytes.
+    """
+
+    def __init__(
+        self,
+        nlist: int | None = None,
+        m: int = 16,
+        nprobe: int = 8,
+        iterations: int = 20,
+        max_train: int = 16384,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.max_train = max_train
+        self.seed = seed
+        self.centroids: np.ndarray | None = None
+        self.codebooks: np.ndarray | None = None  # (m, ksub, dsub)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, m), dtype=np.uint8)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Learn the coarse centroids and sub-codebooks from (a sample of) `vectors`."""
+        x = normalize(vectors)
+        if len(x) > self.max_train:
+            x = x[np.random.default_rng(self.seed).choice(len(x), self.max_train, replace=False)]
+        dim = x.shape[1]
+        if dim % self.m:
+            raise ValueError(f"Dimension {dim} is not divisible by m={self.m}")
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        self.centroids = kmeans(x, nlist, self.iterations, self.seed)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, self.m), dtype=np.uint8)
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+
+        residuals = x - self.centroids[_assign(x, self.centroids)]
+        dsub = dim // self.m
+        ksub = min(256, len(x))
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, self.iterations, self.seed + j)
+            for j in range(self.m)
+        ])
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        dsub = residuals.shape[1] // self.m
+        return np.stack([
+            _assign(residuals[:, j * dsub:(j + 1) * dsub], self.codebooks[j])
+            for j in range(self.m)
+        ], axis=1).astype(np.uint8)
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Index vectors under integer ids (e.g. store rows)."""
+        if not self.trained:
+            raise RuntimeError("Index is not trained")
+        x = normalize(vectors)
+        lists = _assign(x, self.centroids)
+        codes = self._encode(x - self.centroids[lists])
+
+        # Keep entries sorted by list so each list is one contiguous slice
+        all_lists = np.concatenate([np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets)), lists])
+        all_ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        all_codes = np.concatenate([self.codes, codes])
+        order = np.argsort(all_lists, kind="stable")
+        self.ids, self.codes = all_ids[order], all_codes[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(all_lists, minlength=len(self.centroids)))])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest ids to one query, with estimated cosine
+        similarities (from the quantized distances), best first.
+        """
+        q = normalize(query)[0]
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        coarse = _squared_distances(q[None, :], self.centroids)[0]
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe]
+
+        dsub = len(q) // self.m
+        ids, distances = [], []
+        for lst in probe:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            residual = q - self.centroids[lst]
+            # (m, ksub) squared distances from each query subvector to its codebook
+            tables = np.stack([
+                ((self.codebooks[j] - residual[j * dsub:(j + 1) * dsub]) ** 2).sum(axis=1)
+                for j in range(self.m)
+            ])
+            codes = self.codes[start:end]
+            distances.append(tables[np.arange(self.m), codes].sum(axis=1))
+            ids.append(self.ids[start:end])
+
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, distances = np.concatenate(ids), np.concatenate(distances)
+        top = np.argsort(distances)[:k]
+        # |a - b|^2 = 2 - 2 cos for unit vectors
+        return ids[top], (1 - distances[top] / 2).astype(np.float32)
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids,
+            "codebooks": self.codebooks,
+            "ids": self.ids,
+            "codes": self.codes,
+            "offsets": self.offsets,
+            "params": np.array([self.m, self.nprobe]),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict[str, np.ndarray]) -> "IvfPqIndex":
+        m, nprobe = (int(v) for v in state["params"])
+        index = cls(nlist=len(state["centroids"]), m=m, nprobe=nprobe)
+        index.centroids = state["centroids"]
+        index.codebooks = state["codebooks"]
+        index.ids = state["ids"]
+        index.codes = state["codes"]
+        index.offsets = state["offsets"]
+        return index
+
+
+class EmbeddingStore:
+    """
+    Unit-length scene embeddings as one float16 matrix, with the frame
+    index, image key and (when known) location of each row.
+
+    Small stores are searched exactly; from `ann_threshold` rows on, an
+    IvfPqIndex picks candidates that are re-ranked against the float16
+    vectors. A store is saved as a single .npz, index included.
+
+    Usage:
+        store = EmbeddingStore()
+        store.add(embedding, key, frame=3, location=(52.37, 4.89))
+        store.search(query_embedding, k=5)
+        store.search(location=(52.37, 4.89), radius_m=100)
+    """
+
+    def __init__(self, dim: int = 2048, ann_threshold: int = 4096):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self._vectors = np.empty((0, dim), dtype=np.float16)
+        self._frames: list[int] = []
+        self._keys: list[str] = []
+        self._lats: list[float] = []
+        self._lons: list[float] = []
+        self._size = 0
+        self._index: IvfPqIndex | None = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    @property
+    def keys(self) -> list[str]:
+        return self._keys
+
+    @property
+    def frames(self) -> np.ndarray:
+        return np.asarray(self._frames, dtype=np.int64)
+
+    @property
+    def locations(self) -> np.ndarray:
+        """(n, 2) lat/lon, NaN where unknown."""
+        return np.column_stack([np.asarray(self._lats, dtype=np.float64), np.asarray(self._lons, dtype=np.float64)])
+
+    def add(self, embedding: np.ndarray, key: str, frame: int, location: tuple[float, float] | None = None) -> int:
+        """Store one embedding; returns its row."""
+        if self._size == len(self._vectors):
+            grown = np.empty((max(64, 2 * len(self._vectors)), self.dim), dtype=np.float16)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size] = normalize(embedding)[0]
+        self._frames.append(frame)
+        self._keys.append(key)
+        self._lats.append(location[0] if location is not None else np.nan)
+        self._lons.append(location[1] if location is not None else np.nan)
+        self._size += 1
+        self._index = None
+        return self._size - 1
+
+    @classmethod
+    def concat(cls, stores: list["EmbeddingStore"]) -> "EmbeddingStore":
+        """One store over several (e.g. the sessions of a region); the index is rebuilt on demand."""
+        merged = cls(dim=stores[0].dim if stores else 2048)
+        if stores:
+            merged._vectors = np.concatenate([s.vectors for s in stores])
+            merged._size = len(merged._vectors)
+            for store in stores:
+                merged._frames.extend(store._frames)
+                merged._keys.extend(store._keys)
+                merged._lats.extend(store._lats)
+                merged._lons.extend(store._lons)
+        return merged
+
+    def index(self) -> IvfPqIndex:
+        """The ANN index over every row, trained on first use."""
+        if self._index is None or len(self._index) != self._size:
+            index = IvfPqIndex()
+            vectors = self.vectors.astype(np.float32)
+            index.train(vectors)
+            index.add(vectors, np.arange(self._size))
+            self._index = index
+        return self._index
+
+    def near(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        """Rows located within `radius_m`, nearest first."""
+        locations = self.locations
+        if not len(locations):
+            return np.empty(0, dtype=np.int64)
+        distances = _haversine_m(lat, lon, locations[:, 0], locations[:, 1])
+        rows = np.flatnonzero(distances <= radius_m)  # NaN (unlocated) never matches
+        return rows[np.argsort(distances[rows], kind="stable")]
+
+    def _rank(self, query: np.ndarray, rows: np.ndarray | None, k: int, chunk: int = 8192) -> tuple[np.ndarray, np.ndarray]:
+        """Exact cosine similarity over `rows` (all if None), best k first."""
+        q = normalize(query)[0]
+        candidates = self.vectors if rows is None else self.vectors[rows]
+        # float16 has no BLAS path: widen a chunk at a time
+        scores = np.concatenate([
+            candidates[i:i + chunk].astype(np.float32) @ q
+            for i in range(0, len(candidates), chunk)
+        ]) if len(candidates) else np.empty(0, dtype=np.float32)
+        top = np.argsort(-scores, kind="stable")[:k]
+        return (top if rows is None else rows[top]), scores[top]
+
+    def search(
+        self,
+        query: np.ndarray | None = None,
+        k: int = 10,
+        location: tuple[float, float] | None = None,
+        radius_m: float = 100.0,
+        exclude: set[int] | None = None,
+        refine: int = 4,
+    ) -> list[dict[str, Any]]:
+        """
+        Most similar stored scenes to a query embedding, optionally only
+        those within `radius_m` of `location`; with a location and no
+        query, the located scenes nearest first.
+
+        Args:
+            query: Embedding of the query image
+            k: Results to return
+            location: (lat, lon) to search around
+            radius_m: Search radius around `location`
+            exclude: Rows to leave out (e.g. the query frame itself)
+            refine: ANN candidates fetched per result before exact re-ranking
+        """
+        if not self._size or (query is None and location is None):
+            return []
+        exclude = exclude or set()
+        rows = self.near(location[0], location[1], radius_m) if location is not None else None
+
+        if query is None:
+            rows = np.array([r for r in rows if r not in exclude], dtype=np.int64)[:k]
+            scores = np.full(len(rows), np.nan)
+        elif rows is None and self._size >= self.ann_threshold:
+            candidates, _ = self.index().search(query, (k + len(exclude)) * refine)
+            rows, scores = self._rank(query, np.sort(candidates), k + len(exclude))
+        else:
+            rows, scores = self._rank(query, rows, k + len(exclude))
+
+        results = []
+        for row, score in zip(rows, scores):
+            if int(row) in exclude:
+                continue
+            results.append(self._describe(int(row), score))
+            if len(results) == k:
+                break
+        return results
+
+    def _describe(self, row: int, score: float) -> dict[str, Any]:
+        entry: dict[str, Any] = {"row": row, "frame": self._frames[row], "key": self._keys[row]}
+        if not np.isnan(score):
+            entry["similarity"] = round(float(score), 4)
+        if not np.isnan(self._lats[row]):
+            entry["location"] = {"lat": self._lats[row], "lon": self._lons[row]}
+        return entry
+
+    def near_duplicates(self, threshold: float = 0.95, window: int | None = None, chunk: int = 1024) -> np.ndarray:
+        """
+        For each row, the earlier row it nearly duplicates (cosine >=
+        `threshold`), or -1. `window` limits the comparison to that many
+        preceding rows (consecutive frames of a drive).
+        """
+        vectors = self.vectors
+        duplicate_of = np.full(self._size, -1, dtype=np.int64)
+        for start in range(0, self._size, chunk):
+            end = min(start + chunk, self._size)
+            first = 0 if window is None else max(0, start - window)
+            sims = vectors[start:end].astype(np.float32) @ vectors[first:end].astype(np.float32).T
+            rows = np.arange(start, end)[:, None]
+            cols = np.arange(first, end)[None, :]
+            earlier = cols < rows
+            if window is not None:
+                earlier &= cols >= rows - window
+            sims[~earlier] = -np.inf
+            best = sims.argmax(axis=1)
+            found = sims[np.arange(end - start), best] >= threshold
+            duplicate_of[start:end][found] = best[found] + first
+        return duplicate_of
+
+    def to_bytes(self, include_index: bool = True) -> bytes:
+        arrays = {
+            "vectors": self.vectors,
+            "frames": self.frames,
+            "keys": np.asarray(self._keys, dtype=str),
+            "locations": self.locations,
+        }
+        if include_index and self._index is not None:
+            arrays.update({f"index_{name}": value for name, value in self._index.state().items()})
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "EmbeddingStore":
+        with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+            vectors = data["vectors"]
+            store = cls(dim=vectors.shape[1] if vectors.ndim == 2 else 2048)
+            store._vectors = vectors.astype(np.float16, copy=False)
+            store._size = len(vectors)
+            store._frames = data["frames"].tolist()
+            store._keys = data["keys"].tolist()
+            store._lats = data["locations"][:, 0].tolist() if len(vectors) else []
+            store._lons = data["locations"][:, 1].tolist() if len(vectors) else []
+            index_state = {name[len("index_"):]: data[name] for name in data.files if name.startswith("index_")}
+        if index_state:
+            store._index = IvfPqIndex.from_state(index_state)
+        return store
@@ -0,0 +1,298 @@
+# apps/ml-service/models/imaging.py
+"""
+Image Decoding
+Decode JPEGs at the smallest DCT scale (1/2, 1/4, 1/8) that still covers a
+model's input size, so large uploads are never decoded at full resolution
+only to be resized down, and strip image metadata without re-encoding.
+"""
+
+import struct
+import zlib
+from typing import Any
+
+
+# JPEG start-of-frame markers carrying the image dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes) -> tuple[int, int] | None:
+    """(width, height) from a JPEG header without decoding, or None if not a JPEG."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            i += 2
+            continue
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def image_size(data: bytes) -> tuple[int, int] | None:
+    """
+    (width, height) from a JPEG or PNG header, as decoders that apply the
+    EXIF orientation (OpenCV, and so the models' box coordinates) see the
+    image; None for other formats.
+    """
+    if data[:8] == _PNG_SIGNATURE:
+        return struct.unpack(">II", data[16:24]) if len(data) >= 24 else None
+    size = jpeg_size(data)
+    if size is not None and (_jpeg_orientation(data) or 1) >= 5:
+        # Orientations 5-8 rotate by 90 degrees
+        return size[1], size[0]
+    return size
+
+
+def _jpeg_orientation(data: bytes) -> int | None:
+    """EXIF orientation of a JPEG (see _exif_orientation)."""
+    i = 2
+    n = len(data)
+    while i + 4 <= n and data[i] == 0xFF:
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        # EXIF comes before the frame header
+        if marker == 0xDA or marker in _SOF_MARKERS:
+            return None
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        if marker == 0xE1 and data[i + 4:i + 10] == _EXIF_HEADER:
+            return _exif_orientation(data[i + 10:i + 2 + length])
+        i += 2 + length
+    return None
+
+
+# APPn segments kept by strip_metadata: JFIF (APP0) and the Adobe colour
+# transform (APP14) affect how the image decodes, as do ICC profiles (APP2,
+# checked separately); EXIF/XMP (APP1), IPTC (APP13) and the rest are dropped
+# (EXIF is replaced by one holding only the orientation)
+_KEPT_APP_MARKERS = {0xE0, 0xEE}
+
+_EXIF_HEADER = b"Exif\x00\x00"
+_ORIENTATION_TAG = 0x0112
+
+
+def _exif_orientation(tiff: bytes) -> int | None:
+    """Orientation (2-8) from an EXIF TIFF block, or None if absent or upright."""
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return None
+    try:
+        (ifd,) = struct.unpack(endian + "I", tiff[4:8])
+        (count,) = struct.unpack(endian + "H", tiff[ifd:ifd + 2])
+        for entry in range(ifd + 2, ifd + 2 + 12 * count, 12):
+            tag, kind = struct.unpack(endian + "HH", tiff[entry:entry + 4])
+            if tag == _ORIENTATION_TAG and kind == 3:  # SHORT
+                (value,) = struct.unpack(endian + "H", tiff[entry + 8:entry + 10])
+                return value if 2 <= value <= 8 else None
+    except struct.error:
+        return None
+    return None
+
+
+def _orientation_tiff(orientation: int) -> bytes:
+    """Minimal EXIF TIFF block: IFD0 with only the Orientation tag."""
+    return b"MM\x00\x2a" + struct.pack(">IHHHIHHI", 8, 1, _ORIENTATION_TAG, 3, 1, orientation, 0, 0)
+
+
+def _entropy_end(data: bytes, i: int) -> int:
+    """Offset of the marker that ends the entropy-coded data starting at `i`."""
+    n = len(data)
+    while True:
+        i = data.find(b"\xff", i)
+        if i < 0 or i + 1 >= n:
+            return n
+        marker = data[i + 1]
+        # Stuffed zero bytes, restart markers and fill bytes are part of the scan
+        if marker == 0x00 or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        return i
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG chunks with text, EXIF or timestamps
+_PNG_METADATA_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"eXIf", b"tIME"}
+
+
+def _strip_png_metadata(data: bytes) -> bytes:
+    parts = [_PNG_SIGNATURE]
+    stripped = False
+    i = 8
+    n = len(data)
+    while i + 12 <= n:
+        (length,) = struct.unpack(">I", data[i:i + 4])
+        chunk_type = data[i + 4:i + 8]
+        end = i + 12 + length
+        if chunk_type == b"eXIf" and (orientation := _exif_orientation(data[i + 8:end - 4])):
+            tiff = _orientation_tiff(orientation)
+            chunk = struct.pack(">I", len(tiff)) + b"eXIf" + tiff + struct.pack(">I", zlib.crc32(b"eXIf" + tiff))
+            stripped = stripped or chunk != data[i:end]
+            parts.append(chunk)
+        elif chunk_type in _PNG_METADATA_CHUNKS:
+            stripped = True
+        else:
+            parts.append(data[i:end])
+        i = end
+        if chunk_type == b"IEND":
+            break
+    if not stripped and i >= n:
+        return data
+    return b"".join(parts)
+
+
+def strip_metadata(data: bytes) -> bytes:
+    """
+    The image without EXIF (GPS, device, timestamps), XMP, IPTC or comment
+    metadata, without re-encoding: JPEG segments and PNG chunks carrying
+    metadata are dropped (as is data appended after the image, e.g.
+    multi-picture previews). A rotated photo keeps an EXIF block holding
+    only its Orientation tag, so it still displays upright. Returns `data`
+    itself when there was nothing to remove, or for other formats.
+    """
+    if data[:8] == _PNG_SIGNATURE:
+        return _strip_png_metadata(data)
+    if data[:2] != b"\xff\xd8":
+        return data
+
+    parts = [b"\xff\xd8"]
+    stripped = False
+    i = 2
+    n = len(data)
+    while i + 2 <= n:
+        if data[i] != 0xFF:
+            # Not a marker where one should be: keep the rest as it is
+            return b"".join(parts) + data[i:] if stripped else data
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0xD9 or i + 4 > n:
+            parts.append(data[i:i + 2])
+            i += 2
+            break
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        end = i + 2 + length
+        if marker == 0xDA:
+            end = _entropy_end(data, end)
+            parts.append(data[i:end])
+        elif marker == 0xE1 and data[i + 4:i + 10] == _EXIF_HEADER and (
+            orientation := _exif_orientation(data[i + 10:end])
+        ):
+            tiff = _orientation_tiff(orientation)
+            segment = b"\xff\xe1" + struct.pack(">H", 2 + len(_EXIF_HEADER) + len(tiff)) + _EXIF_HEADER + tiff
+            stripped = stripped or segment != data[i:end]
+            parts.append(segment)
+        elif marker == 0xE2:
+            # APP2 also carries multi-picture (MPF) indexes; keep only ICC profiles
+            if data[i + 4:i + 15] == b"ICC_PROFILE":
+                parts.append(data[i:end])
+            else:
+                stripped = True
+        elif (0xE1 <= marker <= 0xEF and marker not in _KEPT_APP_MARKERS) or marker == 0xFE:
+            stripped = True
+        else:
+            parts.append(data[i:end])
+        i = end
+
+    if not stripped and i >= n:
+        return data
+    return b"".join(parts)
+
+
+def processed_frame(image_bytes: bytes, blurred_bytes: bytes, pii_counts: dict[str, int]) -> bytes | None:
+    """
+    Bytes to store as a frame's processed copy: the blurred image if anything
+    was blurred, else the original without metadata, or None when the
+    original has none to strip and can be copied server-side as is.
+    """
+    if pii_counts["faces"] + pii_counts["plates"]:
+        return blurred_bytes
+    stripped = strip_metadata(image_bytes)
+    return None if stripped is image_bytes else stripped
+
+
+def reduction_factor(
+    size: tuple[int, int] | None,
+    min_long_side: int | None = None,
+    min_short_side: int | None = None,
+) -> int:
+    """Largest of 8, 4, 2 that keeps the image at least the requested size (1 if none does)."""
+    if size is None or (min_long_side is None and min_short_side is None):
+        return 1
+    long_side, short_side = max(size), min(size)
+    for factor in (8, 4, 2):
+        if min_long_side is not None and long_side // factor < min_long_side:
+            continue
+        if min_short_side is not None and short_side // factor < min_short_side:
+            continue
+        return factor
+    return 1
+
+
+def resolution_bucket(long_side: int) -> int:
+    """Power of two at or above `long_side` (at least 256), to group inputs of similar memory cost."""
+    bucket = 256
+    while bucket < long_side:
+        bucket *= 2
+    return bucket
+
+
+def decode(
+    image_bytes: bytes,
+    min_long_side: int | None = None,
+    min_short_side: int | None = None,
+    grayscale: bool = False,
+) -> tuple[Any, int]:
+    """
+    Decode to a BGR (or grayscale) array, reduced in the DCT domain as far
+    as the minimum sizes allow. Non-JPEG input is decoded at full size.
+
+    Returns:
+        Tuple of (image or None if undecodable, factor); multiply
+        coordinates in the decoded image by `factor` for the original
+    """
+    import cv2
+    import numpy as np
+
+    factor = reduction_factor(jpeg_size(image_bytes), min_long_side, min_short_side)
+    if grayscale:
+        flag = {
+            1: cv2.IMREAD_GRAYSCALE,
+            2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+            4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+            8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+        }[factor]
+    else:
+        flag = {
+            1: cv2.IMREAD_COLOR,
+            2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4,
+            8: cv2.IMREAD_REDUCED_COLOR_8,
+        }[factor]
+
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag), factor
+
+
+def open_pil(image_bytes: bytes, min_short_side: int | None = None) -> Any:
+    """RGB PIL image, using libjpeg scaling (Image.draft) when it still covers `min_short_side`."""
+    import io
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    if min_short_side is not None:
+        # draft only ever scales by powers of two and keeps both sides >= the request
+        img.draft('RGB', (min_short_side, min_short_side))
+    return img.convert('RGB')
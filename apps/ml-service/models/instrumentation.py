@@ -0,0 +1,279 @@
+# apps/ml-service/models/instrumentation.py
+"""
+Pipeline Instrumentation
+Context-managed spans with per-stage latency histograms and metric export.
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Generator
+
+
+# Histogram bucket upper bounds in seconds (Prometheus-style, +Inf implied)
+BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Span:
+    """A running span. Stage code may add byte counts before it ends."""
+
+    __slots__ = ("name", "batch_size", "bytes_in", "bytes_out", "error")
+
+    def __init__(self, name: str, batch_size: int, bytes_in: int):
+        self.name = name
+        self.batch_size = batch_size
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.error: str | None = None
+
+
+class _NullSpan:
+    """Shared no-op span used when tracing is disabled."""
+
+    __slots__ = ()
+    name = ""
+    batch_size = 0
+    bytes_in = 0
+    bytes_out = 0
+    error = None
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class StageStats:
+    """Accumulated measurements for one stage name."""
+
+    __slots__ = ("count", "wall_s", "cpu_s", "bytes_in", "bytes_out", "items", "errors", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.items = 0
+        self.errors: dict[str, int] = {}
+        self.buckets = [0] * (len(BUCKETS_S) + 1)
+
+    def observe(self, wall_s: float, cpu_s: float, span: Span) -> None:
+        self.count += 1
+        self.wall_s += wall_s
+        self.cpu_s += cpu_s
+        self.bytes_in += span.bytes_in
+        self.bytes_out += span.bytes_out
+        self.items += span.batch_size
+        self.buckets[bisect.bisect_left(BUCKETS_S, wall_s)] += 1
+        if span.error:
+            self.errors[span.error] = self.errors.get(span.error, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximate quantile (seconds) from the histogram: the bucket upper
+        bound. Past the top bucket it is the top bound, so results stay
+        valid JSON; read it as "at least".
+        """
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_S, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return BUCKETS_S[-1]
+
+
+class Tracer:
+    """
+    Collects spans into per-stage statistics.
+
+    A disabled tracer hands out a shared no-op span, so instrumented code
+    costs one attribute check and a context-manager call per stage.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: dict[str, StageStats] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _record(self, name: str, batch_size: int, bytes_in: int) -> Generator[Span, None, None]:
+        span = Span(name, batch_size, bytes_in)
+        wall_start = time.perf_counter()
+        # CPU time of this thread only: stages run concurrently on
+        # StageGraph threads, and process time would include their siblings
+        cpu_start = time.thread_time()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            wall_s = time.perf_counter() - wall_start
+            cpu_s = time.thread_time() - cpu_start
+            with self._lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = self.stages[name] = StageStats()
+                stats.observe(wall_s, cpu_s, span)
+
+    def span(self, name: str, batch_size: int = 1, bytes_in: int = 0) -> Any:
+        """
+        Time a stage.
+
+        Usage:
+            with tracer.span("detector.infer", batch_size=len(images)) as span:
+                ...
+                span.bytes_out = len(payload)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._record(name, batch_size, bytes_in)
+
+    def error(self, name: str, exc: BaseException) -> None:
+        """Record a failure attributed to a stage without timing it."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.stages.setdefault(name, StageStats())
+            key = type(exc).__name__
+            stats.errors[key] = stats.errors.get(key, 0) + 1
+
+    def summary(self) -> dict[str, Any]:
+        """Per-stage totals and latency histograms for inclusion in results."""
+        stages = {}
+        for name, s in sorted(self.stages.items()):
+            stages[name] = {
+                "count": s.count,
+                "wallMs": round(s.wall_s * 1000, 2),
+                "cpuMs": round(s.cpu_s * 1000, 2),
+                "p50Ms": round(s.quantile(0.5) * 1000, 2),
+                "p95Ms": round(s.quantile(0.95) * 1000, 2),
+                "bytesIn": s.bytes_in,
+                "bytesOut": s.bytes_out,
+                "avgBatchSize": round(s.items / s.count, 2) if s.count else 0,
+                "histogram": {
+                    "boundsMs": [b * 1000 for b in BUCKETS_S],
+                    "counts": list(s.buckets),
+                },
+            }
+            if s.errors:
+                stages[name]["errors"] = dict(s.errors)
+        return {
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages": stages,
+        }
+
+    def to_openmetrics(self, labels: dict[str, str] | None = None, prefix: str = "citypulse_ml") -> str:
+        """Export stage metrics in OpenMetrics text format."""
+        base = ",".join(f'{k}="{v}"' for k, v in sorted((labels or {}).items()))
+
+        def fmt(extra: str) -> str:
+            parts = [p for p in (base, extra) if p]
+            return "{" + ",".join(parts) + "}"
+
+        lines = [
+            f"# TYPE {prefix}_stage_duration_seconds histogram",
+            f"# UNIT {prefix}_stage_duration_seconds seconds",
+        ]
+        for name, s in sorted(self.stages.items()):
+            stage = f'stage="{name}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS_S, s.buckets):
+                cumulative += n
+                le = fmt(f'{stage},le="{bound}"')
+                lines.append(f"{prefix}_stage_duration_seconds_bucket{le} {cumulative}")
+            le = fmt(f'{stage},le="+Inf"')
+            lines.append(f"{prefix}_stage_duration_seconds_bucket{le} {s.count}")
+            lines.append(f"{prefix}_stage_duration_seconds_sum{fmt(stage)} {s.wall_s:.6f}")
+            lines.append(f"{prefix}_stage_duration_seconds_count{fmt(stage)} {s.count}")
+
+        for metric, attr in (
+            ("stage_cpu_seconds", "cpu_s"),
+            ("stage_bytes_in", "bytes_in"),
+            ("stage_bytes_out", "bytes_out"),
+            ("stage_items", "items"),
+        ):
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, s in sorted(self.stages.items()):
+                stage = fmt(f'stage="{name}"')
+                lines.append(f"{prefix}_{metric}_total{stage} {getattr(s, attr)}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def to_otlp(self, attributes: dict[str, str] | None = None, service: str = "citypulse-ml") -> dict[str, Any]:
+        """Export stage latency histograms as an OTLP/HTTP JSON metrics payload."""
+        now_ns = str(time.time_ns())
+
+        def attrs(extra: dict[str, str]) -> list[dict[str, Any]]:
+            merged = {**(attributes or {}), **extra}
+            return [{"key": k, "value": {"stringValue": str(v)}} for k, v in sorted(merged.items())]
+
+        data_points = [
+            {
+                "attributes": attrs({"stage": name}),
+                "timeUnixNano": now_ns,
+                "count": str(s.count),
+                "sum": s.wall_s,
+                "bucketCounts": [str(n) for n in s.buckets],
+                "explicitBounds": list(BUCKETS_S),
+            }
+            for name, s in sorted(self.stages.items())
+        ]
+
+        return {
+            "resourceMetrics": [{
+                "resource": {"attributes": attrs({"service.name": service})},
+                "scopeMetrics": [{
+                    "scope": {"name": "citypulse.ml.instrumentation"},
+                    "metrics": [{
+                        "name": "citypulse.ml.stage.duration",
+                        "unit": "s",
+                        "histogram": {
+                            "aggregationTemporality": 2,  # cumulative
+                            "dataPoints": data_points,
+                        },
+                    }],
+                }],
+            }],
+        }
+
+
+# Process default: enabled unless ML_TRACING=0
+_default_tracer = Tracer(enabled=os.environ.get("ML_TRACING", "1") != "0")
+_current_tracer: ContextVar[Tracer | None] = ContextVar("citypulse_tracer", default=None)
+
+
+def get_tracer() -> Tracer:
+    """The tracer active in this context (see `use_tracer`), else the process default."""
+    return _current_tracer.get() or _default_tracer
+
+
+@contextmanager
+def use_tracer(tracer: Tracer) -> Generator[Tracer, None, None]:
+    """Route spans in this context (e.g. one session) to `tracer`."""
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def span(name: str, batch_size: int = 1, bytes_in: int = 0) -> Any:
+    """Shorthand for `get_tracer().span(...)`."""
+    return get_tracer().span(name, batch_size, bytes_in)
@@ -5,8 +5,15 @@ Extracts text from street signs, shop names, etc.
 """
 
 import modal
+import os
+import shutil
+import tempfile
 from typing import Any
 
+from models.imaging import decode
+from models.instrumentation import get_tracer, span
+from models.startup import LazyModel, lazy_import, warm_pool_size
+
 image = modal.Image.debian_slim(python_version="3.11").apt_install(
     "libgl1-mesa-glx",
     "libglib2.0-0",
@@ -21,27 +28,68 @@ image = modal.Image.debian_slim(python_version="3.11").apt_install(
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
 
 
-@modal.cls(gpu="T4", volumes={"/models": volume}, image=image, timeout=300)
-class TextRecognizer:
-    """PaddleOCR-based text recognition for street scenes."""
+class TextRecognizerRuntime(LazyModel):
+    """In-process PaddleOCR runtime. The OCR engine is built on first use."""
     
-    @modal.enter()
-    def load_model(self):
-        """Load PaddleOCR model."""
-        from paddleocr import PaddleOCR
-        import os
-        
+    component = "ocr"
+    # PaddleOCR's download cache; only det/rec/cls dirs are registered
+    PPOCR_HOME = "/models/paddleocr"
+    # Detection runs at 960 on the long side, but recognition crops come
+    # from the decoded image, so keep extra detail for small sign text
+    INPUT_LONG_SIDE = 1920
+    
+    def __init__(self, weights_path: str | None = None, use_gpu: bool = True, **kwargs: Any):
+        super().__init__(weights_path, **kwargs)
+        self.use_gpu = use_gpu
+    
+    def _load(self) -> Any:
         # Set model cache directory
-        os.environ['PPOCR_HOME'] = '/models/paddleocr'
+        os.environ['PPOCR_HOME'] = self.PPOCR_HOME
+        
+        paddleocr = lazy_import("paddleocr", self.profiler)
+        
+        # A registered OCR artifact is a directory with det/rec/cls inference models
+        model_dirs = {}
+        registered = self._registered_weights()
+        if registered is not None:
+            for kind in ("det", "rec", "cls"):
+                if os.path.isdir(os.path.join(registered, kind)):
+                    model_dirs[f"{kind}_model_dir"] = os.path.join(registered, kind)
+        
+        with self.profiler.phase("load_weights"):
+            engine = paddleocr.PaddleOCR(
+                use_angle_cls=True,
+                lang='en',
+                use_gpu=self.use_gpu,
+                show_log=False,
+                **model_dirs,
+            )
         
-        self.ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang='en',
-            use_gpu=True,
-            show_log=False,
-        )
+        if registered is None:
+            # Fresh volume: register the models PaddleOCR downloaded for later containers
+            with self.profiler.phase("register_weights"):
+                self._register_engine_models(engine)
+            registered = self.registry.resolve(self.component)
+        self.weights_path = registered
+        
+        return engine
+    
+    def _register_engine_models(self, engine: Any) -> None:
+        """Copy the engine's det/rec/cls model dirs into the registry as one artifact."""
+        args = getattr(engine, "args", None)
+        dirs = {kind: getattr(args, f"{kind}_model_dir", None) for kind in ("det", "rec", "cls")}
+        if not all(path and os.path.isdir(path) for path in dirs.values()):
+            return
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for kind, path in dirs.items():
+                shutil.copytree(path, os.path.join(tmp_dir, kind))
+            self.registry.register(self.component, tmp_dir)
+    
+    @property
+    def ocr(self) -> Any:
+        return self.model
     
-    @modal.method()
     def extract_text(self, image_bytes: bytes, min_confidence: float = 0.7) -> list[dict[str, Any]]:
         """
         Extract text from image.
@@ -49,16 +97,15 @@ class TextRecognizer:
         Returns:
             List of text regions with text, confidence, and bounding box
         """
-        import cv2
-        import numpy as np
-        
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with span("ocr.decode", bytes_in=len(image_bytes)):
+            img, factor = decode(image_bytes, min_long_side=self.INPUT_LONG_SIDE)
         
         if img is None:
             return []
         
-        results = self.ocr.ocr(img, cls=True)
+        ocr = self.ocr
+        with span("ocr.infer"):
+            results = ocr.ocr(img, cls=True)
         
         text_regions = []
         if results and results[0]:
@@ -66,9 +113,9 @@ class TextRecognizer:
                 bbox, (text, confidence) = line
                 
                 if confidence >= min_confidence:
-                    # bbox is [[x1,y1], [x2,y1], [x2,y2], [x1,y2]]
-                    x1, y1 = int(bbox[0][0]), int(bbox[0][1])
-                    x2, y2 = int(bbox[2][0]), int(bbox[2][1])
+                    # bbox is [[x1,y1], [x2,y1], [x2,y2], [x1,y2]] in decoded pixels
+                    x1, y1 = int(bbox[0][0] * factor), int(bbox[0][1] * factor)
+                    x2, y2 = int(bbox[2][0] * factor), int(bbox[2][1] * factor)
                     
                     text_regions.append({
                         "text": text,
@@ -79,7 +126,6 @@ class TextRecognizer:
         
         return text_regions
     
-    @modal.method()
     def extract_signs(self, image_bytes: bytes) -> list[dict[str, Any]]:
         """
         Extract text specifically from signs (larger, higher confidence).
@@ -101,7 +147,57 @@ class TextRecognizer:
         
         return signs
     
-    @modal.method()
     def extract_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
         """Extract text from batch of images."""
         return [self.extract_text(img) for img in images]
+    
+    def extract_signs_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
+        """Extract sign text from batch of images."""
+        return [self.extract_signs(img) for img in images]
+
+
+@modal.cls(
+    gpu="T4",
+    volumes={"/models": volume},
+    image=image,
+    timeout=300,
+    keep_warm=warm_pool_size("ocr"),
+)
+class TextRecognizer:
+    """PaddleOCR-based text recognition for street scenes."""
+    
+    @modal.enter()
+    def load_model(self):
+        """Start prefetching OCR models on container startup; the engine loads on first use."""
+        self.runtime = TextRecognizerRuntime()
+        self.runtime.prefetch()
+    
+    @modal.method()
+    def extract_text(self, image_bytes: bytes, min_confidence: float = 0.7) -> list[dict[str, Any]]:
+        """Extract text from image."""
+        return self.runtime.extract_text(image_bytes, min_confidence)
+    
+    @modal.method()
+    def extract_signs(self, image_bytes: bytes) -> list[dict[str, Any]]:
+        """Extract text specifically from signs (larger, higher confidence)."""
+        return self.runtime.extract_signs(image_bytes)
+    
+    @modal.method()
+    def extract_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
+        """Extract text from batch of images."""
+        return self.runtime.extract_batch(images)
+    
+    @modal.method()
+    def extract_signs_batch(self, images: list[bytes]) -> list[list[dict[str, Any]]]:
+        """Extract sign text from batch of images."""
+        return self.runtime.extract_signs_batch(images)
+    
+    @modal.method()
+    def startup_report(self) -> dict[str, Any]:
+        """Per-phase startup timings for this container."""
+        return self.runtime.startup_report()
+    
+    @modal.method()
+    def metrics(self) -> str:
+        """Per-stage latency histograms for this container, in OpenMetrics text format."""
+        return get_tracer().to_openmetrics({"component": "ocr", "version": self.runtime.version})
@@ -0,0 +1,270 @@
+# apps/ml-service/models/records.py
+"""
+Columnar Detection Records
+Compact structured-array storage for detections with class ids, vectorized
+entity counting, Arrow/Parquet serialization and the legacy JSON shape.
+"""
+
+import io
+from typing import Any
+
+import numpy as np
+
+
+# Detection vocabulary. Ids are positions in this tuple and are what gets
+# stored, so only ever append to it.
+CLASS_NAMES = (
+    "car", "motorcycle", "bus", "truck", "bicycle",
+    "person", "traffic light", "stop sign",
+    "fire hydrant", "parking meter", "bench",
+)
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+
+# Session entity buckets and which classes feed them
+ENTITY_BUCKETS = ("vehicles", "pedestrians", "signs", "buildings")
+VEHICLE_CLASSES = {"car", "motorcycle", "bus", "truck"}
+SIGN_CLASSES = {"traffic light", "stop sign"}
+
+
+def _bucket_lookup() -> np.ndarray:
+    lookup = np.full(len(CLASS_NAMES), -1, dtype=np.int8)
+    for name, class_id in CLASS_IDS.items():
+        if name in VEHICLE_CLASSES:
+            lookup[class_id] = ENTITY_BUCKETS.index("vehicles")
+        elif name == "person":
+            lookup[class_id] = ENTITY_BUCKETS.index("pedestrians")
+        elif name in SIGN_CLASSES:
+            lookup[class_id] = ENTITY_BUCKETS.index("signs")
+    return lookup
+
+
+# class id -> entity bucket index (-1: not counted as an entity)
+CLASS_TO_BUCKET = _bucket_lookup()
+
+DETECTION_DTYPE = np.dtype([
+    ("frame", np.uint32),
+    ("class_id", np.uint8),
+    ("confidence", np.float32),
+    ("x1", np.float32),
+    ("y1", np.float32),
+    ("x2", np.float32),
+    ("y2", np.float32),
+    ("track_id", np.int32),  # -1 unless produced by a tracker
+])
+
+
+class DetectionTable:
+    """
+    Detections for one or more frames as a single structured array
+    (29 bytes per box instead of a dict tree per box).
+
+    Rows are ordered by frame. `to_dicts` / `frame_dicts` give the JSON
+    shape returned by `Detector.detect`.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: np.ndarray | None = None):
+        self.data = data if data is not None else np.empty(0, dtype=DETECTION_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getstate__(self) -> bytes:
+        return self.data.tobytes()
+
+    def __setstate__(self, state: bytes) -> None:
+        self.data = np.frombuffer(state, dtype=DETECTION_DTYPE).copy()
+
+    @classmethod
+    def from_arrays(
+        cls,
+        frame: int | np.ndarray,
+        class_ids: np.ndarray,
+        confidences: np.ndarray,
+        boxes: np.ndarray,
+        track_ids: int | np.ndarray = -1,
+    ) -> "DetectionTable":
+        """Build from parallel arrays; `boxes` is (N, 4) x1, y1, x2, y2."""
+        data = np.empty(len(class_ids), dtype=DETECTION_DTYPE)
+        data["frame"] = frame
+        data["class_id"] = class_ids
+        data["confidence"] = confidences
+        data["track_id"] = track_ids
+        if len(data):
+            data["x1"], data["y1"], data["x2"], data["y2"] = np.asarray(boxes, dtype=np.float32).T
+        return cls(data)
+
+    @classmethod
+    def from_dicts(cls, detections: list[dict[str, Any]], frame: int = 0) -> "DetectionTable":
+        """Build from `Detector.detect` dicts, dropping classes outside the vocabulary."""
+        rows = [
+            (frame, CLASS_IDS[d["class"]], d["confidence"],
+             d["bbox"]["x1"], d["bbox"]["y1"], d["bbox"]["x2"], d["bbox"]["y2"],
+             d.get("trackId", -1))
+            for d in detections
+            if d["class"] in CLASS_IDS
+        ]
+        return cls(np.array(rows, dtype=DETECTION_DTYPE))
+
+    @classmethod
+    def concat(cls, tables: list["DetectionTable"]) -> "DetectionTable":
+        if not tables:
+            return cls()
+        return cls(np.concatenate([t.data for t in tables]))
+
+    def with_frame(self, frame: int) -> "DetectionTable":
+        """Copy with every row assigned to `frame` (e.g. a session frame index)."""
+        data = self.data.copy()
+        data["frame"] = frame
+        return DetectionTable(data)
+
+    def for_frame(self, frame: int) -> "DetectionTable":
+        frames = self.data["frame"]
+        start, end = np.searchsorted(frames, [frame, frame + 1])
+        return DetectionTable(self.data[start:end])
+
+    def class_counts(self) -> dict[str, int]:
+        """Detections per class name."""
+        counts = np.bincount(self.data["class_id"], minlength=len(CLASS_NAMES))
+        return {CLASS_NAMES[i]: int(n) for i, n in enumerate(counts) if n}
+
+    def bucket_counts(self) -> np.ndarray:
+        """Detections per entity bucket, aligned with ENTITY_BUCKETS."""
+        buckets = CLASS_TO_BUCKET[self.data["class_id"]]
+        return np.bincount(buckets[buckets >= 0], minlength=len(ENTITY_BUCKETS))
+
+    def entity_counts(self) -> dict[str, int]:
+        return {name: int(n) for name, n in zip(ENTITY_BUCKETS, self.bucket_counts())}
+
+    def to_dicts(self, include_frame: bool = False) -> list[dict[str, Any]]:
+        """
+        Legacy JSON shape: one dict per detection with class, confidence,
+        bbox, center (plus the frame index if `include_frame`, and trackId
+        for tracked rows).
+        """
+        d = self.data
+        class_ids = d["class_id"].tolist()
+        confidences = d["confidence"].tolist()
+        x1, y1, x2, y2 = (d[c].tolist() for c in ("x1", "y1", "x2", "y2"))
+        detections = [
+            {
+                "class": CLASS_NAMES[class_ids[i]],
+                "confidence": round(confidences[i], 3),
+                "bbox": {"x1": int(x1[i]), "y1": int(y1[i]), "x2": int(x2[i]), "y2": int(y2[i])},
+                "center": {"x": int((x1[i] + x2[i]) / 2), "y": int((y1[i] + y2[i]) / 2)},
+            }
+            for i in range(len(d))
+        ]
+        if include_frame:
+            for detection, frame in zip(detections, d["frame"].tolist()):
+                detection["frame"] = frame
+        for detection, track_id in zip(detections, d["track_id"].tolist()):
+            if track_id >= 0:
+                detection["trackId"] = track_id
+        return detections
+
+    def frame_dicts(self, num_frames: int) -> list[list[dict[str, Any]]]:
+        """Legacy JSON shape per frame, for frames 0..num_frames-1."""
+        bounds = np.searchsorted(self.data["frame"], np.arange(num_frames + 1))
+        return [
+            DetectionTable(self.data[start:end]).to_dicts()
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def to_arrow(self) -> Any:
+        """pyarrow Table with a dictionary-encoded class column."""
+        import pyarrow as pa
+
+        columns = {name: pa.array(self.data[name]) for name in DETECTION_DTYPE.names}
+        columns["class"] = pa.DictionaryArray.from_arrays(
+            pa.array(self.data["class_id"].astype(np.int8)),
+            pa.array(CLASS_NAMES),
+        )
+        return pa.table(columns)
+
+    @classmethod
+    def from_arrow(cls, table: Any) -> "DetectionTable":
+        data = np.empty(table.num_rows, dtype=DETECTION_DTYPE)
+        for name in DETECTION_DTYPE.names:
+            if name in table.column_names:
+                data[name] = table.column(name).to_numpy()
+            else:
+                data[name] = -1 if name == "track_id" else 0
+        return cls(data)
+
+    def to_parquet(self) -> bytes:
+        import pyarrow.parquet as pq
+
+        sink = io.BytesIO()
+        pq.write_table(self.to_arrow(), sink, compression="zstd")
+        return sink.getvalue()
+
+    def to_ipc(self) -> bytes:
+        """Arrow IPC stream bytes."""
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "DetectionTable":
+        """Read Parquet or Arrow IPC bytes written by `to_parquet` / `to_ipc`."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if payload[:4] == b"PAR1":
+            return cls.from_arrow(pq.read_table(io.BytesIO(payload)))
+        return cls.from_arrow(pa.ipc.open_stream(payload).read_all())
+
+
+FRAME_DTYPE = np.dtype([
+    ("index", np.uint32),
+    ("detections", np.uint32),
+    ("quality", np.float32),
+])
+
+
+class FrameTable:
+    """
+    Growable columnar store of per-frame records (index, detections,
+    quality) plus their object keys. Capacity doubles as frames are added.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self._data = np.empty(capacity, dtype=FRAME_DTYPE)
+        self.keys: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def append(self, index: int, key: str, detections: int, quality: float) -> None:
+        n = len(self.keys)
+        if n == len(self._data):
+            self._data = np.resize(self._data, max(1, 2 * n))
+        self._data[n] = (index, detections, quality)
+        self.keys.append(key)
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data[:len(self.keys)]
+
+    def to_dicts(self) -> list[dict[str, Any]]:
+        """Legacy `results["frames"]` shape."""
+        d = self.data
+        return [
+            {"index": index, "key": key, "detections": detections, "quality": round(quality, 3)}
+            for index, key, detections, quality in zip(
+                d["index"].tolist(), self.keys, d["detections"].tolist(), d["quality"].tolist(),
+            )
+        ]
+
+    def to_arrow(self) -> Any:
+        import pyarrow as pa
+
+        columns = {name: pa.array(self.data[name]) for name in FRAME_DTYPE.names}
+        columns["key"] = pa.array(self.keys, type=pa.string())
+        return pa.table(columns)
@@ -0,0 +1,230 @@
+# apps/ml-service/models/registry.py
+"""
+Model Weight Registry
+Content-addressed, versioned model artifacts on the shared models volume.
+"""
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Generator
+
+
+class ModelRegistry:
+    """
+    Versioned model weights stored under their content hash.
+
+    Layout on the volume:
+        <root>/blobs/<sha256><suffix>   single-file weights (.pt, .safetensors)
+        <root>/blobs/<sha256>/          directory weights (PaddleOCR det/rec/cls)
+        <root>/manifest.json            name -> active version and known versions
+
+    Blobs are immutable once written, so switching versions only rewrites the
+    manifest, which is replaced atomically.
+    """
+
+    DEFAULT_ROOT = "/models/registry"
+
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.manifest_path = self.root / "manifest.json"
+
+    def _read_manifest(self) -> dict[str, Any]:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"models": {}}
+
+    def _write_manifest(self, manifest: dict[str, Any]) -> None:
+        tmp_path = self.manifest_path.with_suffix(f".tmp.{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextmanager
+    def _locked(self) -> Generator[dict[str, Any], None, None]:
+        """Read-modify-write the manifest under an exclusive lock."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                manifest = self._read_manifest()
+                yield manifest
+                self._write_manifest(manifest)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def content_hash(path: str) -> str:
+        """SHA-256 of a file, or of every file (with relative paths) in a directory."""
+        source = Path(path)
+        digest = hashlib.sha256()
+
+        files = [source] if source.is_file() else sorted(p for p in source.rglob('*') if p.is_file())
+        for file in files:
+            if source.is_dir():
+                digest.update(str(file.relative_to(source)).encode())
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def register(
+        self,
+        name: str,
+        source_path: str,
+        version: str | None = None,
+        activate: bool = True,
+    ) -> dict[str, Any]:
+        """
+        Copy weights into the registry under their content hash.
+
+        Args:
+            name: Model name (e.g. "detector", "classifier", "ocr")
+            source_path: Weight file or directory to register
+            version: Version label (defaults to the first 12 hex chars of the hash)
+            activate: Make this the active version
+
+        Returns:
+            The manifest entry for the registered version
+        """
+        source = Path(source_path)
+        if not source.exists():
+            raise FileNotFoundError(source_path)
+
+        sha256 = self.content_hash(source_path)
+        is_dir = source.is_dir()
+        blob = self.blob_dir / (sha256 if is_dir else f"{sha256}{source.suffix}")
+
+        if not blob.exists():
+            self.blob_dir.mkdir(parents=True, exist_ok=True)
+            tmp_blob = blob.with_name(f".{blob.name}.tmp.{os.getpid()}")
+            if is_dir:
+                shutil.copytree(source, tmp_blob)
+            else:
+                shutil.copyfile(source, tmp_blob)
+            os.replace(tmp_blob, blob)
+
+        entry = {
+            "sha256": sha256,
+            "path": str(blob.relative_to(self.root)),
+            "format": "dir" if is_dir else source.suffix.lstrip('.'),
+            "size": self._size(blob),
+            "registeredAt": int(time.time()),
+        }
+
+        version = version or sha256[:12]
+        with self._locked() as manifest:
+            model = manifest["models"].setdefault(name, {"active": None, "versions": {}})
+            model["versions"][version] = entry
+            if activate or model["active"] is None:
+                model["active"] = version
+
+        return {"version": version, **entry}
+
+    def activate(self, name: str, version: str) -> None:
+        """Atomically switch the active version of a model."""
+        with self._locked() as manifest:
+            model = manifest["models"].get(name)
+            if model is None or version not in model["versions"]:
+                raise KeyError(f"Unknown model version: {name}@{version}")
+            model["active"] = version
+
+    def active_version(self, name: str) -> str | None:
+        """Active version label for a model, or None if unregistered."""
+        model = self._read_manifest()["models"].get(name)
+        return model["active"] if model else None
+
+    def active_versions(self) -> dict[str, str]:
+        """Active version of every registered model."""
+        return {
+            name: model["active"]
+            for name, model in self._read_manifest()["models"].items()
+            if model.get("active")
+        }
+
+    def entry(self, name: str, version: str | None = None) -> dict[str, Any] | None:
+        """Manifest entry for a model version (the active one by default)."""
+        model = self._read_manifest()["models"].get(name)
+        if model is None:
+            return None
+        version = version or model["active"]
+        entry = model["versions"].get(version)
+        return {"version": version, **entry} if entry else None
+
+    def resolve(self, name: str, version: str | None = None) -> str | None:
+        """Filesystem path of a model's weights, or None if unregistered."""
+        entry = self.entry(name, version)
+        return str(self.root / entry["path"]) if entry else None
+
+    def verify(self, name: str, version: str | None = None) -> bool:
+        """Check that a stored blob still matches its content hash."""
+        entry = self.entry(name, version)
+        if entry is None:
+            return False
+        path = self.root / entry["path"]
+        return path.exists() and self.content_hash(str(path)) == entry["sha256"]
+
+    def cache_namespace(self, names: list[str] | None = None) -> str:
+        """
+        Short key identifying the active model versions.
+
+        Result caches should include this in their keys so that activating a
+        new version invalidates results computed with the old weights.
+        """
+        versions = self.active_versions()
+        if names is not None:
+            versions = {name: versions.get(name, "unregistered") for name in names}
+        payload = json.dumps(versions, sort_keys=True).encode()
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+    def open_mmap(self, name: str, version: str | None = None) -> mmap.mmap:
+        """Map a single-file blob read-only; the caller closes the map."""
+        path = self.resolve(name, version)
+        if path is None:
+            raise KeyError(f"Model not registered: {name}")
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load_state_dict(self, name: str, version: str | None = None) -> dict[str, Any]:
+        """
+        Load a torch state dict without copying it into process memory.
+
+        See `load_state_dict_file`.
+        """
+        path = self.resolve(name, version)
+        if path is None:
+            raise KeyError(f"Model not registered: {name}")
+        return load_state_dict_file(path)
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        if path.is_file():
+            return path.stat().st_size
+        return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+
+
+def load_state_dict_file(path: str) -> dict[str, Any]:
+    """
+    Load a torch state dict backed by a memory-mapped file.
+
+    safetensors files are memory-mapped by safetensors itself; pickled .pt/.pth
+    files go through torch.load(mmap=True).
+    """
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+
+    import torch
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
@@ -0,0 +1,207 @@
+# apps/ml-service/models/startup.py
+"""
+Container Startup Utilities
+Lazy model loading, memory-mapped weight prefetch and per-phase startup timings.
+"""
+
+import importlib
+import mmap
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Generator
+
+from models.registry import ModelRegistry
+
+
+class StartupProfiler:
+    """Record the wall-clock duration of each container startup phase."""
+
+    def __init__(self, component: str):
+        self.component = component
+        self.created_at = time.time()
+        self.phases: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        """Time a startup phase. Repeated phases accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def report(self) -> dict[str, Any]:
+        """Startup timings in milliseconds, in the order phases ran."""
+        phases = {name: round(ms, 1) for name, ms in self.phases.items()}
+        return {
+            "component": self.component,
+            "phases": phases,
+            "totalMs": round(sum(self.phases.values()), 1),
+        }
+
+
+def lazy_import(module_name: str, profiler: StartupProfiler | None = None) -> ModuleType:
+    """
+    Import a heavy dependency (torch, ultralytics, paddleocr) on first use.
+
+    The import is timed as an `import:<module>` phase when a profiler is given.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    if profiler is None:
+        return importlib.import_module(module_name)
+
+    with profiler.phase(f"import:{module_name}"):
+        return importlib.import_module(module_name)
+
+
+def prefetch_weights(path: str) -> int:
+    """
+    Map weight files into memory and fault their pages in.
+
+    Reading through mmap pulls the files from the models volume into the page
+    cache, so the framework loader that opens them afterwards reads from RAM.
+    Directories (e.g. PaddleOCR model dirs) are prefetched recursively.
+
+    Returns:
+        Number of bytes prefetched
+    """
+    root = Path(path)
+    if not root.exists():
+        return 0
+
+    files = [root] if root.is_file() else sorted(p for p in root.rglob('*') if p.is_file())
+
+    total = 0
+    for file in files:
+        size = file.stat().st_size
+        if size == 0:
+            continue
+
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_WILLNEED)
+            # Touch one byte per page so the volume is read now, not on first inference
+            for offset in range(0, size, mmap.PAGESIZE):
+                mm[offset]
+
+        total += size
+
+    return total
+
+
+def warm_pool_size(component: str) -> int:
+    """
+    Number of warm containers Modal keeps for a component.
+
+    Read at deploy time from ML_KEEP_WARM_<COMPONENT>, falling back to
+    ML_KEEP_WARM. Defaults to 0 (scale to zero).
+    """
+    value = os.environ.get(f"ML_KEEP_WARM_{component.upper()}", os.environ.get("ML_KEEP_WARM", "0"))
+    return max(0, int(value))
+
+
+class LazyModel:
+    """
+    Base class for in-process model runtimes.
+
+    Construction is cheap: `prefetch()` starts reading weights from the volume
+    in a background thread, and the framework model is only imported and built
+    by `_load()` the first time `model` is accessed.
+
+    Weights are resolved through the model registry under the runtime's
+    `component` name; WEIGHTS_PATH is the pre-registry location, adopted into
+    the registry the first time it is seen. Registered blobs are checked
+    against their content hash before they are loaded.
+    """
+
+    component = "model"
+    WEIGHTS_PATH: str | None = None
+
+    def __init__(self, weights_path: str | None = None, registry: ModelRegistry | None = None):
+        self.registry = registry or ModelRegistry()
+        # An explicit path pins the weights and bypasses the registry
+        self._pinned_weights = weights_path
+        self.weights_path = weights_path or self.registry.resolve(self.component) or self.WEIGHTS_PATH
+        self.profiler = StartupProfiler(self.component)
+        self._model: Any = None
+        self._load_lock = threading.Lock()
+        self._prefetch_thread: threading.Thread | None = None
+        self._prefetched_bytes = 0
+
+    def prefetch(self) -> None:
+        """Start prefetching weights into the page cache without blocking."""
+        if not self.weights_path or self._prefetch_thread is not None:
+            return
+
+        def run() -> None:
+            with self.profiler.phase("prefetch_weights"):
+                self._prefetched_bytes = prefetch_weights(self.weights_path)
+
+        self._prefetch_thread = threading.Thread(target=run, name=f"{self.component}-prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self) -> Any:
+        """The framework model, built on first access."""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    if self._prefetch_thread is not None:
+                        with self.profiler.phase("wait_prefetch"):
+                            self._prefetch_thread.join()
+                    self._model = self._load()
+        return self._model
+
+    def _load(self) -> Any:
+        raise NotImplementedError
+
+    def _registered_weights(self) -> str | None:
+        """Path of the active registered weights, adopting legacy weights on first sight."""
+        if self._pinned_weights is not None:
+            return self._pinned_weights
+
+        entry = self.registry.entry(self.component)
+        if entry is None:
+            if self.WEIGHTS_PATH and os.path.exists(self.WEIGHTS_PATH):
+                with self.profiler.phase("register_weights"):
+                    self.registry.register(self.component, self.WEIGHTS_PATH)
+            return self.registry.resolve(self.component)
+
+        self._verify_weights(entry["version"])
+        return self.registry.resolve(self.component, entry["version"])
+
+    def _verify_weights(self, version: str) -> None:
+        """Refuse to load a registered blob that no longer matches its content hash."""
+        with self.profiler.phase("verify_weights"):
+            if not self.registry.verify(self.component, version):
+                raise RuntimeError(f"Registered weights failed verification: {self.component}@{version}")
+
+    @property
+    def version(self) -> str:
+        """Active registry version of this model, for result cache keys."""
+        if self._pinned_weights is not None:
+            return "pinned"
+        return self.registry.active_version(self.component) or "unregistered"
+
+    def startup_report(self) -> dict[str, Any]:
+        """Per-phase startup timings for this runtime."""
+        return {
+            **self.profiler.report(),
+            "version": self.version,
+            "loaded": self.loaded,
+            "prefetchedBytes": self._prefetched_bytes,
+        }
@@ -1,10 +1,39 @@
 # apps/ml-service/pipelines/__init__.py
 from .process_session import process_session, process_session_endpoint
-from .process_frame import process_frame, process_frame_endpoint
+from .process_frame import process_frame, process_frame_endpoint, process_frame_batch
+from .process_video import process_video, process_video_endpoint
+from .timelapse import build_timelapse, build_timelapse_endpoint
+from .jobs import submit_session_job, session_job_status, cancel_session_job
+from .backfill import backfill_sessions
+from .similarity import find_similar_scenes
+from .batching import BatchPolicy, MicroBatcher
+from .scheduling import Lane, PriorityScheduler
+from .gateway import InferenceGateway, run_stage
+from .stages import Stage, StageGraph
+from .callbacks import deliver_callback
 
 __all__ = [
     "process_session",
     "process_session_endpoint",
     "process_frame",
     "process_frame_endpoint",
+    "process_frame_batch",
+    "process_video",
+    "process_video_endpoint",
+    "build_timelapse",
+    "build_timelapse_endpoint",
+    "submit_session_job",
+    "session_job_status",
+    "cancel_session_job",
+    "backfill_sessions",
+    "find_similar_scenes",
+    "BatchPolicy",
+    "MicroBatcher",
+    "Lane",
+    "PriorityScheduler",
+    "InferenceGateway",
+    "run_stage",
+    "Stage",
+    "StageGraph",
+    "deliver_callback",
 ]
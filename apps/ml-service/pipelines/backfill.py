@@ -0,0 +1,321 @@
+# apps/ml-service/pipelines/backfill.py
+"""
+Cross-Session Backfill
+Reprocesses many sessions by packing their frames into full model batches,
+routing results back to per-session aggregates, with a resumable manifest.
+"""
+
+import json
+import time
+import modal
+from concurrent.futures import Future, wait
+from typing import Any, Generator, Iterable
+
+from models.imaging import processed_frame
+from models.instrumentation import Tracer
+from pipelines.progress import SessionAggregator, attach_detections
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "boto3",
+    "httpx",
+    "numpy",
+    "pyarrow",
+)
+
+PHOTO_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
+
+class BackfillManifest:
+    """
+    Per-session status of a backfill, stored as JSON at
+    backfills/<id>/manifest.json.
+
+    Sessions are "pending" until their results are stored, then "done" (or
+    "failed"); a resumed backfill skips done sessions and reprocesses the
+    rest from their first frame.
+    """
+
+    def __init__(self, backfill_id: str, storage: Any, min_save_interval_s: float = 10.0):
+        self.backfill_id = backfill_id
+        self.storage = storage
+        self.key = f"backfills/{backfill_id}/manifest.json"
+        self.min_save_interval_s = min_save_interval_s
+        self.sessions: dict[str, dict[str, Any]] = {}
+        self.created_at = int(time.time() * 1000)
+        self._last_saved = 0.0
+
+    def load(self) -> bool:
+        """Read the stored manifest; False if there is none yet."""
+        if not self.storage.object_exists(self.key):
+            return False
+        stored = json.loads(self.storage.download_bytes(self.key))
+        self.sessions = stored["sessions"]
+        self.created_at = stored.get("createdAt", self.created_at)
+        return True
+
+    def add(self, session_ids: Iterable[str]) -> None:
+        for session_id in session_ids:
+            self.sessions.setdefault(session_id, {"status": "pending"})
+
+    def pending(self) -> list[str]:
+        return [sid for sid, entry in self.sessions.items() if entry["status"] != "done"]
+
+    def mark(self, session_id: str, status: str, **fields: Any) -> None:
+        self.sessions[session_id] = {"status": status, **fields, "updatedAt": int(time.time() * 1000)}
+        self.save()
+
+    def counts(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for entry in self.sessions.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def save(self, force: bool = False) -> None:
+        """Store the manifest, at most every `min_save_interval_s` unless forced."""
+        now = time.monotonic()
+        if not force and now - self._last_saved < self.min_save_interval_s:
+            return
+        self._last_saved = now
+        body = {
+            "backfillId": self.backfill_id,
+            "createdAt": self.created_at,
+            "updatedAt": int(time.time() * 1000),
+            "counts": self.counts(),
+            "sessions": self.sessions,
+        }
+        self.storage.upload_bytes(self.key, json.dumps(body).encode(), 'application/json')
+
+
+def _session_frames(storage: Any, session_ids: list[str] | None, prefix: str | None) -> dict[str, list[str]]:
+    """Photo keys per session, from explicit session IDs or every session under a prefix."""
+    frames: dict[str, list[str]] = {}
+    if prefix is not None:
+        for key in storage.list_objects(prefix, extensions=PHOTO_EXTENSIONS):
+            parts = key.split('/')
+            # sessions/<id>/photos/<name>
+            if len(parts) >= 4 and parts[0] == "sessions" and parts[2] == "photos":
+                frames.setdefault(parts[1], []).append(key)
+    for session_id in session_ids or []:
+        if session_id not in frames:
+            frames[session_id] = list(storage.list_objects(f"sessions/{session_id}/photos/", extensions=PHOTO_EXTENSIONS))
+    return frames
+
+
+def pack_batches(
+    frames: Iterable[tuple[str, int, str, bytes]],
+    batch_size: int,
+) -> Generator[list[tuple[str, int, str, bytes]], None, None]:
+    """Group (session_id, index, key, bytes) frames into full batches regardless of session boundaries."""
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@modal.function(
+    timeout=86400,
+    image=image,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+def backfill_sessions(
+    backfill_id: str,
+    session_ids: list[str] | None = None,
+    prefix: str | None = None,
+    batch_size: int = 32,
+    max_inflight_batches: int = 3,
+    detections_format: str = "parquet",
+) -> dict[str, Any]:
+    """
+    Reprocess sessions with frames from many sessions packed into full
+    model batches.
+
+    Each session's results (the process_session aggregates, without
+    per-frame records) are stored at sessions/<id>/results/session.json,
+    with its detections table and processed images as in process_session.
+    Calling again with the same `backfill_id` resumes from the manifest.
+
+    Args:
+        backfill_id: Names the manifest; reuse it to resume
+        session_ids: Sessions to reprocess
+        prefix: Reprocess every session with photos under this key prefix
+            (e.g. "sessions/"); combined with `session_ids` if both are given
+        batch_size: Frames per packed batch; the gateway's bulk lane
+            forms the model batches from them
+        max_inflight_batches: Batches being processed at once, so model
+            stages overlap and downloads run ahead
+        detections_format: As in process_session ("parquet", "arrow", "json", "none")
+
+    Returns:
+        Session counts by status, frame and batch totals and throughput
+    """
+    from models.registry import ModelRegistry
+    from pipelines.gateway import run_stage
+    from pipelines.stages import StageGraph
+    from utils.storage import get_storage
+    from utils.video import prefetch
+
+    storage = get_storage()
+    model_versions = ModelRegistry().active_versions()
+    tracer = Tracer()
+
+    manifest = BackfillManifest(backfill_id, storage)
+    resumed = manifest.load()
+    session_frames = _session_frames(storage, session_ids, prefix) if (session_ids or prefix) else {}
+    manifest.add(session_frames)
+    todo = manifest.pending()
+    for session_id in todo:
+        if session_id not in session_frames:
+            session_frames[session_id] = list(storage.list_objects(
+                f"sessions/{session_id}/photos/", extensions=PHOTO_EXTENSIONS,
+            ))
+    manifest.save(force=True)
+
+    aggregators: dict[str, SessionAggregator] = {}
+    remaining: dict[str, int] = {}
+    uploads: dict[str, list[Future]] = {}
+
+    def finish_session(session_id: str) -> None:
+        aggregator = aggregators.pop(session_id)
+        results = {**aggregator.results(), "modelVersions": model_versions, "backfillId": backfill_id}
+        prefix_key = f"sessions/{session_id}/results"
+        attach_detections(results, aggregator.detections(), detections_format, prefix_key, storage.upload_bytes)
+
+        done, _ = wait(uploads.pop(session_id, []))
+        upload_errors = [f.exception() for f in done if f.exception() is not None]
+        if upload_errors:
+            results["uploadErrors"] = len(upload_errors)
+            print(f"{len(upload_errors)} uploads failed for session {session_id}: {upload_errors[0]}")
+
+        try:
+            storage.upload_bytes(f"{prefix_key}/session.json", json.dumps(results).encode(), 'application/json')
+            manifest.mark(
+                session_id,
+                "failed" if upload_errors else "done",
+                frames=aggregator.processed,
+                failedFrames=aggregator.failed,
+                resultsKey=f"{prefix_key}/session.json",
+            )
+        except Exception as e:
+            print(f"Results upload failed for session {session_id}: {e}")
+            manifest.mark(session_id, "failed", error=str(e))
+
+    for session_id in todo:
+        keys = session_frames[session_id]
+        aggregators[session_id] = SessionAggregator(session_id, keep_records=False)
+        remaining[session_id] = len(keys)
+        if not keys:
+            finish_session(session_id)
+
+    def download(frame: tuple[str, int, str]) -> tuple[str, int, str, bytes | None]:
+        session_id, index, key = frame
+        try:
+            with tracer.span("s3.download") as stage:
+                data = storage.download_bytes(key)
+                stage.bytes_out = len(data)
+        except Exception as e:
+            tracer.error("frame", e)
+            print(f"Error downloading {key}: {e}")
+            data = None
+        return session_id, index, key, data
+
+    def frame_done(session_id: str) -> None:
+        remaining[session_id] -= 1
+        if remaining[session_id] == 0:
+            finish_session(session_id)
+
+    def downloaded(frames: Iterable[tuple[str, int, str, bytes | None]]) -> Generator[tuple[str, int, str, bytes], None, None]:
+        for session_id, index, key, data in frames:
+            if data is None:
+                aggregators[session_id].add_failure()
+                frame_done(session_id)
+            else:
+                yield session_id, index, key, data
+
+    # Detection, OCR, classification and quality of a blurred batch run
+    # concurrently, on one pool shared by the in-flight batches
+    def timed(name: str, model_stage: str) -> Any:
+        def run(processed: list[bytes]) -> Any:
+            with tracer.span(name, batch_size=len(processed)):
+                return run_stage(model_stage, processed, "bulk", backfill_id)
+        return run
+
+    graph = StageGraph(max_workers=4 * max_inflight_batches)
+    for name, model_stage in (("detect", "detect"), ("ocr", "signs"), ("classify", "classify"), ("quality", "quality")):
+        graph.add(name, timed(name, model_stage), inputs=("processed",))
+
+    def run_batch(batch: list[tuple[str, int, str, bytes]]) -> tuple[list, Any]:
+        images = [data for _, _, _, data in batch]
+        try:
+            with tracer.span("blur", batch_size=len(images), bytes_in=sum(map(len, images))):
+                blurred = run_stage("blur", images, "bulk", backfill_id)
+            processed = [blurred_bytes for blurred_bytes, _ in blurred]
+            outputs = graph.run({"processed": processed})
+            tables, signs, scenes, qualities = (outputs[name] for name in ("detect", "ocr", "classify", "quality"))
+            return batch, (blurred, tables, signs, scenes, qualities)
+        except Exception as e:
+            tracer.error("batch", e)
+            return batch, e
+
+    frames = (
+        (session_id, index, key)
+        for session_id in todo
+        for index, key in enumerate(session_frames[session_id])
+    )
+    batches = pack_batches(downloaded(prefetch(download, frames, depth=batch_size)), batch_size)
+
+    started = time.perf_counter()
+    total_frames = 0
+    total_batches = 0
+
+    # Batches complete in submission order, so sessions finish in order too
+    for batch, outputs in prefetch(run_batch, batches, depth=max_inflight_batches):
+        total_batches += 1
+        total_frames += len(batch)
+
+        for position, (session_id, index, key, data) in enumerate(batch):
+            aggregator = aggregators[session_id]
+            if isinstance(outputs, Exception):
+                aggregator.add_failure()
+            else:
+                blurred, tables, signs, scenes, qualities = outputs
+                blurred_bytes, pii_counts = blurred[position]
+                detections = tables[position]
+
+                # Frames with nothing blurred are copied server-side unless
+                # they carry metadata (EXIF GPS, device) to strip
+                processed_key = key.replace('/photos/', '/processed/')
+                uploads.setdefault(session_id, []).append(storage.submit(
+                    storage.store_processed, key, processed_key,
+                    processed_frame(data, blurred_bytes, pii_counts), 'image/jpeg',
+                ))
+
+                record = {
+                    "index": index,
+                    "key": processed_key,
+                    "detections": len(detections),
+                    "quality": qualities[position]["quality"],
+                }
+                aggregator.add_frame(record, detections, signs[position], scenes[position], qualities[position], pii_counts)
+
+            frame_done(session_id)
+
+    graph.close()
+    storage.wait()
+    manifest.save(force=True)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "backfillId": backfill_id,
+        "resumed": resumed,
+        "manifestKey": manifest.key,
+        "sessions": manifest.counts(),
+        "frames": total_frames,
+        "batches": total_batches,
+        "avgBatchSize": round(total_frames / total_batches, 2) if total_batches else 0,
+        "framesPerSecond": round(total_frames / elapsed, 2) if elapsed > 0 else None,
+        "timings": tracer.summary(),
+    }
@@ -0,0 +1,162 @@
+# apps/ml-service/pipelines/batching.py
+"""
+Dynamic Micro-Batching
+Collects concurrent requests into shared GPU batches and fans results back out.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+
+@dataclass
+class BatchPolicy:
+    """
+    Micro-batching limits.
+
+    Attributes:
+        max_batch_size: Largest batch sent to the models
+        max_wait_ms: Longest a request waits for the batch to fill
+        target_p99_ms: Tail-latency target. When set, the wait window shrinks
+            while observed p99 exceeds it and recovers when latency is well below
+        max_inflight_batches: Batches allowed to run while the next one fills
+    """
+
+    max_batch_size: int = 8
+    max_wait_ms: float = 10.0
+    target_p99_ms: float | None = None
+    max_inflight_batches: int = 2
+
+    @classmethod
+    def from_env(cls, prefix: str = "FRAME_BATCH") -> "BatchPolicy":
+        """Build a policy from <PREFIX>_MAX_SIZE, _MAX_WAIT_MS, _TARGET_P99_MS, _MAX_INFLIGHT."""
+        target = os.environ.get(f"{prefix}_TARGET_P99_MS")
+        return cls(
+            max_batch_size=int(os.environ.get(f"{prefix}_MAX_SIZE", cls.max_batch_size)),
+            max_wait_ms=float(os.environ.get(f"{prefix}_MAX_WAIT_MS", cls.max_wait_ms)),
+            target_p99_ms=float(target) if target else None,
+            max_inflight_batches=int(os.environ.get(f"{prefix}_MAX_INFLIGHT", cls.max_inflight_batches)),
+        )
+
+
+class MicroBatcher:
+    """
+    Asyncio micro-batching scheduler.
+
+    Callers `await submit(item)`; items with the same key that arrive within
+    the wait window (up to max_batch_size) are passed to `batch_fn` together,
+    and each caller receives its own element of the returned list. If the
+    batch raises, every caller in that batch receives the exception.
+    """
+
+    LATENCY_WINDOW = 512
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Hashable, list[Any]], Awaitable[list[Any]]],
+        policy: BatchPolicy | None = None,
+    ):
+        self.batch_fn = batch_fn
+        self.policy = policy or BatchPolicy()
+        self.wait_ms = self.policy.max_wait_ms
+
+        self._queues: dict[Hashable, asyncio.Queue] = {}
+        self._workers: dict[Hashable, asyncio.Task] = {}
+        self._inflight: asyncio.Semaphore | None = None
+        self._running: set[asyncio.Task] = set()
+        self._latencies_ms: deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+        self._batch_sizes: deque[int] = deque(maxlen=self.LATENCY_WINDOW)
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        """Queue an item and wait for its result."""
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.policy.max_inflight_batches)
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._collect(key, queue))
+
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, key: Hashable, queue: asyncio.Queue) -> None:
+        """Form batches for one key until cancelled."""
+        while True:
+            batch = [await queue.get()]
+            deadline = time.perf_counter() + self.wait_ms / 1000
+
+            while len(batch) < self.policy.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._inflight.acquire()
+            task = asyncio.create_task(self._run(key, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: list[tuple[Any, asyncio.Future, float]]) -> None:
+        try:
+            results = await self.batch_fn(key, [item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} items")
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._inflight.release()
+            now = time.perf_counter()
+            self._latencies_ms.extend((now - enqueued) * 1000 for _, _, enqueued in batch)
+            self._batch_sizes.append(len(batch))
+            self._adapt_wait()
+
+    def _adapt_wait(self) -> None:
+        """Trade batch fill for latency when p99 drifts past the target."""
+        target = self.policy.target_p99_ms
+        if target is None or len(self._latencies_ms) < 20:
+            return
+
+        p99 = self._percentile(99)
+        if p99 > target:
+            self.wait_ms = self.wait_ms * 0.8
+        elif p99 < target * 0.5:
+            self.wait_ms = min(self.policy.max_wait_ms, max(self.wait_ms, 0.5) * 1.25)
+
+    def _percentile(self, pct: float) -> float:
+        values = sorted(self._latencies_ms)
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[index]
+
+    def stats(self) -> dict[str, Any]:
+        """Recent latency percentiles, average batch size and current wait window."""
+        sizes = self._batch_sizes
+        return {
+            "p50Ms": round(self._percentile(50), 1),
+            "p95Ms": round(self._percentile(95), 1),
+            "p99Ms": round(self._percentile(99), 1),
+            "avgBatchSize": round(sum(sizes) / len(sizes), 2) if sizes else 0,
+            "waitMs": round(self.wait_ms, 2),
+        }
+
+    async def close(self) -> None:
+        """Stop the collector tasks."""
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
@@ -0,0 +1,37 @@
+# apps/ml-service/pipelines/callbacks.py
+"""
+Webhook Delivery
+Posts pipeline results to API callbacks off the GPU containers.
+"""
+
+import modal
+from typing import Any
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "boto3",
+    "httpx",
+)
+
+
+@modal.function(image=image, timeout=600)
+def deliver_callback(
+    callback_url: str,
+    payload: dict[str, Any],
+    max_attempts: int = 5,
+) -> bool:
+    """
+    Deliver a webhook with retry and exponential backoff.
+
+    Runs on a CPU container so GPU pipelines can `.spawn()` it and return
+    immediately instead of waiting on the API.
+    """
+    import asyncio
+    from utils.http import close_client, post_with_retry
+
+    async def deliver() -> bool:
+        try:
+            return await post_with_retry(callback_url, payload, max_attempts=max_attempts)
+        finally:
+            await close_client()
+
+    return asyncio.run(deliver())
@@ -0,0 +1,123 @@
+# apps/ml-service/pipelines/gateway.py
+"""
+Inference Gateway
+Single scheduling point in front of the model classes: pipelines submit
+per-frame stage work with a lane and tenant, and the gateway forms the
+model batches (see PriorityScheduler).
+"""
+
+import os
+import modal
+from typing import Any
+
+from pipelines.scheduling import PriorityScheduler
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "numpy",
+    "pyarrow",
+)
+
+# Stage -> (model class module, class name, batch method)
+STAGES = {
+    "blur": ("models.blur", "PrivacyBlur", "blur_batch"),
+    "detect": ("models.detector", "Detector", "detect_columnar"),
+    "ocr": ("models.ocr", "TextRecognizer", "extract_batch"),
+    "signs": ("models.ocr", "TextRecognizer", "extract_signs_batch"),
+    "classify": ("models.classifier", "SceneClassifier", "classify_batch"),
+    "embed": ("models.classifier", "SceneClassifier", "classify_embed_batch"),
+    "quality": ("models.classifier", "SceneClassifier", "get_scene_quality_batch"),
+}
+
+# Stages that can run on CPU containers instead; CPU_STAGES (e.g.
+# "blur,quality") selects which ones do. The OpenCV-only stages need no
+# weights; the model stages run on shared-weight forked workers
+CPU_STAGES = {
+    "blur": ("models.cpu_pool", "CpuWorker", "blur_batch"),
+    "quality": ("models.cpu_pool", "CpuWorker", "get_scene_quality_batch"),
+    "detect": ("models.cpu_pool", "CpuInferenceWorker", "detect_columnar"),
+    "ocr": ("models.cpu_pool", "CpuInferenceWorker", "extract_batch"),
+    "signs": ("models.cpu_pool", "CpuInferenceWorker", "extract_signs_batch"),
+    "classify": ("models.cpu_pool", "CpuInferenceWorker", "classify_batch"),
+    "embed": ("models.cpu_pool", "CpuInferenceWorker", "classify_embed_batch"),
+}
+
+
+def _cpu_stages() -> set[str]:
+    return {s.strip() for s in os.environ.get("CPU_STAGES", "").split(",") if s.strip() in CPU_STAGES}
+
+
+def _stage_method(stage: str) -> Any:
+    import importlib
+
+    module, cls, method = CPU_STAGES[stage] if stage in _cpu_stages() else STAGES[stage]
+    return getattr(getattr(importlib.import_module(module), cls)(), method)
+
+
+def _split(stage: str, output: Any, n: int) -> list[Any]:
+    """Per-image results; the detector returns one table for the whole batch."""
+    if stage == "detect":
+        return [output.for_frame(i).with_frame(0) for i in range(n)]
+    return output
+
+
+@modal.cls(
+    image=image,
+    timeout=3600,
+    allow_concurrent_inputs=512,
+    keep_warm=1,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+class InferenceGateway:
+    """Schedules model work from all pipelines by lane, tenant and deadline."""
+
+    @modal.enter()
+    def start(self):
+        self.scheduler = PriorityScheduler(
+            self._run_batch,
+            max_inflight=int(os.environ.get("GATEWAY_MAX_INFLIGHT", 4)),
+        )
+
+    async def _run_batch(self, stage: str, images: list[bytes]) -> list[Any]:
+        output = await _stage_method(stage).remote.aio(images)
+        return _split(stage, output, len(images))
+
+    @modal.method()
+    async def infer(
+        self,
+        stage: str,
+        images: list[bytes],
+        lane: str = "bulk",
+        tenant: str | None = None,
+        deadline_ms: float | None = None,
+    ) -> list[Any]:
+        """Run a stage over images, each scheduled (and batched with other callers) on its own."""
+        import asyncio
+
+        return await asyncio.gather(*(
+            self.scheduler.submit(image_bytes, key=stage, lane=lane, tenant=tenant, deadline_ms=deadline_ms)
+            for image_bytes in images
+        ))
+
+    @modal.method()
+    def stats(self) -> dict[str, Any]:
+        """Per-lane latency, batch size, queue depth and deadline misses."""
+        return self.scheduler.stats()
+
+
+def run_stage(
+    stage: str,
+    images: list[bytes],
+    lane: str = "bulk",
+    tenant: str | None = None,
+    deadline_ms: float | None = None,
+    direct: bool = False,
+) -> list[Any]:
+    """
+    One result per image for a model stage (see STAGES). Goes through the
+    InferenceGateway unless `direct` is set (for callers that have already
+    batched the images) or INFERENCE_GATEWAY=0; both call the model class
+    directly with the images as one batch.
+    """
+    if direct or os.environ.get("INFERENCE_GATEWAY", "1") == "0":
+        return _split(stage, _stage_method(stage).remote(images), len(images))
+    return InferenceGateway().infer.remote(stage, images, lane, tenant, deadline_ms)
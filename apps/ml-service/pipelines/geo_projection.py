@@ -0,0 +1,321 @@
+# apps/ml-service/pipelines/geo_projection.py
+"""
+Detection Geo-Projection
+Estimates where detected objects are in the world from the frame's GPS fix,
+heading and the box position, and merges repeated sightings of the same
+object into map entities. Everything runs on whole-session arrays.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from models.records import CLASS_NAMES, DetectionTable
+from utils.geo import GeoUtils
+
+# Typical real-world height of each class in metres; range is estimated
+# from how tall the box is against this
+OBJECT_HEIGHTS_M = {
+    "car": 1.5,
+    "motorcycle": 1.2,
+    "bus": 3.0,
+    "truck": 3.0,
+    "bicycle": 1.1,
+    "person": 1.7,
+    "traffic light": 1.0,
+    "stop sign": 0.75,
+    "fire hydrant": 0.8,
+    "parking meter": 1.4,
+    "bench": 0.8,
+}
+
+_HEIGHTS_M = np.array([OBJECT_HEIGHTS_M[name] for name in CLASS_NAMES])
+
+
+@dataclass
+class CameraModel:
+    """
+    Pinhole camera facing along the direction of travel.
+
+    Attributes:
+        horizontal_fov_deg: Horizontal field of view (phone main cameras
+            are roughly 65-75 degrees in landscape)
+        heading_offset_deg: Camera direction relative to travel (e.g. 90
+            for a side-facing mount)
+        min_distance_m: Closest range an estimate is clamped to
+        max_distance_m: Furthest range; beyond it box heights are too
+            small to trust
+    """
+
+    horizontal_fov_deg: float = 70.0
+    heading_offset_deg: float = 0.0
+    min_distance_m: float = 2.0
+    max_distance_m: float = 60.0
+
+
+class FramePoses:
+    """
+    Position, heading and image size per frame of a session, collected as
+    frames are processed. Headings not given are taken from the GPS track
+    (`GeoUtils.bearing` between consecutive fixes).
+    """
+
+    def __init__(self):
+        self._frames: list[int] = []
+        self._lats: list[float] = []
+        self._lons: list[float] = []
+        self._headings: list[float] = []
+        self._widths: list[int] = []
+        self._heights: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def add(
+        self,
+        frame: int,
+        location: tuple[float, float],
+        image_size: tuple[int, int],
+        heading: float | None = None,
+    ) -> None:
+        self._frames.append(frame)
+        self._lats.append(location[0])
+        self._lons.append(location[1])
+        self._headings.append(np.nan if heading is None else heading)
+        self._widths.append(image_size[0])
+        self._heights.append(image_size[1])
+
+    def arrays(self, min_move_m: float = 2.0) -> dict[str, np.ndarray]:
+        """Columns sorted by frame, with missing headings filled from the track."""
+        order = np.argsort(np.asarray(self._frames), kind="stable")
+        lats = np.asarray(self._lats, dtype=np.float64)[order]
+        lons = np.asarray(self._lons, dtype=np.float64)[order]
+        headings = np.asarray(self._headings, dtype=np.float64)[order]
+        missing = np.isnan(headings)
+        if missing.any():
+            headings[missing] = track_headings(lats, lons, min_move_m)[missing]
+        return {
+            "frames": np.asarray(self._frames, dtype=np.int64)[order],
+            "lats": lats,
+            "lons": lons,
+            "headings": headings,
+            "widths": np.asarray(self._widths, dtype=np.float64)[order],
+            "heights": np.asarray(self._heights, dtype=np.float64)[order],
+        }
+
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """NaNs replaced by the previous valid value (the first valid one for leading NaNs)."""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.zeros_like(values)
+    index = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    filled[:np.argmax(valid)] = values[np.argmax(valid)]
+    return filled
+
+
+def track_headings(lats: np.ndarray, lons: np.ndarray, min_move_m: float = 2.0) -> np.ndarray:
+    """
+    Heading at each fix: the bearing to the next fix (the last fix keeps the
+    previous one). Steps shorter than `min_move_m` (standing still, GPS
+    jitter) inherit the last reliable heading.
+    """
+    if len(lats) < 2:
+        return np.zeros(len(lats))
+    bearings = GeoUtils.bearing_array(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    steps = GeoUtils.haversine_distance_array(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    bearings = np.where(steps >= min_move_m, bearings, np.nan)
+    return _fill_gaps(np.append(bearings, np.nan))
+
+
+def project_detections(
+    detections: DetectionTable,
+    poses: dict[str, np.ndarray],
+    camera: CameraModel | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    World position of every detection.
+
+    The bearing to an object is the frame heading plus the angle of the box
+    centre off the optical axis; its range comes from the box height and
+    the class's typical height (pinhole model, focal length from the field
+    of view and image width).
+
+    Returns:
+        lat, lon and distance arrays, one per detection, and `valid`
+        (False where the detection's frame has no pose)
+    """
+    camera = camera or CameraModel()
+    data = detections.data
+    n = len(data)
+    if n == 0 or not len(poses["frames"]):
+        empty = np.empty(0)
+        return {"lat": empty, "lon": empty, "distance": empty, "valid": np.zeros(n, dtype=bool)}
+
+    frames = data["frame"].astype(np.int64)
+    pose = np.clip(np.searchsorted(poses["frames"], frames), 0, len(poses["frames"]) - 1)
+    valid = poses["frames"][pose] == frames
+
+    widths = poses["widths"][pose]
+    focal_px = (widths / 2) / np.tan(np.radians(camera.horizontal_fov_deg) / 2)
+
+    centre_x = (data["x1"] + data["x2"]) / 2
+    box_height = np.maximum(data["y2"] - data["y1"], 1.0)
+    off_axis = np.arctan((centre_x - widths / 2) / focal_px)
+
+    # Depth along the optical axis, then along the ray to the object
+    depth = _HEIGHTS_M[data["class_id"]] * focal_px / box_height
+    distance = np.clip(depth / np.cos(off_axis), camera.min_distance_m, camera.max_distance_m)
+
+    bearing = (poses["headings"][pose] + camera.heading_offset_deg + np.degrees(off_axis)) % 360
+    lat, lon = GeoUtils.destination_point_array(poses["lats"][pose], poses["lons"][pose], distance, bearing)
+    return {"lat": lat, "lon": lon, "distance": distance, "valid": valid}
+
+
+def _components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Connected component labels (0..k-1) of n nodes joined by edges a-b."""
+    labels = np.arange(n)
+    if len(a):
+        while True:
+            low = np.minimum(labels[a], labels[b])
+            updated = labels.copy()
+            np.minimum.at(updated, a, low)
+            np.minimum.at(updated, b, low)
+            # Pointer jumping: follow labels to their roots
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def merge_sightings(
+    class_ids: np.ndarray,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    track_ids: np.ndarray | None = None,
+    radius_m: float = 8.0,
+) -> np.ndarray:
+    """
+    Entity label per sighting: sightings of the same class within about
+    `radius_m` of each other, or with the same tracker id, are one entity.
+
+    Sightings are binned into grid cells of `radius_m / 2` per class. Cells
+    are taken densest first; each joins the nearest entity whose anchor
+    (the centroid of the cell that started it) is within `radius_m / 2`, or
+    starts a new one. Entities are never chained through neighbours, so a
+    row of parked cars stays one entity per car.
+    """
+    n = len(lats)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Local metres around the session's centre
+    lat0, lon0 = float(np.mean(lats)), float(np.mean(lons))
+    y = np.radians(lats - lat0) * GeoUtils.EARTH_RADIUS_M
+    x = np.radians(lons - lon0) * GeoUtils.EARTH_RADIUS_M * np.cos(np.radians(lat0))
+
+    reach = radius_m / 2
+    cx = np.floor(x / reach).astype(np.int64)
+    cy = np.floor(y / reach).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    span_x, span_y = int(cx.max()) + 2, int(cy.max()) + 2
+    keys = (class_ids.astype(np.int64) * span_x + cx) * span_y + cy
+
+    cell_keys, cell_of = np.unique(keys, return_inverse=True)
+    counts = np.bincount(cell_of)
+    centre_x = np.bincount(cell_of, weights=x) / counts
+    centre_y = np.bincount(cell_of, weights=y) / counts
+
+    # Anchors are looked up in the 3x3 cells around a cell (a cell is as
+    # wide as the reach); keys of neighbouring cells differ by span_y and 1
+    anchors: dict[int, list[int]] = {}
+    anchor_x: list[float] = []
+    anchor_y: list[float] = []
+    cell_entity = np.empty(len(cell_keys), dtype=np.int64)
+    for cell in np.argsort(-counts, kind="stable"):
+        key = int(cell_keys[cell])
+        px, py = centre_x[cell], centre_y[cell]
+        best, best_distance = -1, reach
+        for dx in (-span_y, 0, span_y):
+            for dy in (-1, 0, 1):
+                for entity in anchors.get(key + dx + dy, ()):
+                    distance = np.hypot(anchor_x[entity] - px, anchor_y[entity] - py)
+                    if distance <= best_distance:
+                        best, best_distance = entity, distance
+        if best < 0:
+            best = len(anchor_x)
+            anchor_x.append(px)
+            anchor_y.append(py)
+            anchors.setdefault(key, []).append(best)
+        cell_entity[cell] = best
+
+    entity_of = cell_entity[cell_of]
+    if track_ids is None:
+        return entity_of
+
+    # Sightings the tracker linked are one object wherever they project
+    tracked = np.flatnonzero(track_ids >= 0)
+    order = tracked[np.lexsort((class_ids[tracked], track_ids[tracked]))]
+    same = (track_ids[order[1:]] == track_ids[order[:-1]]) & (class_ids[order[1:]] == class_ids[order[:-1]])
+    linked = _components(len(anchor_x), entity_of[order[:-1][same]], entity_of[order[1:][same]])
+    return linked[entity_of]
+
+
+def map_entities(
+    detections: DetectionTable,
+    poses: dict[str, np.ndarray],
+    camera: CameraModel | None = None,
+    radius_m: float = 8.0,
+    min_sightings: int = 1,
+) -> list[dict[str, Any]]:
+    """
+    Map entities of a session: detections projected to world positions and
+    merged across frames, each at the confidence-weighted mean of its
+    sightings, most-sighted first.
+    """
+    projected = project_detections(detections, poses, camera)
+    valid = projected["valid"]
+    if not valid.any():
+        return []
+
+    data = detections.data[valid]
+    lats, lons = projected["lat"][valid], projected["lon"][valid]
+    distances = projected["distance"][valid]
+    labels = merge_sightings(data["class_id"], lats, lons, data["track_id"], radius_m)
+
+    weights = data["confidence"].astype(np.float64)
+    sightings = np.bincount(labels)
+    weight_sums = np.bincount(labels, weights=weights)
+    entity_lats = np.bincount(labels, weights=lats * weights) / weight_sums
+    entity_lons = np.bincount(labels, weights=lons * weights) / weight_sums
+    confidences = weight_sums / sightings
+    mean_distances = np.bincount(labels, weights=distances) / sightings
+
+    frames = data["frame"].astype(np.int64)
+    first_frames = np.full(len(sightings), np.iinfo(np.int64).max)
+    last_frames = np.full(len(sightings), -1)
+    np.minimum.at(first_frames, labels, frames)
+    np.maximum.at(last_frames, labels, frames)
+    class_ids = np.zeros(len(sightings), dtype=np.int64)
+    class_ids[labels] = data["class_id"]
+
+    keep = np.flatnonzero(sightings >= min_sightings)
+    keep = keep[np.argsort(-sightings[keep], kind="stable")]
+    return [
+        {
+            "class": CLASS_NAMES[class_ids[e]],
+            "lat": round(float(entity_lats[e]), 7),
+            "lon": round(float(entity_lons[e]), 7),
+            "sightings": int(sightings[e]),
+            "confidence": round(float(confidences[e]), 3),
+            "distanceM": round(float(mean_distances[e]), 1),
+            "firstFrame": int(first_frames[e]),
+            "lastFrame": int(last_frames[e]),
+        }
+        for e in keep
+    ]
@@ -0,0 +1,192 @@
+# apps/ml-service/pipelines/jobs.py
+"""
+Session Job API
+Submit, poll and cancel session processing without holding a connection
+open for the whole run. Jobs are spawned Modal calls tracked in a Dict.
+"""
+
+import time
+import uuid
+import modal
+from typing import Any
+
+from pipelines.process_session import process_session
+
+# job:<id> -> job record (written here), progress:<id> -> latest progress
+# event (written by the running session), session:<id> -> its current job id,
+# takeover:<session id>:<job id> -> the job that replaced that job
+jobs = modal.Dict.from_name("citypulse-session-jobs", create_if_missing=True)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Resubmitting a session with a job in one of these returns that job
+DEDUPE_STATUSES = ("queued", "running", "completed")
+
+# A queued job with no function call this long after submission never started
+SPAWN_TIMEOUT_MS = 60_000
+
+
+def report_progress(job_id: str, event: dict[str, Any]) -> None:
+    """Record a ProgressReporter event for polling; failures are logged only."""
+    try:
+        jobs[f"progress:{job_id}"] = {**event, "updatedAt": int(time.time() * 1000)}
+    except Exception as e:
+        print(f"Progress update failed for job {job_id}: {e}")
+
+
+def _job_view(record: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in record.items() if k != "callId"}
+
+
+def _refresh(job_id: str, record: dict[str, Any], include_results: bool) -> dict[str, Any]:
+    """Resolve the status of an active job from its function call."""
+    results = None
+    if record["status"] in ACTIVE_STATUSES and record.get("callId"):
+        previous = record["status"]
+        try:
+            results = modal.FunctionCall.from_id(record["callId"]).get(timeout=0)
+            record = {**record, "status": "completed", "finishedAt": int(time.time() * 1000)}
+            if results.get("error"):
+                record["error"] = results["error"]
+        except TimeoutError:
+            record = {**record, "status": "running"}
+        except modal.exception.OutputExpiredError:
+            record = {**record, "status": "expired"}
+        except Exception as e:
+            record = {**record, "status": "failed", "error": str(e), "finishedAt": int(time.time() * 1000)}
+        if record["status"] != previous:
+            jobs[f"job:{job_id}"] = record
+    elif record["status"] == "queued" and int(time.time() * 1000) - record["submittedAt"] > SPAWN_TIMEOUT_MS:
+        record = {**record, "status": "failed", "error": "Job never started", "finishedAt": int(time.time() * 1000)}
+        jobs[f"job:{job_id}"] = record
+    elif record["status"] == "completed" and include_results and record.get("callId"):
+        try:
+            results = modal.FunctionCall.from_id(record["callId"]).get(timeout=0)
+        except Exception as e:
+            print(f"Results unavailable for job {job_id}: {e}")
+
+    view = _job_view(record)
+    progress = jobs.get(f"progress:{job_id}")
+    if progress is not None:
+        view["progress"] = progress
+    if include_results and results is not None:
+        view["results"] = results
+    return view
+
+
+def submit_job(request: dict[str, Any]) -> dict[str, Any]:
+    """
+    Spawn process_session for a session and return its job at once.
+
+    A session with a queued, running or completed job gets that job back
+    (`deduplicated: true`) unless `force` is set; failed, cancelled and
+    expired jobs are resubmitted.
+    """
+    session_id = request["sessionId"]
+    session_key = f"session:{session_id}"
+
+    existing_id = jobs.get(session_key)
+    if existing_id is not None and not request.get("force", False):
+        record = jobs.get(f"job:{existing_id}")
+        if record is not None:
+            view = _refresh(existing_id, record, include_results=False)
+            if view["status"] in DEDUPE_STATUSES:
+                return {**view, "deduplicated": True}
+
+    job_id = uuid.uuid4().hex
+    record = {
+        "jobId": job_id,
+        "sessionId": session_id,
+        "status": "queued",
+        "submittedAt": int(time.time() * 1000),
+    }
+    jobs[f"job:{job_id}"] = record
+    if existing_id is None:
+        # Claim the session: of concurrent first submissions only one spawns
+        if not jobs.put(session_key, job_id, skip_if_exists=True):
+            del jobs[f"job:{job_id}"]
+            return submit_job({**request, "force": False})
+    else:
+        # Take over from the previous job: of concurrent resubmissions only
+        # one replaces it, the others get that one's job
+        takeover_key = f"takeover:{session_id}:{existing_id}"
+        if not jobs.put(takeover_key, job_id, skip_if_exists=True):
+            del jobs[f"job:{job_id}"]
+            winner_id = jobs.get(takeover_key)
+            return {**_refresh(winner_id, jobs.get(f"job:{winner_id}"), include_results=False), "deduplicated": True}
+        jobs[session_key] = job_id
+
+    try:
+        call = _spawn(job_id, request)
+    except Exception as e:
+        # Leave the claim on a failed job, so the next submission retries
+        # instead of being deduplicated onto a job that never started
+        record = {**record, "status": "failed", "error": f"Spawn failed: {e}", "finishedAt": int(time.time() * 1000)}
+        jobs[f"job:{job_id}"] = record
+        print(f"Spawn failed for session {session_id}: {e}")
+        return {**_job_view(record), "deduplicated": False}
+    record["callId"] = call.object_id
+    jobs[f"job:{job_id}"] = record
+    return {**_job_view(record), "deduplicated": False}
+
+
+def _spawn(job_id: str, request: dict[str, Any]) -> Any:
+    return process_session.spawn(
+        session_id=request["sessionId"],
+        data_url=request.get("dataUrl", ""),
+        callback_url=request.get("callbackUrl"),
+        stream_results=request.get("streamResults", False),
+        progress_url=request.get("progressUrl"),
+        detections_format=request.get("detectionsFormat", "parquet"),
+        job_id=job_id,
+        embeddings=request.get("embeddings", False),
+        frame_locations=request.get("frameLocations"),
+        zones=request.get("zones"),
+    )
+
+
+def _find_job(job_id: str | None, session_id: str | None) -> tuple[str, dict[str, Any]] | None:
+    if job_id is None and session_id is not None:
+        job_id = jobs.get(f"session:{session_id}")
+    if job_id is None:
+        return None
+    record = jobs.get(f"job:{job_id}")
+    return (job_id, record) if record is not None else None
+
+
+@modal.function(secrets=[modal.Secret.from_name("citypulse-secrets")])
+@modal.web_endpoint(method="POST")
+def submit_session_job(request: dict) -> dict:
+    """Submit a session for processing; returns the job (status "queued" or the deduplicated job)."""
+    return submit_job(request)
+
+
+@modal.function()
+@modal.web_endpoint(method="GET")
+def session_job_status(job_id: str | None = None, session_id: str | None = None, results: bool = True) -> dict:
+    """Status and latest progress of a job (by job or session id); results once completed."""
+    found = _find_job(job_id, session_id)
+    if found is None:
+        return {"error": "Job not found", "jobId": job_id, "sessionId": session_id}
+    return _refresh(*found, include_results=results)
+
+
+@modal.function()
+@modal.web_endpoint(method="POST")
+def cancel_session_job(request: dict) -> dict:
+    """Cancel a queued or running job (by jobId or sessionId)."""
+    found = _find_job(request.get("jobId"), request.get("sessionId"))
+    if found is None:
+        return {"error": "Job not found", "jobId": request.get("jobId"), "sessionId": request.get("sessionId")}
+
+    job_id, record = found
+    view = _refresh(job_id, record, include_results=False)
+    if view["status"] not in ACTIVE_STATUSES:
+        return view
+
+    record = jobs[f"job:{job_id}"]
+    if record.get("callId"):
+        modal.FunctionCall.from_id(record["callId"]).cancel()
+    record = {**record, "status": "cancelled", "finishedAt": int(time.time() * 1000)}
+    jobs[f"job:{job_id}"] = record
+    return _job_view(record)
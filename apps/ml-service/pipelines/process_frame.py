@@ -4,12 +4,18 @@ Single Frame Processing Pipeline
 Processes individual frames for real-time or on-demand analysis.
 """
 
+import json
 import modal
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+from models.instrumentation import Tracer
+from pipelines.batching import BatchPolicy, MicroBatcher
+
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "boto3",
     "httpx",
+    "numpy",
 )
 
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
@@ -20,6 +26,7 @@ volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
     timeout=60,
     volumes={"/models": volume},
     image=image,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
 )
 def process_frame(
     image_bytes: bytes,
@@ -40,87 +47,160 @@ def process_frame(
     Returns:
         Processing results
     """
-    options = options or {}
-    
-    # Import models
-    from models.detector import Detector
-    from models.blur import PrivacyBlur
-    from models.ocr import TextRecognizer
-    from models.classifier import SceneClassifier
+    return _process_frames([image_bytes], options or {})[0]
+
+
+# Threads for concurrent model stages, shared by all batches in a container
+_stage_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="stage")
+
+
+def _process_frames(
+    images: list[bytes],
+    options: dict,
+    lane: str = "interactive",
+    direct: bool = False,
+) -> list[dict[str, Any]]:
+    """
+    Run the frame pipeline over a batch, one batched model call per stage.
+    Model work is scheduled in `lane` (see pipelines/gateway.py), or sent to
+    the models as this batch when `direct` is set.
+
+    Returns one result dict per image, in the same order.
+    """
+    from pipelines.gateway import run_stage
+    from pipelines.stages import StageGraph
     
-    results: dict[str, Any] = {
-        "success": True,
-    }
+    results: list[dict[str, Any]] = [{"success": True} for _ in images]
+    tracer = Tracer()
+    total_bytes = sum(len(b) for b in images)
     
-    processed_bytes = image_bytes
+    processed = list(images)
     
     # 1. Privacy blur
     if options.get("blur_pii", True):
-        blur = PrivacyBlur()
-        processed_bytes, pii_counts = blur.blur_all_pii.remote(image_bytes)
-        results["privacy"] = pii_counts
+        with tracer.span("blur", batch_size=len(images), bytes_in=total_bytes):
+            blurred = run_stage("blur", images, lane, direct=direct)
+        processed = [blurred_bytes for blurred_bytes, _ in blurred]
+        for result, (_, pii_counts) in zip(results, blurred):
+            result["privacy"] = pii_counts
+    
+    # Stages 2-5 only need the blurred frames, so they run concurrently
+    def timed(name: str) -> Any:
+        def run(processed: list[bytes]) -> Any:
+            with tracer.span(name, batch_size=len(processed)):
+                return run_stage(name, processed, lane, direct=direct)
+        return run
+    
+    graph = StageGraph(executor=_stage_executor)
+    for name, option in (
+        ("detect", "detect_objects"),
+        ("ocr", "extract_text"),
+        ("classify", "classify_scene"),
+        ("quality", "analyze_quality"),
+    ):
+        if options.get(option, True):
+            graph.add(name, timed(name), inputs=("processed",))
+    outputs = graph.run({"processed": processed})
     
     # 2. Object detection
-    if options.get("detect_objects", True):
-        detector = Detector()
-        detections = detector.detect.remote(processed_bytes)
-        results["detections"] = detections
-        results["entityCounts"] = detector.count_entities.remote(processed_bytes)
+    if "detect" in outputs:
+        for result, frame_detections in zip(results, outputs["detect"]):
+            result["detections"] = frame_detections.to_dicts()
+            result["entityCounts"] = frame_detections.class_counts()
     
     # 3. OCR
-    if options.get("extract_text", True):
-        ocr = TextRecognizer()
-        texts = ocr.extract_text.remote(processed_bytes)
-        results["texts"] = texts
+    if "ocr" in outputs:
+        for result, texts in zip(results, outputs["ocr"]):
+            result["texts"] = texts
     
     # 4. Scene classification
-    if options.get("classify_scene", True):
-        classifier = SceneClassifier()
-        scene = classifier.classify.remote(processed_bytes)
-        results["scene"] = scene
+    if "classify" in outputs:
+        for result, scene in zip(results, outputs["classify"]):
+            result["scene"] = scene
     
     # 5. Quality analysis
-    if options.get("analyze_quality", True):
-        classifier = SceneClassifier()
-        quality = classifier.get_scene_quality.remote(processed_bytes)
-        results["quality"] = quality
+    if "quality" in outputs:
+        for result, quality in zip(results, outputs["quality"]):
+            result["quality"] = quality
     
     # Include processed image if PII was blurred
     if options.get("blur_pii", True) and options.get("return_image", False):
         import base64
-        results["processedImage"] = base64.b64encode(processed_bytes).decode('utf-8')
+        for result, processed_bytes in zip(results, processed):
+            result["processedImage"] = base64.b64encode(processed_bytes).decode('utf-8')
+    
+    # Stage timings cover the whole batch; each frame carries the same summary
+    timings = tracer.summary()
+    for result in results:
+        result["timings"] = timings
     
     return results
 
 
-@modal.function()
+# Micro-batcher shared by all concurrent requests in an endpoint container
+_frame_batcher: MicroBatcher | None = None
+
+
+def _get_frame_batcher() -> MicroBatcher:
+    global _frame_batcher
+    if _frame_batcher is None:
+        _frame_batcher = MicroBatcher(_run_frame_batch, BatchPolicy.from_env("FRAME_BATCH"))
+    return _frame_batcher
+
+
+async def _run_frame_batch(options_key: str, images: list[bytes]) -> list[dict[str, Any]]:
+    """Send one micro-batch (all sharing the same options) to the GPU pipeline."""
+    return await process_frame_batch.remote.aio(images, json.loads(options_key))
+
+
+@modal.function(allow_concurrent_inputs=64)
 @modal.web_endpoint(method="POST")
-def process_frame_endpoint(request: dict) -> dict:
+async def process_frame_endpoint(request: dict) -> dict:
     """
     Web endpoint for processing single frames.
     
+    Concurrent requests are micro-batched: frames with identical options that
+    arrive within FRAME_BATCH_MAX_WAIT_MS share one GPU batch of up to
+    FRAME_BATCH_MAX_SIZE frames (see BatchPolicy.from_env).
+    
     Request body:
     - image: Base64 encoded image OR
-    - imageUrl: URL to fetch image from
+    - imageUrl: URL to fetch image from OR
+    - imageUrls: List of URLs, fetched concurrently; the response is
+      {"results": [...]} with one entry per URL
     - options: Processing options
     """
+    import asyncio
     import base64
     import httpx
+    from utils.http import fetch_bytes, fetch_many
+    
+    options = request.get("options", {})
+    options_key = json.dumps(options, sort_keys=True)
+    batcher = _get_frame_batcher()
+    
+    if "imageUrls" in request:
+        fetched = await fetch_many(request["imageUrls"])
+        
+        async def process(image: bytes | Exception) -> dict[str, Any]:
+            if isinstance(image, Exception):
+                return {"success": False, "error": f"Image fetch failed: {image}"}
+            return await batcher.submit(image, key=options_key)
+        
+        return {"results": await asyncio.gather(*(process(image) for image in fetched))}
     
     # Get image bytes
     if "image" in request:
         image_bytes = base64.b64decode(request["image"])
     elif "imageUrl" in request:
-        response = httpx.get(request["imageUrl"], timeout=30)
-        response.raise_for_status()
-        image_bytes = response.content
+        try:
+            image_bytes = await fetch_bytes(request["imageUrl"])
+        except httpx.HTTPError as e:
+            return {"error": f"Image fetch failed: {e}"}
     else:
-        return {"error": "No image provided. Use 'image' (base64) or 'imageUrl'"}
+        return {"error": "No image provided. Use 'image' (base64), 'imageUrl' or 'imageUrls'"}
     
-    options = request.get("options", {})
-    
-    result = process_frame.remote(image_bytes, options)
-    return result
+    return await batcher.submit(image_bytes, key=options_key)
 
 
 @modal.function(
@@ -128,10 +208,15 @@ def process_frame_endpoint(request: dict) -> dict:
     timeout=120,
     volumes={"/models": volume},
     image=image,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
 )
 def process_frame_batch(
     images: list[bytes],
     options: dict | None = None,
 ) -> list[dict[str, Any]]:
-    """Process multiple frames in batch for efficiency."""
-    return [process_frame.remote(img, options) for img in images]
+    """
+    Process multiple frames in batch, sharing each model's forward pass.
+    The batch is already formed (by the endpoint's micro-batcher), so it
+    goes to the models as is rather than through the gateway's scheduler.
+    """
+    return _process_frames(images, options or {}, direct=True)
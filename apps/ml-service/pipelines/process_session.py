@@ -8,9 +8,15 @@ import modal
 from typing import Any
 import os
 
+from models.instrumentation import Tracer
+from pipelines.callbacks import deliver_callback
+from pipelines.progress import NdjsonS3Sink, OrderedSender, ProgressReporter, SessionAggregator, attach_detections
+
 image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "boto3",
     "httpx",
+    "numpy",
+    "pyarrow",
 )
 
 volume = modal.Volume.from_name("citypulse-models", create_if_missing=True)
@@ -27,6 +33,13 @@ def process_session(
     session_id: str,
     data_url: str,
     callback_url: str | None = None,
+    stream_results: bool = False,
+    progress_url: str | None = None,
+    detections_format: str = "parquet",
+    job_id: str | None = None,
+    embeddings: bool = False,
+    frame_locations: dict[str, dict[str, float]] | None = None,
+    zones: dict[str, Any] | None = None,
 ) -> dict[str, Any]:
     """
     Process an entire collection session.
@@ -35,154 +48,311 @@ def process_session(
         session_id: The session ID from the API
         data_url: S3/R2 URL containing session data
         callback_url: Optional webhook to call when complete
+        stream_results: Write per-frame records as NDJSON parts under
+            sessions/<id>/results/ instead of returning them; the result then
+            holds only aggregates plus a "stream" manifest, so memory stays
+            flat however large the session is
+        progress_url: Optional webhook receiving running aggregates as
+            processing advances
+        detections_format: How to deliver every detection of the session:
+            "parquet" or "arrow" stores one table under sessions/<id>/results/,
+            "json" inlines them as a "detections" list, "none" skips them
+        job_id: Job tracked by the job API (pipelines/jobs.py); progress
+            is recorded there for polling
+        embeddings: Keep each frame's scene embedding from the classifier
+            pass and store them (float16, with an ANN index) at
+            sessions/<id>/results/embeddings.npz for similarity search
+            (pipelines/similarity.py); near-duplicate frames are reported
+        frame_locations: {"lat", "lon"} per photo file name, attached to
+            the frame's signs and embedding; with them, detections are
+            projected to positions and merged into "mapEntities" (an
+            optional "heading" in degrees overrides the GPS-track heading)
+        zones: GeoJSON FeatureCollection of (Multi)Polygon zones, named by
+            their "id" property; located frames are counted per zone, and
+            frames inside zones with "exclude": true are not processed
         
     Returns:
         Processing results including entities, quality scores, etc.
     """
-    import boto3
-    import tempfile
-    import json
-    import httpx
-    
-    # Import models
-    from models.detector import Detector
-    from models.blur import PrivacyBlur
-    from models.ocr import TextRecognizer
-    from models.classifier import SceneClassifier
+    from utils.storage import get_storage
+    from pipelines.jobs import report_progress
     
-    # Initialize model instances
-    detector = Detector()
-    blur = PrivacyBlur()
-    ocr = TextRecognizer()
-    classifier = SceneClassifier()
+    from models.embeddings import EmbeddingStore
+    from models.imaging import image_size, processed_frame
+    from models.registry import ModelRegistry
+    from pipelines.gateway import run_stage
+    from pipelines.stages import StageGraph
     
-    # S3 client
-    s3 = boto3.client(
-        's3',
-        endpoint_url=os.environ.get('S3_ENDPOINT'),
-        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-    )
+    # Model work goes through the gateway's bulk lane; frames of concurrent
+    # sessions share batches fairly and yield to real-time requests
+    def infer(name: str, image_bytes: bytes) -> Any:
+        return run_stage(name, [image_bytes], lane="bulk", tenant=session_id)[0]
     
-    # Parse bucket and key from URL
-    # Format: s3://bucket/key or https://endpoint/bucket/key
-    bucket = os.environ.get('S3_BUCKET', 'citypulse-uploads')
+    # Storage backend (S3 or local, from config); uploads run on its
+    # background threads while frames process
+    storage = get_storage()
     key_prefix = f"sessions/{session_id}"
     
-    results = {
-        "sessionId": session_id,
-        "frames": [],
-        "entities": {
-            "vehicles": 0,
-            "pedestrians": 0,
-            "signs": 0,
-            "buildings": 0,
-        },
-        "texts": [],
-        "scenes": {},
-        "quality": {
-            "avgSharpness": 0,
-            "avgBrightness": 0,
-            "avgCoverage": 0,
-            "overallScore": 0,
-        },
-        "privacy": {
-            "facesBlurred": 0,
-            "platesBlurred": 0,
-        },
-        "processed": 0,
-        "failed": 0,
-    }
+    aggregator = SessionAggregator(session_id, keep_records=not stream_results)
+    # Lets consumers invalidate stored results when weights are upgraded
+    model_versions = ModelRegistry().active_versions()
+    
+    sink = None
+    if stream_results:
+        sink = NdjsonS3Sink(
+            upload=lambda key, body: storage.submit(storage.upload_bytes, key, body, 'application/x-ndjson'),
+            prefix=f"{key_prefix}/results",
+        )
+    
+    # Per-stage timings for this session; model calls are timed end to end
+    # including the remote round trip (containers expose their own via metrics())
+    tracer = Tracer()
+    
+    # Everything after the blur only needs the blurred frame, so detection,
+    # OCR, classification and quality run concurrently
+    def timed(name: str, model_stage: str) -> Any:
+        def run(blurred: bytes) -> Any:
+            with tracer.span(name, bytes_in=len(blurred)):
+                return infer(model_stage, blurred)
+        return run
+    
+    # With embeddings, the classifier returns them from the same forward pass
+    classify_stage = "embed" if embeddings else "classify"
+    graph = StageGraph(max_workers=4)
+    for name, model_stage in (("detect", "detect"), ("ocr", "signs"), ("classify", classify_stage), ("quality", "quality")):
+        graph.add(name, timed(name, model_stage), inputs=("blurred",))
+    embedding_store = EmbeddingStore() if embeddings else None
+    zone_summary: dict[str, Any] | None = None
+    progress_sender: OrderedSender | None = None
+    
+    def store_processed(source_key: str, dest_key: str, data: bytes | None) -> None:
+        with tracer.span("s3.upload", bytes_in=len(data) if data is not None else 0):
+            storage.store_processed(source_key, dest_key, data, 'image/jpeg')
+    
+    def build_results() -> dict[str, Any]:
+        graph.close()
+        if progress_sender is not None:
+            progress_sender.close()
+        results = {**aggregator.results(), "modelVersions": model_versions}
+        if zone_summary is not None:
+            results["zones"] = zone_summary
+        if sink is not None:
+            results["stream"] = sink.close()
+        attach_detections(results, aggregator.detections(), detections_format, f"{key_prefix}/results", storage.upload_bytes)
+        if embedding_store is not None:
+            _attach_embeddings(results, embedding_store, f"{key_prefix}/results", storage.upload_bytes)
+        
+        upload_errors = storage.wait()
+        if upload_errors:
+            results["uploadErrors"] = len(upload_errors)
+            print(f"{len(upload_errors)} uploads failed for session {session_id}: {upload_errors[0]}")
+        
+        results["timings"] = tracer.summary()
+        _export_metrics(tracer, session_id, lambda key, body: storage.upload_bytes(
+            key, body, 'application/openmetrics-text',
+        ))
+        return results
     
     try:
         # List all images in session
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=f"{key_prefix}/photos/")
+        image_keys = list(storage.list_objects(f"{key_prefix}/photos/", extensions=['.jpg', '.jpeg', '.png']))
         
-        if 'Contents' not in response:
-            return {**results, "error": "No images found"}
+        if not image_keys:
+            return {**build_results(), "error": "No images found"}
         
-        image_keys = [obj['Key'] for obj in response['Contents'] if obj['Key'].endswith(('.jpg', '.jpeg', '.png'))]
+        # Zone membership of every located frame in one batch lookup
+        excluded: set[int] = set()
+        if zones and frame_locations:
+            frame_zones, excluded = _frame_zones(zones, frame_locations, image_keys)
+            zone_summary = {"frames": frame_zones, "excludedFrames": len(excluded)}
         
-        quality_scores = []
-        scene_categories = {}
+        reporter = None
+        if progress_url or job_id:
+            # One delivery at a time, so events cannot overtake each other
+            if progress_url:
+                progress_sender = OrderedSender(lambda event: deliver_callback.remote(progress_url, event, max_attempts=2))
+            
+            def send_progress(event: dict[str, Any]) -> None:
+                if progress_sender is not None:
+                    progress_sender(event)
+                if job_id:
+                    report_progress(job_id, event)
+            
+            reporter = ProgressReporter(send=send_progress, total_frames=len(image_keys) - len(excluded))
         
         for i, key in enumerate(image_keys):
+            if i in excluded:
+                continue
             try:
                 # Download image
-                img_response = s3.get_object(Bucket=bucket, Key=key)
-                image_bytes = img_response['Body'].read()
+                with tracer.span("s3.download") as stage:
+                    image_bytes = storage.download_bytes(key)
+                    stage.bytes_out = len(image_bytes)
                 
                 # 1. Privacy blur
-                blurred_bytes, pii_counts = blur.blur_all_pii.remote(image_bytes)
-                results["privacy"]["facesBlurred"] += pii_counts["faces"]
-                results["privacy"]["platesBlurred"] += pii_counts["plates"]
-                
-                # 2. Object detection
-                detections = detector.detect.remote(blurred_bytes)
-                for d in detections:
-                    if d["class"] in ["car", "motorcycle", "bus", "truck"]:
-                        results["entities"]["vehicles"] += 1
-                    elif d["class"] == "person":
-                        results["entities"]["pedestrians"] += 1
-                    elif d["class"] in ["traffic light", "stop sign"]:
-                        results["entities"]["signs"] += 1
-                
-                # 3. OCR for signs
-                texts = ocr.extract_signs.remote(blurred_bytes)
-                results["texts"].extend([t["text"] for t in texts])
+                with tracer.span("blur", bytes_in=len(image_bytes)) as stage:
+                    blurred_bytes, pii_counts = infer("blur", image_bytes)
+                    stage.bytes_out = len(blurred_bytes)
                 
-                # 4. Scene classification
-                scene = classifier.classify.remote(blurred_bytes)
-                cat = scene["category"]
-                scene_categories[cat] = scene_categories.get(cat, 0) + 1
+                # 2-5. Object detection, OCR for signs, scene classification
+                # and quality analysis, concurrently
+                outputs = graph.run({"blurred": blurred_bytes})
+                detections = outputs["detect"]
+                signs = outputs["ocr"]
+                texts = [t["text"] for t in signs]
+                scene = outputs["classify"]
+                quality = outputs["quality"]
+                location = _frame_location(frame_locations, key)
+                if embedding_store is not None:
+                    scene, embedding = scene
+                    embedding_store.add(embedding, key.replace('/photos/', '/processed/'), i, location)
                 
-                # 5. Quality analysis
-                quality = classifier.get_scene_quality.remote(blurred_bytes)
-                quality_scores.append(quality)
-                
-                # 6. Upload blurred image back
+                # 6. Store the processed image in the background; frames with
+                # nothing blurred are copied server-side instead of re-uploaded,
+                # unless they carry metadata (EXIF GPS, device) to strip
                 blurred_key = key.replace('/photos/', '/processed/')
-                s3.put_object(
-                    Bucket=bucket,
-                    Key=blurred_key,
-                    Body=blurred_bytes,
-                    ContentType='image/jpeg',
-                )
+                storage.submit(store_processed, key, blurred_key, processed_frame(image_bytes, blurred_bytes, pii_counts))
                 
-                results["frames"].append({
+                record = {
                     "index": i,
                     "key": blurred_key,
                     "detections": len(detections),
                     "quality": quality["quality"],
-                })
-                results["processed"] += 1
+                }
+                aggregator.add_frame(
+                    record, detections, signs, scene, quality, pii_counts,
+                    location=location, image_size=image_size(image_bytes),
+                    heading=_frame_heading(frame_locations, key),
+                )
+                
+                if sink is not None:
+                    with tracer.span("results.write"):
+                        sink.write({
+                            "type": "frame",
+                            **record,
+                            "scene": scene["category"],
+                            "texts": texts,
+                            "privacy": pii_counts,
+                        })
                 
             except Exception as e:
-                results["failed"] += 1
+                aggregator.add_failure()
+                tracer.error("frame", e)
                 print(f"Error processing {key}: {e}")
+            
+            if reporter is not None:
+                reporter.update(aggregator)
         
-        # Aggregate quality scores
-        if quality_scores:
-            results["quality"] = {
-                "avgSharpness": round(sum(q["sharpness"] for q in quality_scores) / len(quality_scores), 3),
-                "avgBrightness": round(sum(q["brightness"] for q in quality_scores) / len(quality_scores), 3),
-                "avgCoverage": round(sum(q["coverage"] for q in quality_scores) / len(quality_scores), 3),
-                "overallScore": round(sum(q["quality"] for q in quality_scores) / len(quality_scores), 3),
-            }
+        if reporter is not None:
+            reporter.update(aggregator, force=True)
         
-        results["scenes"] = scene_categories
+        results = build_results()
         
-        # Callback to API
+        # Callback to API, delivered with retry from a CPU container so this
+        # GPU container is released as soon as the results are ready
         if callback_url:
-            try:
-                httpx.post(callback_url, json=results, timeout=30)
-            except Exception as e:
-                print(f"Callback failed: {e}")
+            deliver_callback.spawn(callback_url, results)
         
         return results
         
     except Exception as e:
-        return {**results, "error": str(e)}
+        return {**build_results(), "error": str(e)}
+
+
+def _frame_location(frame_locations: dict[str, dict[str, float]] | None, key: str) -> tuple[float, float] | None:
+    """(lat, lon) of a photo from the request's per-file locations."""
+    if not frame_locations:
+        return None
+    location = frame_locations.get(key.rsplit('/', 1)[-1])
+    if location is None:
+        return None
+    return location["lat"], location["lon"]
+
+
+def _frame_zones(
+    zones: dict[str, Any],
+    frame_locations: dict[str, dict[str, float]],
+    keys: list[str],
+) -> tuple[dict[str, int], set[int]]:
+    """
+    Frames per zone (excluded frames left out) and the indexes of frames
+    inside exclusion zones.
+    """
+    from utils.geofence import GeofenceIndex
+    
+    index = GeofenceIndex.from_geojson(zones)
+    located = [(i, location) for i, key in enumerate(keys) if (location := _frame_location(frame_locations, key))]
+    if not located or not len(index):
+        return {}, set()
+    
+    points, zone_indexes = index.lookup([loc[0] for _, loc in located], [loc[1] for _, loc in located])
+    excluded = {
+        located[point][0]
+        for point, zone in zip(points.tolist(), zone_indexes.tolist())
+        if index.properties[zone].get("exclude")
+    }
+    counts: dict[str, int] = {}
+    for point, zone in zip(points.tolist(), zone_indexes.tolist()):
+        if located[point][0] not in excluded:
+            zone_id = index.zone_ids[zone]
+            counts[zone_id] = counts.get(zone_id, 0) + 1
+    return counts, excluded
+
+
+def _frame_heading(frame_locations: dict[str, dict[str, float]] | None, key: str) -> float | None:
+    """Compass heading of a photo, if its device reported one."""
+    if not frame_locations:
+        return None
+    return frame_locations.get(key.rsplit('/', 1)[-1], {}).get("heading")
+
+
+def _attach_embeddings(
+    results: dict[str, Any],
+    store: Any,
+    prefix: str,
+    upload: Any,
+    duplicate_threshold: float = 0.95,
+) -> None:
+    """
+    Store a session's EmbeddingStore (with its ANN index once large enough
+    to use one) and report frames that nearly duplicate an earlier one.
+    """
+    if not len(store):
+        return
+    try:
+        duplicate_of = store.near_duplicates(duplicate_threshold)
+        frames = store.frames
+        if len(store) >= store.ann_threshold:
+            store.index()
+        key = f"{prefix}/embeddings.npz"
+        upload(key, store.to_bytes(), 'application/octet-stream')
+        results["embeddings"] = {
+            "key": key,
+            "count": len(store),
+            "dim": store.dim,
+            "nearDuplicates": [
+                [int(frames[row]), int(frames[of])]
+                for row, of in enumerate(duplicate_of) if of >= 0
+            ],
+        }
+    except Exception as e:
+        print(f"Embeddings upload failed under {prefix}: {e}")
+
+
+def _export_metrics(tracer: Tracer, session_id: str, upload: Any) -> None:
+    """
+    Store the session's stage metrics next to its results and, when an OTLP
+    collector is configured, push them there too. Failures are logged only.
+    """
+    labels = {"session": session_id}
+    try:
+        upload(f"sessions/{session_id}/metrics/session.prom", tracer.to_openmetrics(labels).encode())
+    except Exception as e:
+        print(f"Metrics upload failed for session {session_id}: {e}")
+    
+    endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint:
+        deliver_callback.spawn(f"{endpoint.rstrip('/')}/v1/metrics", tracer.to_otlp(labels), max_attempts=2)
 
 
 @modal.function()
@@ -193,5 +363,11 @@ def process_session_endpoint(request: dict) -> dict:
         session_id=request["sessionId"],
         data_url=request.get("dataUrl", ""),
         callback_url=request.get("callbackUrl"),
+        stream_results=request.get("streamResults", False),
+        progress_url=request.get("progressUrl"),
+        detections_format=request.get("detectionsFormat", "parquet"),
+        embeddings=request.get("embeddings", False),
+        frame_locations=request.get("frameLocations"),
+        zones=request.get("zones"),
     )
     return result
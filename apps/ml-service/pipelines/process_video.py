@@ -0,0 +1,162 @@
+# apps/ml-service/pipelines/process_video.py
+"""
+Video Session Pipeline
+Runs the detector on every k-th sampled dashcam frame and tracks objects in
+between, so entities are counted once per track rather than once per frame.
+"""
+
+import modal
+from typing import Any
+import os
+
+from models.instrumentation import Tracer
+from models.records import DetectionTable
+from pipelines.callbacks import deliver_callback
+from pipelines.progress import attach_detections
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "boto3",
+    "httpx",
+    "numpy",
+    "pyarrow",
+    "opencv-python-headless",
+)
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+@modal.function(
+    timeout=3600,
+    image=image,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+def process_video(
+    session_id: str,
+    fps: float = 2.0,
+    detect_every: int = 5,
+    scene_threshold: float | None = 0.3,
+    callback_url: str | None = None,
+    spacing_m: float | None = None,
+    gps_track: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    """
+    Detect and track objects in a session's dashcam videos.
+
+    Args:
+        session_id: The session ID from the API
+        fps: Frames sampled per second of video
+        detect_every: Run the detector on every k-th sampled frame and
+            propagate tracks in between (1 = detect every frame)
+        scene_threshold: Thumbnail difference (0-1) that forces a detector
+            pass before the cadence is due; None disables the check
+        callback_url: Optional webhook to call when complete
+        spacing_m: Sample adaptively instead of at a fixed rate, keeping a
+            frame per `spacing_m` metres travelled (needs `gps_track`) or on
+            visual change; `fps` then sets the candidate rate
+        gps_track: Fixes with lat, lon, timestamp_ms relative to the start
+            of the first video; consecutive videos continue its clock
+
+    Returns:
+        Unique entity counts per track, tracking stats and the detections table key
+    """
+    import tempfile
+
+    from models.tracking import TrackingDetector
+    from pipelines.gateway import run_stage
+    from utils.storage import get_storage
+    from utils.video import AdaptiveSampler, VideoProcessor
+
+    storage = get_storage()
+    key_prefix = f"sessions/{session_id}"
+
+    tracer = Tracer()
+    tracking = TrackingDetector(
+        detect=lambda frame_bytes: run_stage("detect", [frame_bytes], "bulk", session_id)[0],
+        every=detect_every,
+        scene_threshold=scene_threshold,
+    )
+    sampler = None
+    if spacing_m is not None:
+        sampler = AdaptiveSampler(spacing_m=spacing_m, gps_track=gps_track)
+    tables: list[DetectionTable] = []
+    videos = []
+    offset_ms = 0
+
+    video_keys = [
+        key for key in storage.list_objects(f"{key_prefix}/video/")
+        if key.lower().endswith(VIDEO_EXTENSIONS)
+    ]
+    if not video_keys:
+        return {"sessionId": session_id, "error": "No videos found"}
+
+    try:
+        for key in video_keys:
+            # Each video is its own clip; tracks end with it
+            tracking.new_clip()
+            start_frame = tracking.frames
+            try:
+                with tempfile.NamedTemporaryFile(suffix=os.path.splitext(key)[1]) as f:
+                    with tracer.span("s3.download"):
+                        storage.download_file(key, f.name)
+
+                    if sampler is not None:
+                        frames = VideoProcessor.stream_frames_adaptive(f.name, sampler, candidate_fps=fps, time_offset_ms=offset_ms)
+                    else:
+                        frames = VideoProcessor.stream_frames(f.name, fps=fps)
+
+                    for frame_bytes, timestamp_ms in frames:
+                        with tracer.span("track", bytes_in=len(frame_bytes)):
+                            table = tracking.process(frame_bytes)
+                        if len(table):
+                            tables.append(table)
+                    videos.append({"key": key, "frames": tracking.frames - start_frame})
+                    offset_ms += int(VideoProcessor.get_video_info(f.name)["duration_s"] * 1000)
+            except Exception as e:
+                tracer.error("video", e)
+                print(f"Error processing {key}: {e}")
+                videos.append({"key": key, "frames": tracking.frames - start_frame, "error": str(e)})
+
+        detections = DetectionTable.concat(tables)
+        results = {
+            "sessionId": session_id,
+            "videos": videos,
+            **tracking.stats(),
+        }
+        if sampler is not None:
+            results["sampling"] = sampler.stats()
+        attach_detections(results, detections, "parquet", f"{key_prefix}/results/video", storage.upload_bytes)
+        results["timings"] = tracer.summary()
+
+    except Exception as e:
+        results = {"sessionId": session_id, "videos": videos, "error": str(e), "timings": tracer.summary()}
+
+    if callback_url:
+        deliver_callback.spawn(callback_url, results)
+
+    return results
+
+
+@modal.function()
+@modal.web_endpoint(method="POST")
+def process_video_endpoint(request: dict) -> dict:
+    """Web endpoint for processing video sessions."""
+    return process_video.remote(
+        session_id=request["sessionId"],
+        fps=request.get("fps", 2.0),
+        detect_every=request.get("detectEvery", 5),
+        scene_threshold=request.get("sceneThreshold", 0.3),
+        callback_url=request.get("callbackUrl"),
+        spacing_m=request.get("spacingM"),
+        gps_track=_gps_track(request.get("gpsReadings"), request.get("videoStartTime")),
+    )
+
+
+def _gps_track(readings: list[dict[str, Any]] | None, start_time: int | None) -> list[dict[str, Any]] | None:
+    """Convert API sensor readings (Unix ms timestamps) to a track relative to the video start."""
+    if not readings:
+        return None
+    start = start_time if start_time is not None else min(r["timestamp"] for r in readings)
+    return [
+        {"lat": r["gps"]["latitude"], "lon": r["gps"]["longitude"], "timestamp_ms": r["timestamp"] - start}
+        for r in readings
+    ]
@@ -0,0 +1,323 @@
+# apps/ml-service/pipelines/progress.py
+"""
+Session Progress Streaming
+Running aggregates for session results plus NDJSON sinks for per-frame records.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable
+
+import numpy as np
+
+from models.records import ENTITY_BUCKETS, DetectionTable, FrameTable
+from pipelines.geo_projection import FramePoses, map_entities
+from pipelines.text_index import TextIndex
+
+
+class SessionAggregator:
+    """
+    Running session aggregates.
+
+    With `keep_records` set, per-frame records are also kept for the legacy
+    (non-streaming) result shape. Without it (streaming) memory is not
+    constant: what the end-of-session results need is still held, namely
+    - every detection, 29 bytes each in one columnar table, to store the
+      session's detections table and project map entities;
+    - a pose per located frame (about 200 bytes), for map entities;
+    - the TextIndex, which grows with distinct signs only.
+    That is a few MB for a session of 100k detections, against the kB per
+    frame of full records.
+    """
+
+    # Per-frame detection chunks merged into one block at a time
+    CONSOLIDATE_EVERY = 256
+
+    def __init__(self, session_id: str, keep_records: bool = True):
+        self.session_id = session_id
+        self.keep_records = keep_records
+        self.frames = FrameTable()
+        self.text_index = TextIndex()
+        self.poses = FramePoses()
+        self._entity_counts = np.zeros(len(ENTITY_BUCKETS), dtype=np.int64)
+        self._detection_chunks: list[DetectionTable] = []
+        self._detection_blocks = 0
+        self.scenes: dict[str, int] = {}
+        self.privacy = {
+            "facesBlurred": 0,
+            "platesBlurred": 0,
+        }
+        self.processed = 0
+        self.failed = 0
+        self.text_count = 0
+        self._quality_sums = {"sharpness": 0.0, "brightness": 0.0, "coverage": 0.0, "quality": 0.0}
+        self._quality_count = 0
+
+    def add_frame(
+        self,
+        record: dict[str, Any],
+        detections: DetectionTable | list[dict[str, Any]],
+        texts: list[dict[str, Any] | str],
+        scene: dict[str, Any],
+        quality: dict[str, float],
+        pii_counts: dict[str, int],
+        location: tuple[float, float] | None = None,
+        image_size: tuple[int, int] | None = None,
+        heading: float | None = None,
+    ) -> None:
+        """
+        Fold one processed frame into the aggregates.
+
+        `record` needs index, key, detections and quality; `detections` may
+        be a DetectionTable or `Detector.detect` dicts; `texts` OCR regions
+        or bare strings. `location` is the frame's (lat, lon) when known and
+        clusters sign readings by place instead of by frame distance; with
+        `image_size` (width, height) it also records the frame's pose for
+        map entities. `heading` is the camera's compass heading if the
+        device reported one, otherwise it is taken from the GPS track.
+        """
+        self.privacy["facesBlurred"] += pii_counts["faces"]
+        self.privacy["platesBlurred"] += pii_counts["plates"]
+
+        if not isinstance(detections, DetectionTable):
+            detections = DetectionTable.from_dicts(detections)
+        detections = detections.with_frame(record["index"])
+        self._entity_counts += detections.bucket_counts()
+        if len(detections):
+            self._detection_chunks.append(detections)
+            if len(self._detection_chunks) - self._detection_blocks >= self.CONSOLIDATE_EVERY:
+                recent = self._detection_chunks[self._detection_blocks:]
+                self._detection_chunks[self._detection_blocks:] = [DetectionTable.concat(recent)]
+                self._detection_blocks += 1
+
+        cat = scene["category"]
+        self.scenes[cat] = self.scenes.get(cat, 0) + 1
+
+        for name in self._quality_sums:
+            self._quality_sums[name] += quality.get(name, 0)
+        self._quality_count += 1
+
+        self.text_count += len(texts)
+        self.text_index.add(record["index"], texts, location)
+        if location is not None and image_size is not None:
+            self.poses.add(record["index"], location, image_size, heading)
+        if self.keep_records:
+            self.frames.append(record["index"], record["key"], record["detections"], record["quality"])
+
+        self.processed += 1
+
+    def add_failure(self) -> None:
+        self.failed += 1
+
+    @property
+    def entities(self) -> dict[str, int]:
+        return {name: int(n) for name, n in zip(ENTITY_BUCKETS, self._entity_counts)}
+
+    def detections(self) -> DetectionTable:
+        """Every detection so far, with `frame` set to the session frame index."""
+        if len(self._detection_chunks) > 1:
+            self._detection_chunks = [DetectionTable.concat(self._detection_chunks)]
+            self._detection_blocks = 1
+        return self._detection_chunks[0] if self._detection_chunks else DetectionTable()
+
+    def quality(self) -> dict[str, float]:
+        """Average quality metrics so far."""
+        n = self._quality_count
+        if n == 0:
+            return {
+                "avgSharpness": 0,
+                "avgBrightness": 0,
+                "avgCoverage": 0,
+                "overallScore": 0,
+            }
+        return {
+            "avgSharpness": round(self._quality_sums["sharpness"] / n, 3),
+            "avgBrightness": round(self._quality_sums["brightness"] / n, 3),
+            "avgCoverage": round(self._quality_sums["coverage"] / n, 3),
+            "overallScore": round(self._quality_sums["quality"] / n, 3),
+        }
+
+    def snapshot(self) -> dict[str, Any]:
+        """Aggregates only: small and safe to emit as often as needed."""
+        return {
+            "sessionId": self.session_id,
+            "entities": self.entities,
+            "scenes": dict(self.scenes),
+            "quality": self.quality(),
+            "privacy": dict(self.privacy),
+            "textCount": self.text_count,
+            "signCount": len(self.text_index),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    def results(self) -> dict[str, Any]:
+        """Session results in the process_session response shape."""
+        snapshot = self.snapshot()
+        del snapshot["textCount"], snapshot["signCount"]
+        snapshot["signs"] = self.text_index.to_dicts()
+        if len(self.poses):
+            snapshot["mapEntities"] = map_entities(self.detections(), self.poses.arrays())
+        if self.keep_records:
+            return {**snapshot, "frames": self.frames.to_dicts(), "texts": self.text_index.texts()}
+        return snapshot
+
+
+class NdjsonS3Sink:
+    """
+    Write per-frame records as NDJSON parts to object storage.
+
+    Records are buffered up to `part_size` lines, then written as
+    `<prefix>/part-00000.ndjson`, `part-00001.ndjson`, ... so memory stays
+    bounded by one part regardless of session size.
+    """
+
+    def __init__(
+        self,
+        upload: Callable[[str, bytes], Any],
+        prefix: str,
+        part_size: int = 200,
+    ):
+        self.upload = upload
+        self.prefix = prefix.rstrip('/')
+        self.part_size = part_size
+        self.parts: list[str] = []
+        self.records = 0
+        self._buffer: list[str] = []
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._buffer.append(json.dumps(record, separators=(',', ':')))
+        self.records += 1
+        if len(self._buffer) >= self.part_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        key = f"{self.prefix}/part-{len(self.parts):05d}.ndjson"
+        self.upload(key, ("\n".join(self._buffer) + "\n").encode())
+        self.parts.append(key)
+        self._buffer = []
+
+    def close(self) -> dict[str, Any]:
+        """Flush remaining records and describe what was written."""
+        self.flush()
+        return {"prefix": self.prefix, "parts": self.parts, "records": self.records}
+
+
+class ProgressReporter:
+    """
+    Emit progress events (running aggregates) to a callback.
+
+    `send` receives each event dict; it should not block on the receiver
+    (e.g. an OrderedSender). Events are throttled to one every
+    `every_frames` frames or `min_interval_s` seconds, whichever comes later,
+    and numbered by `seq` so receivers can drop stale ones.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict[str, Any]], Any],
+        total_frames: int,
+        every_frames: int = 25,
+        min_interval_s: float = 5.0,
+    ):
+        self.send = send
+        self.total_frames = total_frames
+        self.every_frames = every_frames
+        self.min_interval_s = min_interval_s
+        self._last_frames = 0
+        self._last_sent = 0.0
+        self._seq = 0
+
+    def update(self, aggregator: SessionAggregator, force: bool = False) -> None:
+        done = aggregator.processed + aggregator.failed
+        now = time.monotonic()
+        if not force and (
+            done - self._last_frames < self.every_frames
+            or now - self._last_sent < self.min_interval_s
+        ):
+            return
+
+        self._last_frames = done
+        self._last_sent = now
+        self._seq += 1
+        self.send({
+            "type": "progress",
+            "seq": self._seq,
+            "done": done,
+            "total": self.total_frames,
+            "progress": round(done / self.total_frames, 4) if self.total_frames else 1.0,
+            **aggregator.snapshot(),
+        })
+
+
+class OrderedSender:
+    """
+    Deliver events one at a time, in order, from a background thread.
+
+    Progress events are snapshots, so while a delivery is in flight only the
+    newest pending event is kept; `close()` delivers the last one and stops.
+    """
+
+    def __init__(self, deliver: Callable[[dict[str, Any]], Any]):
+        self.deliver = deliver
+        self._pending: dict[str, Any] | None = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="progress-sender", daemon=True)
+        self._thread.start()
+
+    def __call__(self, event: dict[str, Any]) -> None:
+        with self._cond:
+            self._pending = event
+            self._cond.notify()
+
+    def close(self, timeout: float | None = 30.0) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                event, self._pending = self._pending, None
+            if event is None:
+                return
+            try:
+                self.deliver(event)
+            except Exception as e:
+                print(f"Progress delivery failed: {e}")
+
+
+def attach_detections(
+    results: dict[str, Any],
+    detections: DetectionTable,
+    detections_format: str,
+    prefix: str,
+    upload: Callable[[str, bytes, str], Any],
+) -> None:
+    """
+    Store a DetectionTable under `prefix` ("parquet" or "arrow") and record
+    its key in `results`, or inline it as JSON ("json"); "none" skips it.
+    """
+    if detections_format == "json":
+        results["detections"] = detections.to_dicts(include_frame=True)
+        return
+    if detections_format not in ("parquet", "arrow"):
+        return
+
+    try:
+        if detections_format == "parquet":
+            key = f"{prefix}/detections.parquet"
+            upload(key, detections.to_parquet(), 'application/vnd.apache.parquet')
+        else:
+            key = f"{prefix}/detections.arrows"
+            upload(key, detections.to_ipc(), 'application/vnd.apache.arrow.stream')
+        results["detectionsTable"] = {"key": key, "format": detections_format, "rows": len(detections)}
+    except Exception as e:
+        print(f"Detections upload failed under {prefix}: {e}")
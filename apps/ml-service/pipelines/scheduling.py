@@ -0,0 +1,336 @@
+# apps/ml-service/pipelines/scheduling.py
+"""
+Priority Scheduling
+Batches model work from many callers by lane (interactive vs bulk), with
+per-tenant fair share within a lane and deadline-aware dispatch.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+
+@dataclass
+class Lane:
+    """
+    A priority class of work.
+
+    Attributes:
+        name: Lane name callers submit to
+        priority: Lower runs first when lanes compete for a batch slot
+        max_batch_size: Largest batch formed from this lane
+        max_wait_ms: Longest the oldest item waits for the batch to fill
+        default_deadline_ms: Deadline applied when the caller gives none
+        reserved_slots: In-flight batch slots per key that lanes of lower
+            priority may not use, so this lane never queues behind them
+        eager: Dispatch without waiting when every tenant queued has a
+            single item and none in flight (callers blocked on one result)
+    """
+
+    name: str
+    priority: int
+    max_batch_size: int
+    max_wait_ms: float
+    default_deadline_ms: float | None = None
+    reserved_slots: int = 0
+    eager: bool = False
+
+
+DEFAULT_LANES = [
+    # Real-time frames: small batches dispatched almost at once
+    Lane("interactive", priority=0, max_batch_size=4, max_wait_ms=5.0, default_deadline_ms=500.0, reserved_slots=1, eager=True),
+    # Sessions and backfills: large batches for throughput
+    Lane("bulk", priority=1, max_batch_size=32, max_wait_ms=200.0),
+]
+
+
+class _Item:
+    __slots__ = ("value", "tenant", "future", "enqueued", "deadline", "taken")
+
+    def __init__(self, value: Any, tenant: Hashable, future: asyncio.Future, enqueued: float, deadline: float):
+        self.value = value
+        self.tenant = tenant
+        self.future = future
+        self.enqueued = enqueued
+        self.deadline = deadline
+        self.taken = False
+
+
+class _Queue:
+    """Pending items of one lane and key, FIFO per tenant."""
+
+    def __init__(self):
+        self.tenants: OrderedDict[Hashable, deque[_Item]] = OrderedDict()
+        self.count = 0
+        self._deadlines: list[tuple[float, int, _Item]] = []
+        self._seq = itertools.count()
+
+    def push(self, tenant: Hashable, item: _Item) -> None:
+        self.tenants.setdefault(tenant, deque()).append(item)
+        heapq.heappush(self._deadlines, (item.deadline, next(self._seq), item))
+        self.count += 1
+
+    def oldest(self) -> float:
+        return min(items[0].enqueued for items in self.tenants.values())
+
+    def single_item_tenants(self) -> list[Hashable] | None:
+        """Tenants with items queued, or None if any of them has more than one."""
+        tenants = []
+        for tenant, items in self.tenants.items():
+            queued = sum(1 for item in items if not item.taken)
+            if queued > 1:
+                return None
+            if queued:
+                tenants.append(tenant)
+        return tenants
+
+    def earliest_deadline(self) -> float:
+        while self._deadlines and self._deadlines[0][2].taken:
+            heapq.heappop(self._deadlines)
+        return self._deadlines[0][0] if self._deadlines else float("inf")
+
+    def _take(self, item: _Item, batch: list[_Item]) -> None:
+        item.taken = True
+        self.count -= 1
+        batch.append(item)
+
+    def pop_batch(self, size: int, urgent_before: float) -> list[_Item]:
+        """
+        Up to `size` items: first those due before `urgent_before`, then one
+        per tenant in turn. Tenants served are moved to the back, so the
+        next batch starts with the ones skipped.
+        """
+        batch: list[_Item] = []
+        while len(batch) < size and self.earliest_deadline() <= urgent_before:
+            self._take(heapq.heappop(self._deadlines)[2], batch)
+
+        served = []
+        while len(batch) < size and self.count:
+            progressed = False
+            for tenant, items in list(self.tenants.items()):
+                while items and items[0].taken:
+                    items.popleft()
+                if not items:
+                    continue
+                self._take(items.popleft(), batch)
+                served.append(tenant)
+                progressed = True
+                if len(batch) >= size:
+                    break
+            if not progressed:
+                break
+
+        for tenant in served:
+            if tenant in self.tenants:
+                self.tenants.move_to_end(tenant)
+        for tenant, items in list(self.tenants.items()):
+            while items and items[0].taken:
+                items.popleft()
+            if not items:
+                del self.tenants[tenant]
+        return batch
+
+
+class PriorityScheduler:
+    """
+    Asyncio batch scheduler with priority lanes.
+
+    Callers `await submit(item, key, lane, tenant)`; items with the same key
+    (e.g. model stage) and lane are passed to `batch_fn(key, items)`
+    together and each caller receives its own element of the result.
+
+    A lane's batch is dispatched when it is full, when its oldest item has
+    waited `max_wait_ms`, or when an item's deadline is within the recent
+    batch latency for that key. In an `eager` lane it also goes at once
+    when every tenant in it has a single item queued and none in flight for
+    the key: such a caller is blocked on that result, so holding the batch
+    open only adds latency. Bulk lanes keep waiting so that frames from
+    concurrent sessions coalesce.
+
+    At most `max_inflight` batches per key run at once; when several lanes
+    are ready, the higher-priority lane takes the slot, and slots reserved
+    by a lane are never used by lower ones. Within a lane, tenants share
+    each batch round-robin, so one large session cannot crowd out the
+    others.
+    """
+
+    LATENCY_WINDOW = 512
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Hashable, list[Any]], Awaitable[list[Any]]],
+        lanes: list[Lane] | None = None,
+        max_inflight: int = 4,
+    ):
+        self.batch_fn = batch_fn
+        self.lanes = sorted(lanes or DEFAULT_LANES, key=lambda lane: lane.priority)
+        self.max_inflight = max_inflight
+        self._lanes = {lane.name: lane for lane in self.lanes}
+        self._queues: dict[tuple[str, Hashable], _Queue] = {}
+        self._inflight: dict[Hashable, int] = {}
+        self._tenant_inflight: dict[tuple[Hashable, Hashable], int] = {}
+        self._batch_s: dict[tuple[str, Hashable], float] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self._stats = {
+            lane.name: {
+                "latencies": deque(maxlen=self.LATENCY_WINDOW),
+                "sizes": deque(maxlen=self.LATENCY_WINDOW),
+                "items": 0,
+                "deadlineMisses": 0,
+            }
+            for lane in self.lanes
+        }
+
+    async def submit(
+        self,
+        item: Any,
+        key: Hashable = None,
+        lane: str = "bulk",
+        tenant: Hashable = None,
+        deadline_ms: float | None = None,
+    ) -> Any:
+        """Queue an item and wait for its result; `deadline_ms` is relative to now."""
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+        now = time.perf_counter()
+        deadline_ms = deadline_ms if deadline_ms is not None else self._lanes[lane].default_deadline_ms
+        deadline = now + deadline_ms / 1000 if deadline_ms is not None else float("inf")
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get((lane, key))
+        if queue is None:
+            queue = self._queues[(lane, key)] = _Queue()
+        queue.push(tenant, _Item(item, tenant, future, now, deadline))
+        self._stats[lane]["items"] += 1
+        self._wakeup.set()
+        return await future
+
+    def _reserved_above(self, lane: Lane) -> int:
+        return sum(other.reserved_slots for other in self.lanes if other.priority < lane.priority)
+
+    def _due(self, lane: Lane, key: Hashable, queue: _Queue, now: float) -> float:
+        """When this queue's next batch should go (<= now means ready)."""
+        if queue.count >= lane.max_batch_size:
+            return now
+        if lane.eager:
+            tenants = queue.single_item_tenants()
+            if tenants is not None and not any(self._tenant_inflight.get((key, tenant)) for tenant in tenants):
+                return now
+        expected = self._batch_s.get((lane.name, key), 0.0)
+        return min(queue.oldest() + lane.max_wait_ms / 1000, queue.earliest_deadline() - expected)
+
+    def _dispatch_ready(self, now: float) -> float | None:
+        """Start every batch that is ready and has a slot; returns the next time to check."""
+        next_due = None
+        for lane in self.lanes:
+            limit = self.max_inflight - self._reserved_above(lane)
+            for (lane_name, key), queue in list(self._queues.items()):
+                if lane_name != lane.name:
+                    continue
+                while queue.count:
+                    due = self._due(lane, key, queue, now)
+                    if due > now:
+                        next_due = due if next_due is None else min(next_due, due)
+                        break
+                    if self._inflight.get(key, 0) >= limit:
+                        # Re-checked when a batch for this key finishes
+                        break
+                    expected = self._batch_s.get((lane.name, key), 0.0)
+                    batch = queue.pop_batch(lane.max_batch_size, now + expected)
+                    self._inflight[key] = self._inflight.get(key, 0) + 1
+                    for item in batch:
+                        self._tenant_inflight[(key, item.tenant)] = self._tenant_inflight.get((key, item.tenant), 0) + 1
+                    task = asyncio.create_task(self._run(lane, key, batch))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+                if not queue.count:
+                    del self._queues[(lane_name, key)]
+        return next_due
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.perf_counter()
+            next_due = self._dispatch_ready(now)
+            timeout = None if next_due is None else max(0.0, next_due - time.perf_counter())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, lane: Lane, key: Hashable, batch: list[_Item]) -> None:
+        started = time.perf_counter()
+        try:
+            results = await self.batch_fn(key, [item.value for item in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} items")
+            for item, result in zip(batch, results):
+                if not item.future.done():
+                    item.future.set_result(result)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            now = time.perf_counter()
+            self._inflight[key] -= 1
+            for item in batch:
+                remaining = self._tenant_inflight[(key, item.tenant)] - 1
+                if remaining:
+                    self._tenant_inflight[(key, item.tenant)] = remaining
+                else:
+                    del self._tenant_inflight[(key, item.tenant)]
+            # Exponentially weighted batch latency, used to dispatch ahead of deadlines
+            previous = self._batch_s.get((lane.name, key))
+            elapsed = now - started
+            self._batch_s[(lane.name, key)] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+
+            stats = self._stats[lane.name]
+            stats["latencies"].extend((now - item.enqueued) * 1000 for item in batch)
+            stats["sizes"].append(len(batch))
+            stats["deadlineMisses"] += sum(1 for item in batch if now > item.deadline)
+            self._wakeup.set()
+
+    @staticmethod
+    def _percentile(values: deque[float], pct: float) -> float:
+        ordered = sorted(values)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def stats(self) -> dict[str, Any]:
+        """Per-lane recent latency percentiles, average batch size, queue depth and deadline misses."""
+        queued: dict[str, int] = {}
+        for (lane_name, _), queue in self._queues.items():
+            queued[lane_name] = queued.get(lane_name, 0) + queue.count
+
+        lanes = {}
+        for lane in self.lanes:
+            stats = self._stats[lane.name]
+            sizes = stats["sizes"]
+            lanes[lane.name] = {
+                "p50Ms": round(self._percentile(stats["latencies"], 50), 1),
+                "p99Ms": round(self._percentile(stats["latencies"], 99), 1),
+                "avgBatchSize": round(sum(sizes) / len(sizes), 2) if sizes else 0,
+                "items": stats["items"],
+                "queued": queued.get(lane.name, 0),
+                "deadlineMisses": stats["deadlineMisses"],
+            }
+        return {"lanes": lanes, "inflight": {str(k): n for k, n in self._inflight.items() if n}}
+
+    async def close(self) -> None:
+        """Stop the dispatcher; in-flight batches are left to finish."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
@@ -0,0 +1,120 @@
+# apps/ml-service/pipelines/similarity.py
+"""
+Scene Similarity Search
+Finds similar street scenes by image, by stored frame or by location in
+the embedding stores written by process_session, per session or merged
+per region.
+"""
+
+import base64
+import modal
+from typing import Any
+
+from models.embeddings import EmbeddingStore
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install(
+    "boto3",
+    "numpy",
+)
+
+
+def session_embeddings_key(session_id: str) -> str:
+    return f"sessions/{session_id}/results/embeddings.npz"
+
+
+def region_embeddings_key(region: str) -> str:
+    return f"embeddings/regions/{region}.npz"
+
+
+def load_store(
+    storage: Any,
+    session_ids: list[str] | None = None,
+    region: str | None = None,
+    rebuild: bool = False,
+) -> EmbeddingStore:
+    """
+    The embedding store to search: a stored region store, or the sessions'
+    stores merged (and saved as the region's, index included, when a
+    region is named). Sessions without stored embeddings are skipped.
+    """
+    if region is not None and not rebuild and storage.object_exists(region_embeddings_key(region)):
+        return EmbeddingStore.from_bytes(storage.download_bytes(region_embeddings_key(region)))
+
+    stores = []
+    for session_id in session_ids or []:
+        key = session_embeddings_key(session_id)
+        if storage.object_exists(key):
+            stores.append(EmbeddingStore.from_bytes(storage.download_bytes(key)))
+    if len(stores) == 1 and region is None:
+        return stores[0]
+
+    store = EmbeddingStore.concat(stores)
+    if region is not None and len(store):
+        if len(store) >= store.ann_threshold:
+            store.index()
+        storage.upload_bytes(region_embeddings_key(region), store.to_bytes(), 'application/octet-stream')
+    return store
+
+
+def _frame_row(store: EmbeddingStore, session_id: str, frame: int) -> int | None:
+    prefix = f"sessions/{session_id}/"
+    frames = store.frames
+    for row, key in enumerate(store.keys):
+        if key.startswith(prefix) and frames[row] == frame:
+            return row
+    return None
+
+
+@modal.function(
+    image=image,
+    timeout=300,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+@modal.web_endpoint(method="POST")
+def find_similar_scenes(request: dict) -> dict:
+    """
+    Search stored scene embeddings.
+
+    Request:
+        sessionIds: Sessions whose stores to search
+        region: Name of a merged region store (built from sessionIds on
+            first use, or again with "rebuild": true)
+        image: Base64 query image, embedded with one classifier pass
+        query: {"sessionId", "frame"} of a stored frame to use as the query
+        location: {"lat", "lon"} to search around, within "radiusM"
+            (default 100); without a query image or frame, the frames
+            there nearest first
+        k: Results to return (default 10)
+    """
+    from pipelines.gateway import run_stage
+    from utils.storage import get_storage
+
+    storage = get_storage()
+    store = load_store(storage, request.get("sessionIds"), request.get("region"), request.get("rebuild", False))
+    if not len(store):
+        return {"error": "No embeddings found", "results": []}
+
+    query = None
+    exclude: set[int] = set()
+    if request.get("image"):
+        image_bytes = base64.b64decode(request["image"])
+        query = run_stage("embed", [image_bytes], lane="interactive")[0][1]
+    elif request.get("query"):
+        row = _frame_row(store, request["query"]["sessionId"], request["query"]["frame"])
+        if row is None:
+            return {"error": "Query frame not found", "results": []}
+        query = store.vectors[row]
+        exclude.add(row)
+
+    location = request.get("location")
+    if query is None and location is None:
+        return {"error": "Give an image, a query frame or a location", "results": []}
+
+    results = store.search(
+        query,
+        k=request.get("k", 10),
+        location=(location["lat"], location["lon"]) if location else None,
+        radius_m=request.get("radiusM", 100.0),
+        exclude=exclude,
+    )
+    return {"searched": len(store), "results": results}
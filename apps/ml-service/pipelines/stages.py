@@ -0,0 +1,139 @@
+# apps/ml-service/pipelines/stages.py
+"""
+Stage Graph Execution
+Runs pipeline stages as soon as their inputs are ready, so independent
+stages (e.g. detection, OCR and classification of a blurred frame) overlap
+instead of running one after another.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+@dataclass
+class Stage:
+    """
+    One node of a StageGraph.
+
+    Attributes:
+        name: Key of the stage's output in the results
+        fn: Called with the named inputs as keyword arguments
+        inputs: Names of graph inputs or other stages this stage needs
+    """
+
+    name: str
+    fn: Callable[..., Any]
+    inputs: tuple[str, ...] = field(default_factory=tuple)
+
+
+class StageGraph:
+    """
+    Dependency graph of stages run on a thread pool.
+
+    Model calls (Modal round trips) and OpenCV/Paddle work release the GIL,
+    so threads overlap them.
+
+    Usage:
+        graph = StageGraph()
+        graph.add("detect", lambda blurred: detect(blurred), inputs=("blurred",))
+        graph.add("ocr", lambda blurred: ocr(blurred), inputs=("blurred",))
+        outputs = graph.run({"blurred": blurred_bytes})
+    """
+
+    def __init__(self, max_workers: int = 4, tracer: Any = None, executor: ThreadPoolExecutor | None = None):
+        """
+        Args:
+            max_workers: Threads of the graph's own pool
+            tracer: Times each stage as a span under its name
+            executor: Shared pool to run on instead (not shut down by close)
+        """
+        self.max_workers = max_workers
+        self.tracer = tracer
+        self.stages: dict[str, Stage] = {}
+        self._executor = executor
+        self._owns_executor = executor is None
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        inputs: tuple[str, ...] = (),
+    ) -> "StageGraph":
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self.stages[name] = Stage(name, fn, tuple(inputs))
+        return self
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+        return self._executor
+
+    def _call(self, stage: Stage, kwargs: dict[str, Any]) -> Any:
+        span = self.tracer.span(stage.name) if self.tracer is not None else nullcontext()
+        with span:
+            return stage.fn(**kwargs)
+
+    def run(self, inputs: dict[str, Any], only: set[str] | None = None) -> dict[str, Any]:
+        """
+        Run the graph (or just the stages in `only` and what they need)
+        and return every stage output by name, merged with `inputs`.
+
+        The first stage error is raised once running stages have finished;
+        stages that depend on it are not started.
+        """
+        wanted = self._closure(only) if only is not None else set(self.stages)
+        for name in wanted:
+            missing = [i for i in self.stages[name].inputs if i not in inputs and i not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {name} needs unknown inputs: {missing}")
+
+        values = dict(inputs)
+        pending = {name for name in wanted if name not in values}
+        running: dict[Future, str] = {}
+        error: BaseException | None = None
+
+        while pending or running:
+            if error is None:
+                for name in sorted(pending):
+                    stage = self.stages[name]
+                    if all(i in values for i in stage.inputs):
+                        pending.discard(name)
+                        kwargs = {i: values[i] for i in stage.inputs}
+                        running[self.executor.submit(self._call, stage, kwargs)] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    values[name] = future.result()
+                except BaseException as e:
+                    if error is None:
+                        error = e
+
+        if error is not None:
+            raise error
+        if pending:
+            raise ValueError(f"Stages with unsatisfiable inputs: {sorted(pending)}")
+        return values
+
+    def _closure(self, names: set[str]) -> set[str]:
+        needed: set[str] = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name in needed or name not in self.stages:
+                continue
+            needed.add(name)
+            stack.extend(self.stages[name].inputs)
+        return needed
+
+    def close(self) -> None:
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,175 @@
+# apps/ml-service/pipelines/text_index.py
+"""
+Session Text Index
+Deduplicates OCR readings across frames into one entry per sign, so a shop
+sign read in 40 consecutive frames is reported once with its best reading.
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any
+
+from utils.geo import GeoUtils
+
+_NON_ALNUM = re.compile(r"[^\w]+")
+
+
+def normalize_text(text: str) -> str:
+    """Case- and punctuation-insensitive key: NFKC, casefolded, runs of non-word characters as one space."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+class _Sign:
+    __slots__ = (
+        "key", "variants", "readings", "best_confidence", "bbox",
+        "first_frame", "last_frame", "lat", "lon", "located",
+    )
+
+    def __init__(self, key: str, frame: int):
+        self.key = key
+        # Raw spelling -> summed confidence; the heaviest one is the reading
+        self.variants: dict[str, float] = {}
+        self.readings = 0
+        self.best_confidence = 0.0
+        self.bbox: dict[str, int] | None = None
+        self.first_frame = frame
+        self.last_frame = frame
+        self.lat = 0.0
+        self.lon = 0.0
+        self.located = 0
+
+    def add(self, text: str, confidence: float, bbox: dict[str, int] | None, frame: int,
+            location: tuple[float, float] | None) -> None:
+        self.variants[text] = self.variants.get(text, 0.0) + confidence
+        self.readings += 1
+        if confidence >= self.best_confidence:
+            self.best_confidence = confidence
+            self.bbox = bbox
+        self.last_frame = frame
+        if location is not None:
+            # Running mean of where the sign was seen from
+            self.located += 1
+            self.lat += (location[0] - self.lat) / self.located
+            self.lon += (location[1] - self.lon) / self.located
+
+    @property
+    def text(self) -> str:
+        return max(self.variants.items(), key=lambda item: item[1])[0]
+
+    def to_dict(self) -> dict[str, Any]:
+        entry = {
+            "text": self.text,
+            "confidence": round(self.best_confidence, 3),
+            "readings": self.readings,
+            "firstFrame": self.first_frame,
+            "lastFrame": self.last_frame,
+        }
+        if self.bbox is not None:
+            entry["bbox"] = self.bbox
+        if self.located:
+            entry["location"] = {"lat": round(self.lat, 6), "lon": round(self.lon, 6)}
+        return entry
+
+
+class TextIndex:
+    """
+    Per-session sign index built from OCR readings.
+
+    Readings are normalized (see normalize_text) and merged into an
+    existing sign when they match it exactly or with a similarity of at
+    least `similarity` (difflib ratio), and the sign was seen nearby: within
+    `radius_m` of the sign's mean location when frames are located, else
+    within `max_frame_gap` frames. A sign takes at most one reading per
+    frame, so two identical signs in one frame stay separate. Each sign
+    reports the spelling with the highest summed confidence.
+
+    Memory grows with the number of distinct signs, not readings.
+    """
+
+    def __init__(
+        self,
+        similarity: float = 0.8,
+        max_frame_gap: int = 10,
+        radius_m: float = 50.0,
+        min_length: int = 2,
+    ):
+        self.similarity = similarity
+        self.max_frame_gap = max_frame_gap
+        self.radius_m = radius_m
+        self.min_length = min_length
+        self.signs: list[_Sign] = []
+        self.readings = 0
+        # Signs still close enough (in frames) to take new readings
+        self._active: list[_Sign] = []
+        self._frame: int | None = None
+        self._taken: set[int] = set()
+
+    def add(
+        self,
+        frame: int,
+        texts: list[dict[str, Any] | str],
+        location: tuple[float, float] | None = None,
+    ) -> None:
+        """
+        Fold one frame's readings into the index.
+
+        `texts` are `TextRecognizer.extract_text` regions (text, confidence,
+        bbox) or bare strings (confidence 1); `location` is the frame's
+        (lat, lon) when known.
+        """
+        if frame != self._frame:
+            self._frame = frame
+            self._taken = set()
+            self._active = [s for s in self._active if self._near(s, frame, location)]
+
+        for item in texts:
+            if isinstance(item, str):
+                text, confidence, bbox = item, 1.0, None
+            else:
+                text, confidence, bbox = item["text"], float(item.get("confidence", 1.0)), item.get("bbox")
+            key = normalize_text(text)
+            if len(key.replace(" ", "")) < self.min_length:
+                continue
+            self.readings += 1
+
+            sign = self._match(key, frame, location)
+            if sign is None:
+                sign = _Sign(key, frame)
+                self.signs.append(sign)
+                self._active.append(sign)
+            sign.add(text.strip(), confidence, bbox, frame, location)
+            self._taken.add(id(sign))
+
+    def _near(self, sign: _Sign, frame: int, location: tuple[float, float] | None) -> bool:
+        if location is not None and sign.located:
+            return GeoUtils.haversine_distance(sign.lat, sign.lon, location[0], location[1]) <= self.radius_m
+        return frame - sign.last_frame <= self.max_frame_gap
+
+    def _match(self, key: str, frame: int, location: tuple[float, float] | None) -> _Sign | None:
+        best, best_ratio = None, self.similarity
+        for sign in self._active:
+            if id(sign) in self._taken:
+                continue
+            if sign.key == key:
+                return sign
+            matcher = SequenceMatcher(None, sign.key, key)
+            # quick_ratio is an upper bound on ratio and much cheaper
+            if matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = sign, ratio
+        return best
+
+    def __len__(self) -> int:
+        return len(self.signs)
+
+    def texts(self) -> list[str]:
+        """Best reading of every sign, in order of first sighting."""
+        return [sign.text for sign in self.signs]
+
+    def to_dicts(self) -> list[dict[str, Any]]:
+        """The compact sign index: one entry per sign."""
+        return [sign.to_dict() for sign in self.signs]
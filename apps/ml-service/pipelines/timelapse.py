@@ -0,0 +1,101 @@
+# apps/ml-service/pipelines/timelapse.py
+"""
+Session Timelapse Pipeline
+Streams a session's processed (blurred) frames from storage into FFmpeg and
+uploads the encoded timelapse, without staging frames on disk.
+"""
+
+import modal
+from typing import Any
+
+from models.instrumentation import Tracer
+from pipelines.callbacks import deliver_callback
+
+image = modal.Image.debian_slim(python_version="3.11").apt_install(
+    "ffmpeg",
+).pip_install(
+    "boto3",
+    "httpx",
+    "numpy",
+    "opencv-python-headless",
+)
+
+
+@modal.function(
+    cpu=4.0,
+    timeout=1800,
+    image=image,
+    secrets=[modal.Secret.from_name("citypulse-secrets")],
+)
+def build_timelapse(
+    session_id: str,
+    fps: int = 30,
+    segment_frames: int | None = 300,
+    workers: int = 3,
+    callback_url: str | None = None,
+) -> dict[str, Any]:
+    """
+    Build a timelapse of a session's processed frames.
+
+    Args:
+        session_id: The session ID from the API
+        fps: Output video FPS (one frame per processed image)
+        segment_frames: Frames per parallel encoder segment; None encodes
+            in a single FFmpeg process
+        workers: Segment encoders running at once
+        callback_url: Optional webhook to call when complete
+
+    Returns:
+        The timelapse key and frame count
+    """
+    import tempfile
+
+    from utils.storage import get_storage
+    from utils.video import TimelapseBuilder, prefetch
+
+    storage = get_storage()
+    key_prefix = f"sessions/{session_id}"
+    tracer = Tracer()
+
+    frame_keys = list(storage.list_objects(f"{key_prefix}/processed/", extensions=['.jpg', '.jpeg', '.png']))
+    if not frame_keys:
+        return {"sessionId": session_id, "error": "No processed frames found"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = f"{tmp}/timelapse.mp4"
+        # Downloads run ahead of the encoder; frames are decoded and piped as
+        # they arrive, straight from the mapped file on local storage
+        with TimelapseBuilder(output_path, fps=fps, segment_frames=segment_frames, workers=workers) as timelapse:
+            for frame_bytes in prefetch(storage.read_buffer, frame_keys):
+                with tracer.span("encode", bytes_in=len(frame_bytes)):
+                    timelapse.write(frame_bytes)
+
+        timelapse_key = f"{key_prefix}/results/timelapse.mp4"
+        with tracer.span("s3.upload"):
+            storage.upload_file(timelapse_key, output_path, 'video/mp4')
+
+    results = {
+        "sessionId": session_id,
+        "timelapseKey": timelapse_key,
+        "frames": timelapse.frames,
+        "fps": fps,
+        "timings": tracer.summary(),
+    }
+
+    if callback_url:
+        deliver_callback.spawn(callback_url, results)
+
+    return results
+
+
+@modal.function()
+@modal.web_endpoint(method="POST")
+def build_timelapse_endpoint(request: dict) -> dict:
+    """Web endpoint for building session timelapses."""
+    return build_timelapse.remote(
+        session_id=request["sessionId"],
+        fps=request.get("fps", 30),
+        segment_frames=request.get("segmentFrames", 300),
+        workers=request.get("workers", 3),
+        callback_url=request.get("callbackUrl"),
+    )
@@ -1,6 +1,18 @@
 # apps/ml-service/utils/__init__.py
+from .storage import LocalStorage, StorageBackend, get_storage
 from .s3 import S3Client
 from .geo import GeoUtils
-from .video import VideoProcessor
+from .geofence import GeofenceIndex
+from .video import AdaptiveSampler, TimelapseBuilder, VideoProcessor
 
-__all__ = ["S3Client", "GeoUtils", "VideoProcessor"]
+__all__ = [
+    "StorageBackend",
+    "LocalStorage",
+    "get_storage",
+    "S3Client",
+    "GeoUtils",
+    "GeofenceIndex",
+    "VideoProcessor",
+    "AdaptiveSampler",
+    "TimelapseBuilder",
+]
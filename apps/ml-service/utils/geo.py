@@ -88,6 +88,56 @@ class GeoUtils:
         
         return (math.degrees(dest_lat), math.degrees(dest_lon))
     
+    @staticmethod
+    def haversine_distance_array(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> Any:
+        """`haversine_distance` over NumPy arrays (broadcast), in meters."""
+        import numpy as np
+        
+        lat1_rad, lat2_rad = np.radians(lat1), np.radians(lat2)
+        delta_lat = lat2_rad - lat1_rad
+        delta_lon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+        
+        a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon / 2) ** 2
+        return GeoUtils.EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    @staticmethod
+    def bearing_array(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> Any:
+        """`bearing` over NumPy arrays (broadcast), in degrees."""
+        import numpy as np
+        
+        lat1_rad, lat2_rad = np.radians(lat1), np.radians(lat2)
+        delta_lon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+        
+        x = np.sin(delta_lon) * np.cos(lat2_rad)
+        y = np.cos(lat1_rad) * np.sin(lat2_rad) - np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(delta_lon)
+        return (np.degrees(np.arctan2(x, y)) + 360) % 360
+    
+    @staticmethod
+    def destination_point_array(lat: Any, lon: Any, distance: Any, bearing: Any) -> tuple[Any, Any]:
+        """
+        `destination_point` over NumPy arrays (broadcast).
+        
+        Returns:
+            Tuple of (lat, lon) arrays
+        """
+        import numpy as np
+        
+        lat_rad = np.radians(lat)
+        lon_rad = np.radians(lon)
+        bearing_rad = np.radians(bearing)
+        angular_distance = np.asarray(distance, dtype=np.float64) / GeoUtils.EARTH_RADIUS_M
+        
+        sin_lat, cos_lat = np.sin(lat_rad), np.cos(lat_rad)
+        sin_ad, cos_ad = np.sin(angular_distance), np.cos(angular_distance)
+        
+        dest_lat = np.arcsin(sin_lat * cos_ad + cos_lat * sin_ad * np.cos(bearing_rad))
+        dest_lon = lon_rad + np.arctan2(
+            np.sin(bearing_rad) * sin_ad * cos_lat,
+            cos_ad - sin_lat * np.sin(dest_lat),
+        )
+        
+        return np.degrees(dest_lat), np.degrees(dest_lon)
+    
     @staticmethod
     def bounding_box(
         lat: float, lon: float,
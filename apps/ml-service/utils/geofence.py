@@ -0,0 +1,271 @@
+# apps/ml-service/utils/geofence.py
+"""
+Geofence Index
+Point-in-polygon membership of GPS points against many zones (districts,
+bonus zones, exclusion zones), in batches.
+"""
+
+from typing import Any
+
+import numpy as np
+
+
+class GeofenceIndex:
+    """
+    Grid-bucketed polygon index.
+
+    The zones' extent is split into a grid. Each cell records the zones
+    that contain it entirely and, for zones whose boundary crosses it, the
+    boundary edges inside it plus whether the cell centre is in the zone.
+    A point in a boundary cell is in the zone if the segment from the cell
+    centre to the point crosses the zone's edges an even number of times
+    (odd, if the centre is outside), so a lookup only touches the few edges
+    of its own cell: O(1) on average however many zones and vertices there
+    are.
+
+    Polygons are rings of (lat, lon); holes and multi-part zones are
+    supported (the even-odd rule over all rings of a zone). Coordinates are
+    treated as planar, which is exact enough at city scale.
+
+    Usage:
+        index = GeofenceIndex()
+        index.add("old-town", [(52.51, 13.38), (52.52, 13.40), (52.50, 13.41)])
+        points, zones = index.lookup(lats, lons)
+    """
+
+    def __init__(self, cells_per_edge: float = 4.0, max_cells: int = 1 << 20):
+        """
+        Args:
+            cells_per_edge: Grid cells per polygon edge; finer grids leave
+                fewer edges to test per lookup but take longer to build
+            max_cells: Upper bound on grid cells
+        """
+        self.cells_per_edge = cells_per_edge
+        self.max_cells = max_cells
+        self.zone_ids: list[str] = []
+        self.properties: list[dict[str, Any]] = []
+        self._rings: list[tuple[int, np.ndarray]] = []
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self.zone_ids)
+
+    def add(
+        self,
+        zone_id: str,
+        polygon: list[tuple[float, float]],
+        holes: list[list[tuple[float, float]]] | None = None,
+        properties: dict[str, Any] | None = None,
+    ) -> None:
+        """
+        Add a zone, or another part of it if `zone_id` was already added.
+
+        Args:
+            zone_id: Zone name returned by lookups
+            polygon: Outer ring as (lat, lon) pairs (closing point optional)
+            holes: Inner rings cut out of the zone
+            properties: Zone attributes kept alongside (e.g. {"exclude": True})
+        """
+        if zone_id in self.zone_ids:
+            zone = self.zone_ids.index(zone_id)
+            if properties:
+                self.properties[zone].update(properties)
+        else:
+            zone = len(self.zone_ids)
+            self.zone_ids.append(zone_id)
+            self.properties.append(dict(properties or {}))
+
+        for ring in [polygon, *(holes or [])]:
+            points = np.asarray(ring, dtype=np.float64)
+            if len(points) >= 3:
+                self._rings.append((zone, points))
+        self._built = False
+
+    @classmethod
+    def from_geojson(cls, data: dict[str, Any], id_property: str = "id", **kwargs: Any) -> "GeofenceIndex":
+        """
+        Index the Polygon and MultiPolygon features of a GeoJSON
+        FeatureCollection ([lon, lat] coordinates). Zones are named by the
+        feature's `id_property` property, else its id, else its position.
+        """
+        index = cls(**kwargs)
+        for i, feature in enumerate(data.get("features", [])):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            zone_id = str(properties.get(id_property, feature.get("id", i)))
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            for rings in polygons:
+                swapped = [[(lat, lon) for lon, lat, *_ in ring] for ring in rings]
+                index.add(zone_id, swapped[0], swapped[1:], properties)
+        return index
+
+    def build(self) -> None:
+        """Bucket the zones' edges into the grid (done on first lookup)."""
+        starts = np.concatenate([ring for _, ring in self._rings]) if self._rings else np.empty((0, 2))
+        ends = np.concatenate([np.roll(ring, -1, axis=0) for _, ring in self._rings]) if self._rings else starts
+        zones = np.concatenate([np.full(len(ring), zone) for zone, ring in self._rings]).astype(np.int64) if self._rings else np.empty(0, dtype=np.int64)
+        # Drop closing points repeated as explicit vertices
+        keep = np.any(starts != ends, axis=1)
+        self._y1, self._x1 = starts[keep, 0], starts[keep, 1]
+        self._y2, self._x2 = ends[keep, 0], ends[keep, 1]
+        edge_zones = zones[keep]
+        n_edges = len(edge_zones)
+
+        if n_edges:
+            self._south, self._west = float(starts[:, 0].min()), float(starts[:, 1].min())
+            height = max(float(starts[:, 0].max()) - self._south, 1e-9)
+            width = max(float(starts[:, 1].max()) - self._west, 1e-9)
+        else:
+            self._south, self._west, height, width = 0.0, 0.0, 1e-9, 1e-9
+        cells = int(min(self.max_cells, max(1, n_edges * self.cells_per_edge)))
+        self._cell = max(np.sqrt(height * width / cells), height / 4096, width / 4096)
+        self._ny = int(height // self._cell) + 1
+        self._nx = int(width // self._cell) + 1
+
+        # Cells each edge passes through: those in its bounding box whose
+        # centre is within half a cell diagonal of the edge's line
+        cx1, cx2 = self._col(np.minimum(self._x1, self._x2)), self._col(np.maximum(self._x1, self._x2))
+        cy1, cy2 = self._row(np.minimum(self._y1, self._y2)), self._row(np.maximum(self._y1, self._y2))
+        spans_x, spans_y = cx2 - cx1 + 1, cy2 - cy1 + 1
+        edge = np.repeat(np.arange(n_edges), spans_x * spans_y)
+        offset = np.arange(len(edge)) - np.repeat(np.cumsum(spans_x * spans_y) - spans_x * spans_y, spans_x * spans_y)
+        col = cx1[edge] + offset % spans_x[edge]
+        row = cy1[edge] + offset // spans_x[edge]
+        dx, dy = self._x2 - self._x1, self._y2 - self._y1
+        centre_x, centre_y = self._west + (col + 0.5) * self._cell, self._south + (row + 0.5) * self._cell
+        line_distance = np.abs(dy[edge] * (centre_x - self._x1[edge]) - dx[edge] * (centre_y - self._y1[edge]))
+        near = line_distance <= np.hypot(dx[edge], dy[edge]) * self._cell * 0.7072
+        edge, cell = edge[near], (row * self._nx + col)[near]
+
+        # Boundary (cell, zone) groups, sorted so each group's edges are contiguous
+        n_zones = max(len(self.zone_ids), 1)
+        group_key = cell * n_zones + edge_zones[edge]
+        order = np.lexsort((edge, group_key))
+        self._edge = edge[order]
+        groups, group_start = np.unique(group_key[order], return_index=True)
+        self._group_cell, self._group_zone = groups // n_zones, groups % n_zones
+        self._group_edges = np.append(group_start, len(self._edge))
+        self._group_offsets = np.searchsorted(self._group_cell, np.arange(self._nx * self._ny + 1))
+
+        # Cells whose centre is inside a zone; those without boundary edges
+        # are entirely inside it
+        inside = self._centres_inside(edge_zones, n_zones)
+        self._group_centre_inside = np.isin(groups, inside, assume_unique=True)
+        interior = inside[~np.isin(inside, groups, assume_unique=True)]
+        self._interior_zone = interior % n_zones
+        self._interior_offsets = np.searchsorted(interior // n_zones, np.arange(self._nx * self._ny + 1))
+        self._built = True
+
+    def _col(self, lon: np.ndarray) -> np.ndarray:
+        return np.floor((lon - self._west) / self._cell).astype(np.int64)
+
+    def _row(self, lat: np.ndarray) -> np.ndarray:
+        return np.floor((lat - self._south) / self._cell).astype(np.int64)
+
+    def _centres_inside(self, edge_zones: np.ndarray, n_zones: int) -> np.ndarray:
+        """Sorted `cell * n_zones + zone` keys of cell centres inside zones."""
+        # Every (edge, grid row) pair where the edge crosses the row's centre line
+        low, high = np.minimum(self._y1, self._y2), np.maximum(self._y1, self._y2)
+        first = np.ceil((low - self._south) / self._cell - 0.5).astype(np.int64)
+        last = np.ceil((high - self._south) / self._cell - 0.5).astype(np.int64) - 1
+        counts = np.maximum(last - first + 1, 0)
+        edge = np.repeat(np.arange(len(low)), counts)
+        row = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+        row_y = self._south + (row + 0.5) * self._cell
+        t = (row_y - self._y1[edge]) / (self._y2[edge] - self._y1[edge])
+        crossing_x = self._x1[edge] + t * (self._x2[edge] - self._x1[edge])
+
+        # Each zone crosses a row an even number of times; sorted along the
+        # row, crossings pair up into the spans inside the zone (even-odd rule)
+        line = edge_zones[edge] * self._ny + row
+        order = np.lexsort((crossing_x, line))
+        line, crossing_x = line[order], crossing_x[order]
+        span_line = line[0::2]
+        span_first = np.ceil((crossing_x[0::2] - self._west) / self._cell - 0.5).astype(np.int64)
+        span_last = np.ceil((crossing_x[1::2] - self._west) / self._cell - 0.5).astype(np.int64) - 1
+        counts = np.maximum(span_last - span_first + 1, 0)
+        span = np.repeat(np.arange(len(span_line)), counts)
+        col = span_first[span] + np.arange(len(span)) - np.repeat(np.cumsum(counts) - counts, counts)
+        zone, row = span_line[span] // self._ny, span_line[span] % self._ny
+        return np.unique((row * self._nx + col) * n_zones + zone)
+
+    def lookup(self, lats: Any, lons: Any) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Zone memberships of a batch of points.
+
+        Returns:
+            (point index, zone index) pairs, ordered by point; zone indexes
+            refer to `zone_ids`
+        """
+        if not self._built:
+            self.build()
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        row, col = self._row(lats), self._col(lons)
+        on_grid = np.flatnonzero((row >= 0) & (row < self._ny) & (col >= 0) & (col < self._nx))
+        cell = row[on_grid] * self._nx + col[on_grid]
+
+        # Cells entirely inside a zone
+        counts = self._interior_offsets[cell + 1] - self._interior_offsets[cell]
+        interior_points = np.repeat(on_grid, counts)
+        slot = np.repeat(self._interior_offsets[cell] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        interior_zones = self._interior_zone[slot]
+
+        # Boundary cells: each (point, zone group) of the point's cell
+        counts = self._group_offsets[cell + 1] - self._group_offsets[cell]
+        pair_points = np.repeat(on_grid, counts)
+        group = np.repeat(self._group_offsets[cell] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        # ... and each of the group's edges
+        edge_counts = self._group_edges[group + 1] - self._group_edges[group]
+        pair = np.repeat(np.arange(len(group)), edge_counts)
+        slot = np.repeat(self._group_edges[group] - np.cumsum(edge_counts) + edge_counts, edge_counts) + np.arange(edge_counts.sum())
+        edge = self._edge[slot]
+
+        point = pair_points[pair]
+        cell_of_pair = self._group_cell[group][pair]
+        start_x = self._west + (cell_of_pair % self._nx + 0.5) * self._cell
+        start_y = self._south + (cell_of_pair // self._nx + 0.5) * self._cell
+        crossings = np.bincount(
+            pair,
+            weights=_crosses(start_x, start_y, lons[point], lats[point], self._x1[edge], self._y1[edge], self._x2[edge], self._y2[edge]),
+            minlength=len(group),
+        ).astype(np.int64)
+        boundary = (crossings % 2 == 1) != self._group_centre_inside[group]
+
+        points = np.concatenate([interior_points, pair_points[boundary]])
+        zones = np.concatenate([interior_zones, self._group_zone[group[boundary]]])
+        order = np.lexsort((zones, points))
+        return points[order], zones[order]
+
+    def assign(self, lats: Any, lons: Any) -> list[list[str]]:
+        """Zone ids containing each point."""
+        points, zones = self.lookup(lats, lons)
+        assigned: list[list[str]] = [[] for _ in range(np.size(lats))]
+        for point, zone in zip(points.tolist(), zones.tolist()):
+            assigned[point].append(self.zone_ids[zone])
+        return assigned
+
+    def zones_at(self, lat: float, lon: float) -> list[str]:
+        """Zone ids containing one point."""
+        return self.assign([lat], [lon])[0]
+
+
+def _crosses(
+    ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray,
+    cx: np.ndarray, cy: np.ndarray, dx: np.ndarray, dy: np.ndarray,
+) -> np.ndarray:
+    """
+    Whether segment AB crosses segment CD. Endpoints of CD exactly on line
+    AB count on one side only, so a crossing at a shared vertex of two
+    edges is counted once.
+    """
+    side_c = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    side_d = (bx - ax) * (dy - ay) - (by - ay) * (dx - ax)
+    side_a = (dx - cx) * (ay - cy) - (dy - cy) * (ax - cx)
+    side_b = (dx - cx) * (by - cy) - (dy - cy) * (bx - cx)
+    return ((side_c > 0) != (side_d > 0)) & (np.sign(side_a) != np.sign(side_b))
@@ -0,0 +1,118 @@
+# apps/ml-service/utils/http.py
+"""
+Async HTTP Utilities
+Shared pooled client, concurrent image fetches and callbacks with retry.
+"""
+
+import asyncio
+import random
+from typing import Any
+
+import httpx
+
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    AsyncClient with pooled keep-alive connections for the running event
+    loop. Connections belong to the loop that opened them, so a new loop
+    (each asyncio.run) gets a new client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    """Close the running loop's client; call before a short-lived loop ends."""
+    global _client
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+        _client = None
+
+
+async def fetch_bytes(url: str, timeout: float = 30) -> bytes:
+    """Download a URL and return the body."""
+    response = await get_client().get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+async def fetch_many(
+    urls: list[str],
+    concurrency: int = 8,
+    timeout: float = 30,
+) -> list[bytes | Exception]:
+    """
+    Download many URLs concurrently.
+
+    Returns:
+        One entry per URL, in order: the body, or the exception that fetch raised
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url: str) -> bytes:
+        async with semaphore:
+            return await fetch_bytes(url, timeout)
+
+    return await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+
+
+async def post_with_retry(
+    url: str,
+    payload: Any,
+    max_attempts: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    timeout: float = 30,
+) -> bool:
+    """
+    POST JSON, retrying transport errors and retryable statuses with
+    exponential backoff and jitter.
+
+    Returns:
+        True if the receiver accepted the payload
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            response = await get_client().post(url, json=payload, timeout=timeout)
+            if response.status_code < 400:
+                return True
+            if response.status_code not in RETRYABLE_STATUS:
+                print(f"Callback to {url} rejected with {response.status_code}")
+                return False
+            error = f"status {response.status_code}"
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+
+        if attempt == max_attempts:
+            print(f"Callback to {url} failed after {attempt} attempts: {error}")
+            return False
+
+        delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    return False
+
+
+def post_in_background(url: str, payload: Any, **retry_options: Any) -> asyncio.Task:
+    """Schedule post_with_retry on the running loop without awaiting it."""
+    task = asyncio.create_task(post_with_retry(url, payload, **retry_options))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -4,15 +4,22 @@ S3/R2 Storage Utilities
 """
 
 import os
-from typing import Any, Generator
+from typing import BinaryIO, Generator
 import boto3
 from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
 
+from .storage import StorageBackend
 
-class S3Client:
+# Objects above this size are uploaded as multipart, in parts of this size
+MULTIPART_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class S3Client(StorageBackend):
     """S3/R2 client wrapper for CityPulse ML service."""
     
-    def __init__(self):
+    def __init__(self, max_concurrency: int = 8, max_pending: int = 32):
+        super().__init__(max_concurrency, max_pending)
         self.endpoint = os.environ.get('S3_ENDPOINT')
         self.bucket = os.environ.get('S3_BUCKET', 'citypulse-uploads')
         
@@ -23,9 +30,16 @@ class S3Client:
             aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
             config=Config(
                 signature_version='s3v4',
-                retries={'max_attempts': 3, 'mode': 'adaptive'}
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+                # Background uploads plus multipart parts share the pool
+                max_pool_connections=max_concurrency * 2,
             ),
         )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_BYTES,
+            multipart_chunksize=MULTIPART_CHUNK_BYTES,
+            max_concurrency=max_concurrency,
+        )
     
     def download_bytes(self, key: str) -> bytes:
         """Download object as bytes."""
@@ -47,6 +61,31 @@ class S3Client:
         )
         return f"s3://{self.bucket}/{key}"
     
+    def upload_fileobj(
+        self,
+        key: str,
+        fileobj: BinaryIO,
+        content_type: str = 'application/octet-stream',
+    ) -> str:
+        """
+        Stream a file-like object to S3, as a concurrent multipart upload
+        once it exceeds MULTIPART_CHUNK_BYTES. Memory use is bounded by
+        the part size times the concurrency, not the object size.
+        """
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            key,
+            ExtraArgs={'ContentType': content_type},
+            Config=self.transfer_config,
+        )
+        return f"s3://{self.bucket}/{key}"
+    
+    def download_file(self, key: str, path: str) -> str:
+        """Download an object to a local file with ranged, concurrent GETs."""
+        self.client.download_file(self.bucket, key, path, Config=self.transfer_config)
+        return path
+    
     def list_objects(
         self,
         prefix: str,
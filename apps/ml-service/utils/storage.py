@@ -0,0 +1,229 @@
+# apps/ml-service/utils/storage.py
+"""
+Storage Backends
+Object storage interface with S3/R2 (see s3.S3Client) and local filesystem
+implementations, selected from configuration.
+"""
+
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Generator
+
+
+class StorageBackend:
+    """
+    Key/value object storage used by the pipelines.
+
+    Backends implement the transfer methods; background submission and
+    processed-object storage are shared.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_pending: int = 32):
+        self.max_concurrency = max_concurrency
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: list[Future] = []
+        self._lock = threading.Lock()
+        # Bounds memory held by queued uploads; submit() blocks when full
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def download_bytes(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def read_buffer(self, key: str) -> bytes | memoryview:
+        """
+        Object contents as a buffer for `np.frombuffer` / `cv2.imdecode`.
+        Backends that can map objects return a zero-copy view.
+        """
+        return self.download_bytes(key)
+
+    def upload_bytes(self, key: str, data: bytes, content_type: str = 'application/octet-stream') -> str:
+        raise NotImplementedError
+
+    def upload_fileobj(self, key: str, fileobj: BinaryIO, content_type: str = 'application/octet-stream') -> str:
+        raise NotImplementedError
+
+    def upload_file(self, key: str, path: str, content_type: str = 'application/octet-stream') -> str:
+        """Upload a local file (videos, timelapses) without reading it into memory."""
+        with open(path, 'rb') as f:
+            return self.upload_fileobj(key, f, content_type)
+
+    def download_file(self, key: str, path: str) -> str:
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str, extensions: list[str] | None = None) -> Generator[str, None, None]:
+        raise NotImplementedError
+
+    def generate_presigned_url(self, key: str, expires_in: int = 3600, method: str = 'get_object') -> str:
+        raise NotImplementedError
+
+    def copy_object(self, source_key: str, dest_key: str) -> None:
+        raise NotImplementedError
+
+    def delete_object(self, key: str) -> None:
+        raise NotImplementedError
+
+    def object_exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def store_processed(
+        self,
+        source_key: str,
+        dest_key: str,
+        data: bytes | None,
+        content_type: str = 'application/octet-stream',
+    ) -> str:
+        """
+        Write a processed version of `source_key` to `dest_key`. Pass
+        `data=None` when processing left the object unchanged: it is then
+        copied within the store and no bytes leave the container.
+        """
+        if data is None:
+            self.copy_object(source_key, dest_key)
+            return dest_key
+        return self.upload_bytes(dest_key, data, content_type)
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Run a transfer (e.g. `self.upload_bytes`) on a background thread so
+        processing continues while it is in flight. Call `wait()` before
+        relying on the result.
+        """
+        self._slots.acquire()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix='storage-upload',
+                )
+            future = self._executor.submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda _: self._slots.release())
+            self._pending.append(future)
+        return future
+
+    def wait(self) -> list[BaseException]:
+        """Wait for all submitted transfers; returns the errors of any that failed."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        errors = []
+        for future in pending:
+            error = future.exception()
+            if error is not None:
+                errors.append(error)
+        return errors
+
+
+class LocalStorage(StorageBackend):
+    """
+    Objects as files under a root directory (e.g. NVMe-staged session data).
+
+    Reads are memory-mapped; writes go to a temporary file in the target
+    directory and are renamed into place, so readers never see a partial
+    object.
+    """
+
+    def __init__(self, root: str, max_concurrency: int = 8, max_pending: int = 32):
+        super().__init__(max_concurrency, max_pending)
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key.lstrip('/')).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise ValueError(f"Key escapes storage root: {key}")
+        return path
+
+    def download_bytes(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def read_buffer(self, key: str) -> bytes | memoryview:
+        """Zero-copy view of the file; the mapping lives as long as the view."""
+        with open(self._path(key), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _atomic_write(self, key: str, write: Callable[[BinaryIO], Any]) -> str:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return str(path)
+
+    def upload_bytes(self, key: str, data: bytes, content_type: str = 'application/octet-stream') -> str:
+        return self._atomic_write(key, lambda f: f.write(data))
+
+    def upload_fileobj(self, key: str, fileobj: BinaryIO, content_type: str = 'application/octet-stream') -> str:
+        return self._atomic_write(key, lambda f: shutil.copyfileobj(fileobj, f, 1024 * 1024))
+
+    def download_file(self, key: str, path: str) -> str:
+        shutil.copyfile(self._path(key), path)
+        return path
+
+    def list_objects(self, prefix: str, extensions: list[str] | None = None) -> Generator[str, None, None]:
+        # The prefix may end mid-name, so walk from its directory part
+        base = self._path(prefix) if prefix.endswith('/') else self._path(prefix).parent
+        if not base.is_dir():
+            return
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.startswith('.'):
+                    continue  # in-flight atomic writes
+                key = Path(dirpath, name).relative_to(self.root).as_posix()
+                if key.startswith(prefix.lstrip('/')) and (
+                    extensions is None or any(key.endswith(ext) for ext in extensions)
+                ):
+                    yield key
+
+    def generate_presigned_url(self, key: str, expires_in: int = 3600, method: str = 'get_object') -> str:
+        return self._path(key).as_uri()
+
+    def copy_object(self, source_key: str, dest_key: str) -> None:
+        """Hard-link when possible (no data copied), else copy; either way atomic."""
+        source = self._path(source_key)
+        dest = self._path(dest_key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.link")
+        try:
+            os.link(source, tmp)
+            os.replace(tmp, dest)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            with open(source, 'rb') as f:
+                self._atomic_write(dest_key, lambda out: shutil.copyfileobj(f, out, 1024 * 1024))
+
+    def delete_object(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def object_exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+
+def get_storage(backend: str | None = None, **kwargs: Any) -> StorageBackend:
+    """
+    Storage backend from configuration.
+
+    STORAGE_BACKEND selects "s3" (default) or "local"; the local backend
+    serves STORAGE_ROOT (default /data/citypulse).
+    """
+    backend = backend or os.environ.get('STORAGE_BACKEND') or 's3'
+    if backend == 'local':
+        root = kwargs.pop('root', None) or os.environ.get('STORAGE_ROOT') or '/data/citypulse'
+        return LocalStorage(root, **kwargs)
+    if backend == 's3':
+        from .s3 import S3Client
+        return S3Client(**kwargs)
+    raise ValueError(f"Unknown storage backend: {backend}")
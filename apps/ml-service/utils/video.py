@@ -3,11 +3,353 @@
 Video Processing Utilities
 """
 
+import bisect
+import shutil
 import tempfile
 import subprocess
-from typing import Any, Generator
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Generator, Iterable
 from pathlib import Path
 
+from .geo import GeoUtils
+
+
+class AdaptiveSampler:
+    """
+    Choose video frames by distance travelled and visual change instead of
+    a fixed rate.
+
+    A frame is kept when the vehicle has moved `spacing_m` since the last
+    kept frame (from the GPS track), when the scene differs enough from it
+    (`diff_threshold`, mean absolute difference of small grayscale
+    thumbnails, 0-1), or when `max_gap_s` has passed so long stops are
+    still covered. Without a GPS track only change and gap apply.
+    """
+
+    def __init__(
+        self,
+        spacing_m: float = 10.0,
+        gps_track: list[dict[str, Any]] | None = None,
+        diff_threshold: float | None = 0.12,
+        max_gap_s: float = 10.0,
+        thumb_size: tuple[int, int] = (64, 36),
+    ):
+        """
+        Args:
+            spacing_m: Target distance between kept frames
+            gps_track: Fixes with lat, lon, timestamp_ms (relative to the video start)
+            diff_threshold: Visual change that keeps a frame; None disables it
+            max_gap_s: Keep at least one frame this often
+            thumb_size: Thumbnail used for the change score
+        """
+        self.spacing_m = spacing_m
+        self.diff_threshold = diff_threshold
+        self.max_gap_ms = max_gap_s * 1000
+        self.thumb_size = thumb_size
+
+        # Cumulative distance along the track, for interpolation by time
+        fixes = sorted(gps_track or [], key=lambda f: f["timestamp_ms"])
+        self._times = [f["timestamp_ms"] for f in fixes]
+        self._distances = [0.0] * len(fixes)
+        for i in range(1, len(fixes)):
+            step = GeoUtils.haversine_distance(
+                fixes[i - 1]["lat"], fixes[i - 1]["lon"], fixes[i]["lat"], fixes[i]["lon"],
+            )
+            self._distances[i] = self._distances[i - 1] + step
+
+        self.candidates = 0
+        self.reasons = {"first": 0, "distance": 0, "change": 0, "gap": 0}
+        self._last_kept_ms: float | None = None
+        self._last_kept_distance = 0.0
+        self._last_thumb: Any = None
+        self._first_ms = 0.0
+        self._last_ms = 0.0
+
+    @property
+    def has_gps(self) -> bool:
+        return len(self._times) > 1
+
+    def distance_at(self, timestamp_ms: float) -> float:
+        """Metres travelled by `timestamp_ms`, linearly interpolated between fixes."""
+        i = bisect.bisect_right(self._times, timestamp_ms)
+        if i == 0:
+            return 0.0
+        if i == len(self._times):
+            return self._distances[-1]
+        t0, t1 = self._times[i - 1], self._times[i]
+        d0, d1 = self._distances[i - 1], self._distances[i]
+        return d0 + (d1 - d0) * (timestamp_ms - t0) / (t1 - t0)
+
+    def _thumbnail(self, frame: Any) -> Any:
+        import cv2
+        import numpy as np
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+
+    def offer(self, timestamp_ms: float, frame: Any = None) -> str | None:
+        """
+        Consider a candidate frame (decoded BGR array; may be None when
+        sampling by GPS only).
+
+        Returns:
+            Why the frame was kept ("first", "distance", "change", "gap"), or None to skip it
+        """
+        import numpy as np
+
+        self.candidates += 1
+        if self._last_kept_ms is None:
+            self._first_ms = timestamp_ms
+        self._last_ms = timestamp_ms
+
+        use_change = self.diff_threshold is not None and frame is not None
+        distance = self.distance_at(timestamp_ms) if self.has_gps else 0.0
+        thumb = None
+        reason = None
+
+        if self._last_kept_ms is None:
+            reason = "first"
+        elif self.has_gps and distance - self._last_kept_distance >= self.spacing_m:
+            reason = "distance"
+        elif use_change and self._last_thumb is not None:
+            thumb = self._thumbnail(frame)
+            if float(np.mean(np.abs(thumb - self._last_thumb))) >= self.diff_threshold:
+                reason = "change"
+        if reason is None and timestamp_ms - self._last_kept_ms >= self.max_gap_ms:
+            reason = "gap"
+        if reason is None:
+            return None
+
+        self.reasons[reason] += 1
+        self._last_kept_ms = timestamp_ms
+        self._last_kept_distance = distance
+        if use_change:
+            self._last_thumb = thumb if thumb is not None else self._thumbnail(frame)
+        return reason
+
+    def stats(self) -> dict[str, Any]:
+        """Kept vs candidate frames and the effective sampling rate."""
+        kept = sum(self.reasons.values())
+        duration_s = (self._last_ms - self._first_ms) / 1000
+
+        stats = {
+            "candidates": self.candidates,
+            "kept": kept,
+            "keptBy": dict(self.reasons),
+            "durationS": round(duration_s, 2),
+            "effectiveFps": round(kept / duration_s, 3) if duration_s > 0 else None,
+        }
+        if self.has_gps:
+            travelled = self.distance_at(self._last_ms) - self.distance_at(self._first_ms)
+            stats["distanceM"] = round(travelled, 1)
+            stats["avgSpacingM"] = round(travelled / kept, 2) if kept else None
+        return stats
+
+
+class TimelapseBuilder:
+    """
+    Encode a timelapse from in-memory frames, piping raw frames to FFmpeg's
+    stdin as they are produced; nothing is written to disk but the output.
+
+    With `segment_frames` set, every run of that many frames is encoded by
+    its own FFmpeg process: a segment keeps encoding while the next one is
+    fed, up to `workers` at once, and the segments are stream-copied into
+    the output at the end.
+
+    Usage:
+        with TimelapseBuilder("out.mp4", fps=30) as timelapse:
+            for frame in frames:
+                timelapse.write(frame)
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        fps: int = 30,
+        size: tuple[int, int] | None = None,
+        crf: int = 23,
+        preset: str = 'fast',
+        segment_frames: int | None = None,
+        workers: int = 2,
+    ):
+        """
+        Args:
+            output_path: Output video path (.mp4)
+            fps: Output video FPS (one input frame per output frame)
+            size: (width, height); defaults to the first frame's size, and
+                frames of another size are resized to it
+            crf: x264 quality (lower is better)
+            preset: x264 speed preset
+            segment_frames: Frames per parallel segment; None encodes in one process
+            workers: Segment encoders running at once
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.size = size
+        self.crf = crf
+        self.preset = preset
+        self.segment_frames = segment_frames
+        self.workers = max(1, workers)
+        self.frames = 0
+        self._process: subprocess.Popen | None = None
+        self._segment_count = 0
+        self._segment_dir: str | None = None
+        self._segments: list[str] = []
+        self._encoding: deque[subprocess.Popen] = deque()
+
+    def __enter__(self) -> "TimelapseBuilder":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _command(self, output_path: str) -> list[str]:
+        width, height = self.size
+        return [
+            'ffmpeg',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-c:v', 'libx264',
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            '-loglevel', 'error',
+            '-y',
+            output_path,
+        ]
+
+    def _start(self) -> subprocess.Popen:
+        if self.segment_frames is None:
+            output_path = self.output_path
+        else:
+            if self._segment_dir is None:
+                self._segment_dir = tempfile.mkdtemp(prefix='timelapse-')
+            # Bound the encoders running at once; the oldest finishes first
+            while len(self._encoding) >= self.workers:
+                self._finish(self._encoding.popleft())
+            output_path = f"{self._segment_dir}/segment_{len(self._segments):05d}.mp4"
+            self._segments.append(output_path)
+        return subprocess.Popen(
+            self._command(output_path),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+
+    @staticmethod
+    def _finish(process: subprocess.Popen) -> None:
+        if process.stdin and not process.stdin.closed:
+            process.stdin.close()
+        stderr = process.stderr.read() if process.stderr else b""
+        if process.wait() != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr.decode(errors='replace').strip()}")
+
+    def write(self, frame: Any) -> None:
+        """Append a frame: a BGR array or encoded image bytes."""
+        import cv2
+        import numpy as np
+
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                return
+        if self.size is None:
+            # x264 with yuv420p needs even dimensions
+            height, width = frame.shape[:2]
+            self.size = (width - width % 2, height - height % 2)
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+        if self._process is None:
+            self._process = self._start()
+        self._process.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+        self._segment_count += 1
+
+        if self.segment_frames is not None and self._segment_count >= self.segment_frames:
+            # Let this segment finish encoding while the next one is fed
+            self._process.stdin.close()
+            self._encoding.append(self._process)
+            self._process = None
+            self._segment_count = 0
+
+    def close(self) -> str:
+        """Finish encoding (and join segments); returns the output path."""
+        if self.frames == 0:
+            self.abort()
+            raise ValueError("No frames provided")
+        try:
+            if self._process is not None:
+                self._encoding.append(self._process)
+                self._process = None
+            while self._encoding:
+                self._finish(self._encoding.popleft())
+
+            if self.segment_frames is not None:
+                self._concat()
+            return self.output_path
+        finally:
+            self._cleanup()
+
+    def _concat(self) -> None:
+        list_file = f"{self._segment_dir}/segments.txt"
+        with open(list_file, 'w') as f:
+            for path in self._segments:
+                f.write(f"file '{path}'\n")
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', list_file,
+            '-c', 'copy',
+            '-loglevel', 'error',
+            '-y',
+            self.output_path,
+        ]
+        subprocess.run(cmd, capture_output=True, check=True)
+
+    def abort(self) -> None:
+        """Stop all encoders and discard partial output."""
+        processes = list(self._encoding) + ([self._process] if self._process else [])
+        for process in processes:
+            process.kill()
+            process.wait()
+        self._encoding.clear()
+        self._process = None
+        self._cleanup()
+
+    def _cleanup(self) -> None:
+        if self._segment_dir is not None:
+            shutil.rmtree(self._segment_dir, ignore_errors=True)
+            self._segment_dir = None
+
+
+def prefetch(
+    fetch: Any,
+    keys: Iterable[str],
+    depth: int = 8,
+) -> Generator[Any, None, None]:
+    """
+    `fetch(key)` for each key, in order, with up to `depth` fetches in
+    flight ahead of the consumer (e.g. streaming processed frames from
+    storage into a TimelapseBuilder).
+    """
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix='prefetch') as executor:
+        pending: deque[Future] = deque()
+        for key in keys:
+            pending.append(executor.submit(fetch, key))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 
 class VideoProcessor:
     """Video processing utilities for dashcam footage."""
@@ -162,6 +504,26 @@ class VideoProcessor:
         finally:
             Path(list_file).unlink(missing_ok=True)
     
+    @staticmethod
+    def create_timelapse_streaming(
+        frames: Iterable[Any],
+        output_path: str,
+        fps: int = 30,
+        segment_frames: int | None = None,
+        workers: int = 2,
+    ) -> str:
+        """
+        Create timelapse video from in-memory frames (BGR arrays or encoded
+        bytes) without writing them to disk; see TimelapseBuilder.
+        
+        Returns:
+            Path to output video
+        """
+        with TimelapseBuilder(output_path, fps=fps, segment_frames=segment_frames, workers=workers) as timelapse:
+            for frame in frames:
+                timelapse.write(frame)
+        return output_path
+    
     @staticmethod
     def stream_frames(
         video_path: str,
@@ -195,3 +557,44 @@ class VideoProcessor:
             frame_count += 1
         
         cap.release()
+    
+    @staticmethod
+    def stream_frames_adaptive(
+        video_path: str,
+        sampler: AdaptiveSampler,
+        candidate_fps: float = 10.0,
+        time_offset_ms: int = 0,
+    ) -> Generator[tuple[bytes, int], None, None]:
+        """
+        Stream frames chosen by an AdaptiveSampler.
+        
+        Candidates are considered at `candidate_fps`; frames in between are
+        only grabbed (never converted), and only kept frames are encoded.
+        `time_offset_ms` is added to timestamps, so one sampler and GPS
+        track can span consecutive clips.
+        
+        Yields:
+            Tuple of (frame_bytes, timestamp_ms)
+        """
+        import cv2
+        
+        cap = cv2.VideoCapture(video_path)
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = max(1, int(video_fps / candidate_fps)) if video_fps > 0 else 1
+        
+        frame_count = 0
+        
+        while cap.grab():
+            if frame_count % frame_interval == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                
+                timestamp_ms = time_offset_ms + (int((frame_count / video_fps) * 1000) if video_fps > 0 else 0)
+                if sampler.offer(timestamp_ms, frame) is not None:
+                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                    yield buffer.tobytes(), timestamp_ms
+            
+            frame_count += 1
+        
+        cap.release()